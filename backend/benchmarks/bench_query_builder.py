@@ -0,0 +1,92 @@
+# Query builder hot paths: loading the metadata graph, shortest paths and join planning over it,
+# BaseQuery construction and SQL generation, on synthetic FK graphs of 10 to 5,000 tables.
+from conftest import FakeCursor, SyntheticSchema
+
+from classes.http import QueryParams
+from classes.metadata import Metadata
+from classes.queries.base import BaseQuery
+from utils.generators import compile_query, generate_query, query_cache
+
+
+# Tables spread across the graph, so the joins between them cross a good part of it
+def spread_tables(schema: SyntheticSchema, count: int) -> list:
+    tables = schema.tables
+    return list(dict.fromkeys(tables[i * (len(tables) - 1) // max(count - 1, 1)] for i in range(count)))
+
+
+def make_query_params(tables: list) -> list:
+    return [
+        QueryParams(
+            table=table,
+            attributes=[{"attribute": "id"}, {"attribute": "name"}, {"attribute": "score"}],
+            constraints=[{"attribute": "id", "operator": ">", "value": "50"}, {"attribute": "name", "operator": "!=", "value": "x"}],
+            group_by=[],
+            aggregations=[],
+        )
+        for table in tables
+    ]
+
+
+OPTIONS = {"order_by": [{"table_name": "t0", "attribute": "id", "sort": "ASC"}], "limit": "100"}
+
+
+def test_metadata_load(benchmark, schema):
+    # Columns and foreign keys, the join paths are only worked out once a query needs them
+    rounds = 1 if len(schema.tables) >= 5000 else 3
+    loaded = benchmark.pedantic(Metadata, args=(FakeCursor(schema),), rounds=rounds, iterations=1)
+    assert len(loaded.col_types) == len(schema.tables)
+
+
+def test_shortest_path(benchmark, schema, loaded_metadata):
+    # From the root to the table furthest away from it
+    _, distances = loaded_metadata.paths.tree(schema.tables[0])
+    destination = max(distances, key=lambda table: distances[table])
+    clause = benchmark(loaded_metadata.shortest_path, schema.tables[0], destination)
+    assert clause.count("JOIN") == distances[destination]
+
+
+def test_plan_joins(benchmark, schema, loaded_metadata):
+    tables = spread_tables(schema, 5)
+    edges = benchmark(loaded_metadata.plan_joins, tables)
+    assert {edge.destination for edge in edges} >= set(tables[1:])
+
+
+# The first query joining from these tables, which runs a BFS from each table the join tree grows from
+def test_plan_joins_cold(benchmark, schema, loaded_metadata):
+    tables = spread_tables(schema, 5)
+    edges = benchmark.pedantic(loaded_metadata.plan_joins, args=(tables,), setup=loaded_metadata.build_paths, rounds=5, iterations=1)
+    assert {edge.destination for edge in edges} >= set(tables[1:])
+
+
+def test_base_query_init(benchmark, schema, loaded_metadata):
+    query_params = make_query_params(spread_tables(schema, 3))
+    queries = benchmark(lambda: [BaseQuery(details) for details in query_params])
+    assert len(queries) == len(query_params)
+
+
+def test_generate_query(benchmark, schema, loaded_metadata):
+    query_params = make_query_params(spread_tables(schema, 3))
+    queries = [BaseQuery(details) for details in query_params]
+    sql, params = benchmark(generate_query, queries, OPTIONS)
+    assert sql.startswith("SELECT") and len(params) == 2 * len(queries)
+
+
+# The full uncached path a new query shape takes through /query
+def test_compile_query_uncached(benchmark, schema, loaded_metadata):
+    query_params = make_query_params(spread_tables(schema, 3))
+
+    def compile_uncached():
+        query_cache.clear()
+        return compile_query(query_params, OPTIONS)
+
+    compiled, params = benchmark(compile_uncached)
+    assert compiled.sql.startswith("SELECT")
+
+
+# What every repeated query shape costs instead
+def test_compile_query_cached(benchmark, schema, loaded_metadata):
+    query_params = make_query_params(spread_tables(schema, 3))
+    query_cache.clear()
+    compile_query(query_params, OPTIONS)
+    benchmark(compile_query, query_params, OPTIONS)
+    assert query_cache.stats()["hits"] > 0
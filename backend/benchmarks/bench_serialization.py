@@ -0,0 +1,86 @@
+# Result serialization hot paths on synthetic result sets of 1k to 1M rows read through a fake cursor:
+# query_output_to_table (/users/get_table_data), the /query JSON response and the /query/stream NDJSON body.
+# The /query response and its column cleanup are also measured the way they used to be done, as a baseline.
+import json
+
+import pytest
+
+from conftest import RESULT_COLUMNS
+
+from classes.http import StatusResponse, Table
+from routers.query import QueryResponse
+from utils.serialization import RowsJSONResponse, clean_column_names, query_output_to_table, rows_to_ndjson
+
+COLUMN_NAMES = [name for name, _ in RESULT_COLUMNS]
+
+
+def fetch(cursor):
+    cursor.execute("SELECT * FROM t0")
+    return cursor.fetchall(), [i[0] for i in cursor.description]
+
+
+def test_query_output_to_table(benchmark, result_cursor):
+    def build_table():
+        rows, column_names = fetch(result_cursor)
+        return query_output_to_table(rows, column_names, "SELECT * FROM t0", 1)
+
+    table = benchmark(build_table)
+    assert len(table.rows) == len(result_cursor.rows)
+
+
+# The old column cleanup, scanning every name character by character on every request
+def scan_clean_column_names(column_names, num_tables):
+    if num_tables != 1:
+        return column_names
+    cleaned_column_names = []
+    for col_name in column_names:
+        for i in range(len(col_name)):
+            if col_name[i] == "_":
+                cleaned_column_names.append(col_name[i + 1:])
+                break
+        else:
+            cleaned_column_names.append(col_name)
+    return cleaned_column_names
+
+
+@pytest.mark.parametrize("implementation", [scan_clean_column_names, clean_column_names], ids=["scan", "current"])
+def test_clean_column_names(benchmark, implementation):
+    benchmark.group = "clean_column_names"
+    columns = COLUMN_NAMES * 4
+    assert benchmark(implementation, columns, 1) == clean_column_names(columns, 1)
+
+
+# "direct" mirrors the end of run_query: the model without the rows, then the rows handed straight to the encoder.
+# "model" is how it used to be done: a list copy of every row validated into the model, then serialized through
+# it and json.dumps like FastAPI does with a returned model.
+def encode_direct(rows, columns):
+    content = QueryResponse(
+        status=StatusResponse(status="success", message="Query executed successfully"),
+        table=Table(query="SELECT * FROM t0", created_at=None, columns=columns),
+    ).model_dump()
+    content["table"]["rows"] = rows
+    return RowsJSONResponse(content=content).body
+
+
+def encode_model(rows, columns):
+    table = Table(query="SELECT * FROM t0", created_at=None, columns=columns, rows=[[value for value in row] for row in rows])
+    response = QueryResponse(status=StatusResponse(status="success", message="Query executed successfully"), table=table)
+    return json.dumps(response.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@pytest.mark.parametrize("encoder", [encode_model, encode_direct], ids=["model", "direct"])
+def test_query_response_encoding(benchmark, result_cursor, encoder):
+    benchmark.group = f"query_response_encoding-{len(result_cursor.rows)}_rows"
+    columns = clean_column_names(COLUMN_NAMES, 2)
+
+    def encode():
+        rows, _ = fetch(result_cursor)
+        return encoder(rows, columns)
+
+    body = benchmark(encode)
+    assert json.loads(body)["table"]["columns"] == columns
+
+
+def test_rows_to_ndjson(benchmark, result_cursor):
+    body = benchmark(lambda: rows_to_ndjson(fetch(result_cursor)[0]))
+    assert body.count(b"\n") == len(result_cursor.rows)
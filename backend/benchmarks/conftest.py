@@ -0,0 +1,110 @@
+# Fixtures for the pytest-benchmark suite: synthetic schemas (10 to 5,000 tables) and result sets (1k to 1M rows)
+# served by a fake cursor, so the suite runs offline without MySQL.
+#
+# Usage (from backend/):
+#   pip install -r benchmarks/requirements.txt
+#   pytest benchmarks --benchmark-autosave                       # record a baseline
+#   pytest benchmarks --benchmark-compare --benchmark-compare-fail=median:10%   # fail on a >10% regression
+#   pytest benchmarks -k "not 5000 and not 1000000"              # skip the largest (slowest) sizes
+import datetime
+import os
+import random
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from classes.metadata import Metadata, metadata
+from utils.generators import query_cache
+
+GRAPH_SIZES = [10, 100, 1000, 5000]
+ROW_COUNTS = [1_000, 10_000, 100_000, 1_000_000]
+
+# Every synthetic table has the same columns, parent_id and link_id are the foreign keys
+TABLE_COLUMNS = [("id", "int"), ("name", "varchar"), ("score", "double"), ("amount", "decimal"), ("created_at", "date"), ("parent_id", "int"), ("link_id", "int")]
+
+# (column name, FieldType code) of the synthetic result sets
+RESULT_COLUMNS = [("t0_id", 3), ("t0_name", 253), ("t0_score", 5), ("t0_amount", 246), ("t0_created_at", 10), ("t1_name", 253)]
+
+
+# A random FK forest made connected: every table references a random earlier table through parent_id, and
+# every fifth table also references a random other table through link_id, which adds cycles to the graph
+class SyntheticSchema:
+    def __init__(self, num_tables: int, seed: int = 0) -> None:
+        rng = random.Random(seed)
+        self.tables = [f"t{i}" for i in range(num_tables)]
+        self.foreign_keys = []
+        for i in range(1, num_tables):
+            self.foreign_keys.append((self.tables[i], "parent_id", self.tables[rng.randrange(i)], "id"))
+            if i % 5 == 0:
+                other = (i + rng.randrange(1, num_tables)) % num_tables
+                self.foreign_keys.append((self.tables[i], "link_id", self.tables[other], "id"))
+
+
+def make_rows(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        (
+            i,
+            f"Row number {i}",
+            rng.random(),
+            Decimal(f"{rng.uniform(0, 1000):.2f}"),
+            datetime.date(2000, 1, 1) + datetime.timedelta(days=i % 9000),
+            f"Parent {i % 97}",
+        )
+        for i in range(count)
+    ]
+
+
+# Answers the INFORMATION_SCHEMA queries Metadata makes from a SyntheticSchema and anything else with rows
+class FakeCursor:
+    def __init__(self, schema: SyntheticSchema | None = None, rows: list | None = None) -> None:
+        self.schema = schema
+        self.rows = rows or []
+        self.description = None
+        self._result: list = []
+
+    def execute(self, operation: str, params: tuple = ()) -> None:
+        self.description = None
+        if "BIT_XOR" in operation:
+            tables, foreign_keys = self.schema.tables, self.schema.foreign_keys
+            self._result = [(f"{len(tables) * len(TABLE_COLUMNS)}:0", f"{len(tables) + len(foreign_keys)}:0")]
+        elif "INFORMATION_SCHEMA.COLUMNS" in operation:
+            self._result = [(table, column, data_type) for table in self.schema.tables for column, data_type in TABLE_COLUMNS]
+        elif "KEY_COLUMN_USAGE" in operation:
+            self._result = list(self.schema.foreign_keys) + [(table, "id", None, None) for table in self.schema.tables]
+        else:
+            self.description = [(name, type_code, None, None, None, None, 1, 0, 0) for name, type_code in RESULT_COLUMNS]
+            self._result = self.rows
+
+    def fetchall(self) -> list:
+        return self._result
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture(scope="module", params=GRAPH_SIZES, ids=lambda size: f"{size}_tables")
+def schema(request) -> SyntheticSchema:
+    return SyntheticSchema(request.param)
+
+
+# Loads the schema into the module-level metadata the query builder reads from
+@pytest.fixture(scope="module")
+def loaded_metadata(schema: SyntheticSchema) -> Metadata:
+    loaded = Metadata(FakeCursor(schema))
+    loaded.cursor = None
+    metadata.replace(loaded)
+    metadata.loaded.set()
+    query_cache.clear()
+    return metadata
+
+
+@pytest.fixture(scope="module", params=ROW_COUNTS, ids=lambda count: f"{count}_rows")
+def result_cursor(request) -> FakeCursor:
+    return FakeCursor(rows=make_rows(request.param))
@@ -0,0 +1,280 @@
+# Replays a mix of /auth/login, /query, /users/save_table and /users/get_table_data traffic against the backend
+# at a target request rate and reports latency percentiles and throughput per endpoint.
+#
+# Requests are sent open-loop: each is scheduled at a fixed time whether or not earlier ones have finished, and
+# latency is measured from that scheduled time, so a server falling behind shows up in the percentiles instead
+# of silently lowering the request rate.
+#
+# Usage (from the repository root, after seeding with backend/loadtest/seed.py):
+#   pip install -r backend/loadtest/requirements.txt
+#   python backend/loadtest/loadtest.py --start-server --rps 50 --duration 60
+#   python backend/loadtest/loadtest.py --url http://localhost:8080 --rps 200 --mix query=8,get_table_data=2 --json results.json
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+BACKEND_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+DEFAULT_MIX = "query=6,get_table_data=2,save_table=1,login=1"
+PASSWORD = "loadtest-password"
+LETTERS = "abcdefghijklmnoprstw"
+
+
+# Query shapes against the seeded dataset, each with randomized constraint values so both repeated
+# shapes (compiled query cache) and distinct values (result cache misses) are exercised
+def popular_tracks(rng: random.Random) -> dict:
+    return {
+        "query_params": [
+            {"table": "track", "attributes": [{"attribute": "track_name"}, {"attribute": "popularity"}, {"attribute": "energy"}],
+             "constraints": [{"attribute": "popularity", "operator": ">", "value": str(rng.randint(40, 95))}], "group_by": [], "aggregations": []},
+        ],
+        "options": {"order_by": [{"table_name": "track", "attribute": "popularity", "sort": "DESC"}], "limit": "100"},
+    }
+
+def tracks_by_artist(rng: random.Random) -> dict:
+    return {
+        "query_params": [
+            {"table": "track", "attributes": [{"attribute": "track_name"}, {"attribute": "popularity"}], "constraints": [], "group_by": [], "aggregations": []},
+            {"table": "artist", "attributes": [{"attribute": "artist_name"}],
+             "constraints": [{"attribute": "artist_name", "operator": "SUBSTRING", "value": "".join(rng.sample(LETTERS, 2))}], "group_by": [], "aggregations": []},
+        ],
+        "options": {},
+    }
+
+def albums_by_artist(rng: random.Random) -> dict:
+    return {
+        "query_params": [
+            {"table": "album", "attributes": [{"attribute": "album_name"}, {"attribute": "album_release_date"}], "constraints": [], "group_by": [], "aggregations": []},
+            {"table": "artist", "attributes": [{"attribute": "artist_name"}],
+             "constraints": [{"attribute": "artist_name", "operator": "PREFIX", "value": rng.choice(LETTERS).upper()}], "group_by": [], "aggregations": []},
+        ],
+        "options": {"limit": "500"},
+    }
+
+def album_popularity(rng: random.Random) -> dict:
+    return {
+        "query_params": [
+            {"table": "track", "attributes": [{"attribute": "album_id"}, {"attribute": "popularity"}],
+             "constraints": [{"attribute": "popularity", "operator": ">", "value": str(rng.randint(0, 60))}],
+             "group_by": ["album_id"], "aggregations": [{"attribute": "popularity", "type": "AVG"}]},
+        ],
+        "options": {},
+    }
+
+QUERY_SHAPES = [popular_tracks, tracks_by_artist, albums_by_artist, album_popularity]
+SAVED_TABLE_QUERY = "SELECT track.track_name AS track_name, track.popularity AS popularity FROM track WHERE track.popularity > 70"
+
+
+# Each virtual user logs in from its own client address (sent as X-Forwarded-For, which the backend trusts from
+# 127.0.0.1), otherwise every login would come from the load generator and share one rate limit bucket
+class VirtualUser:
+    def __init__(self, username: str, address: str) -> None:
+        self.username = username
+        self.address = address
+        self.token = ""
+        self.tables: list = []
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    @property
+    def login_headers(self) -> dict:
+        return {"X-Forwarded-For": self.address}
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: dict = {}
+        self.errors: dict = {}
+        self.statuses: dict = {}
+
+    def record(self, kind: str, latency: float, status: int | None) -> None:
+        self.latencies.setdefault(kind, []).append(latency)
+        key = str(status) if status is not None else "failed"
+        self.statuses.setdefault(kind, {}).setdefault(key, 0)
+        self.statuses[kind][key] += 1
+        if status is None or status >= 400:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for kind, latencies in sorted(self.latencies.items()):
+            endpoints[kind] = summarize(latencies, elapsed) | {"errors": self.errors.get(kind, 0), "statuses": self.statuses[kind]}
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {"elapsed": round(elapsed, 2), "total": summarize(everything, elapsed) | {"errors": sum(self.errors.values())}, "endpoints": endpoints}
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "throughput": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+    }
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("login", "query", "save_table", "get_table_data"):
+            raise argparse.ArgumentTypeError(f"Unknown request kind in mix: {kind}")
+        weights[kind] = float(weight or 1)
+    return weights
+
+
+async def send(client: httpx.AsyncClient, kind: str, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    if kind == "login":
+        return await client.post("/auth/login", json={"username": user.username, "password": PASSWORD}, headers=user.login_headers)
+    if kind == "query":
+        return await client.post("/query", json=rng.choice(QUERY_SHAPES)(rng))
+    if kind == "save_table":
+        table_name = f"lt_{uuid.uuid4().hex[:12]}"
+        response = await client.post("/users/save_table", json={"table_name": table_name, "query": SAVED_TABLE_QUERY}, headers=user.headers)
+        if response.status_code < 400:
+            user.tables.append(table_name)
+        return response
+    return await client.get("/users/get_table_data", params={"table_name": rng.choice(user.tables)}, headers=user.headers)
+
+
+# Registers and logs in the virtual users and gives each a saved table to read, none of which is measured
+async def set_up_users(client: httpx.AsyncClient, count: int, run_id: str) -> list:
+    users = [VirtualUser(f"lt_{run_id}_{i}", str(ipaddress.ip_address("10.0.0.1") + i)) for i in range(count)]
+
+    async def set_up(user: VirtualUser) -> None:
+        response = await client.post("/auth/register", json={"username": user.username, "password": PASSWORD, "email": f"{user.username}@loadtest.invalid"})
+        response.raise_for_status()
+        response = await client.post("/auth/login", json={"username": user.username, "password": PASSWORD}, headers=user.login_headers)
+        response.raise_for_status()
+        user.token = response.json()["token"]
+        response = await send(client, "save_table", user, random.Random())
+        response.raise_for_status()
+
+    await asyncio.gather(*(set_up(user) for user in users))
+    return users
+
+async def clean_up(client: httpx.AsyncClient, users: list) -> None:
+    await asyncio.gather(*(
+        client.post("/users/delete_table", json={"table_names": user.tables}, headers=user.headers)
+        for user in users if user.tables
+    ))
+
+
+async def replay(client: httpx.AsyncClient, users: list, weights: dict, rps: float, duration: float, max_in_flight: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    kinds, kind_weights = list(weights), list(weights.values())
+    recorder = Recorder()
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks = []
+
+    async def run(kind: str, user: VirtualUser, scheduled: float) -> None:
+        async with in_flight:
+            status = None
+            try:
+                status = (await send(client, kind, user, rng)).status_code
+            except httpx.HTTPError:
+                pass
+            recorder.record(kind, time.perf_counter() - scheduled, status)
+
+    start = time.perf_counter()
+    for i in range(int(rps * duration)):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run(rng.choices(kinds, kind_weights)[0], rng.choice(users), scheduled)))
+    await asyncio.gather(*tasks)
+    return recorder.summary(time.perf_counter() - start)
+
+
+def print_report(summary: dict, target_rps: float) -> None:
+    print(f"\n{'endpoint':<16}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    rows = list(summary["endpoints"].items()) + [("total", summary["total"])]
+    for kind, stats in rows:
+        print(f"{kind:<16}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput']:>9}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['max_ms']:>9}")
+    print(f"\nTarget {target_rps} req/s, achieved {summary['total']['throughput']} req/s over {summary['elapsed']}s")
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    env = {"JWT_SECRET": "loadtest", **os.environ}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--no-access-log", "--forwarded-allow-ips", "127.0.0.1"],
+        cwd=BACKEND_SRC, env=env,
+    )
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError("The backend did not become ready in time")
+        await asyncio.sleep(0.5)
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client, args.ready_timeout)
+        users = await set_up_users(client, args.users, uuid.uuid4().hex[:8])
+        try:
+            if args.warmup:
+                await replay(client, users, args.mix, args.rps, args.warmup, args.max_in_flight, args.seed + 1)
+            return await replay(client, users, args.mix, args.rps, args.duration, args.max_in_flight, args.seed)
+        finally:
+            await clean_up(client, users)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the SQLMate backend")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--rps", type=float, default=20, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to send traffic for")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of unmeasured traffic first (0 to skip)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Relative weight of each request kind (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=10, help="Virtual users to register and spread requests over")
+    parser.add_argument("--max-in-flight", type=int, default=100, help="Requests allowed in flight at once")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds before a request counts as failed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--start-server", action="store_true", help="Start the backend (DB_* from the environment) on the --url port")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for --start-server")
+    parser.add_argument("--ready-timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    server = start_server(httpx.URL(args.url).port or 80, args.workers) if args.start_server else None
+    try:
+        summary = asyncio.run(main_async(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_report(summary, args.rps)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"target_rps": args.rps, "mix": args.mix, **summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# Seeds a MySQL database for load testing from data/processed/*.csv and sets up the sqlmate database
+# (users, saved tables, procedures) the same way `sqlmate init` does. Column types are inferred from the CSVs,
+# keys are declared in SCHEMA so the backend finds the same join graph as on the real dataset.
+#
+# Usage (from the repository root):
+#   python backend/loadtest/seed.py --start-container          # throwaway MySQL 8 container on port 3306
+#   python backend/loadtest/seed.py --host 127.0.0.1 --user root --password ... --database spotify
+import argparse
+import csv
+import os
+import re
+import subprocess
+import sys
+import time
+
+import mysql.connector
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.insert(0, REPO_ROOT)
+
+from cli.setup.db_setup import create_tables, create_triggers_and_procedures  # noqa: E402
+from cli.setup.sql.database import CREATE_SQLMATE_DATABASE  # noqa: E402
+
+DATA_DIR = os.path.join(REPO_ROOT, "data", "processed")
+CONTAINER_NAME = "sqlmate-loadtest-mysql"
+CONTAINER_IMAGE = "mysql:8.4"
+BATCH_SIZE = 1000
+
+# table -> (CSV file, primary key, foreign keys as (column, referenced table, referenced column))
+SCHEMA = {
+    "artist": ("artist.csv", ["artist_id"], []),
+    "album": ("album.csv", ["album_id"], []),
+    "track": ("track.csv", ["track_id"], [("album_id", "album", "album_id")]),
+    "track_artists": ("track_artists.csv", ["track_id", "artist_id"], [("track_id", "track", "track_id"), ("artist_id", "artist", "artist_id")]),
+    "album_artists": ("album_artists_corrected.csv", ["album_id", "artist_id"], [("album_id", "album", "album_id"), ("artist_id", "artist", "artist_id")]),
+    "streams": ("streams.csv", ["track_id"], [("track_id", "track", "track_id")]),
+}
+
+
+# "Track Duration (ms)" -> "track_duration_ms", "Artist ID(s)" -> "artist_ids"
+def column_name(header: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", header.lower().replace("(s)", "s")).strip("_")
+
+
+def parse_int(value: str):
+    value = value.replace(",", "")
+    return int(value) if re.fullmatch(r"-?\d+", value) else None
+
+
+def parse_float(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+# Picks the narrowest type every non-empty value of the column fits and returns it with a converter for the values
+def infer_column(values: list):
+    present = [value for value in values if value != ""]
+    if present and all(value in ("True", "False") for value in present):
+        return "TINYINT(1)", lambda value: None if value == "" else int(value == "True")
+    if present and all(parse_int(value) is not None for value in present):
+        widest = max(abs(parse_int(value)) for value in present)
+        return ("INT" if widest < 2**31 else "BIGINT"), lambda value: parse_int(value) if value != "" else None
+    if present and all(parse_float(value) is not None for value in present):
+        return "DOUBLE", lambda value: parse_float(value) if value != "" else None
+    longest = max((len(value) for value in present), default=1)
+    return (f"VARCHAR({longest})" if longest <= 1000 else "TEXT"), lambda value: value
+
+
+def read_csv(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [row for row in reader if len(row) == len(header)]
+    return [column_name(name) for name in header], rows
+
+
+def seed_table(cursor, table: str, csv_file: str, primary_key: list, foreign_keys: list) -> int:
+    columns, rows = read_csv(os.path.join(DATA_DIR, csv_file))
+    inferred = [infer_column([row[i] for row in rows]) for i in range(len(columns))]
+
+    definitions = [f"`{column}` {sql_type}" for column, (sql_type, _) in zip(columns, inferred)]
+    definitions.append(f"PRIMARY KEY ({', '.join(f'`{column}`' for column in primary_key)})")
+    for column, referenced_table, referenced_column in foreign_keys:
+        definitions.append(f"FOREIGN KEY (`{column}`) REFERENCES `{referenced_table}`(`{referenced_column}`)")
+    cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
+    cursor.execute(f"CREATE TABLE `{table}` (\n  " + ",\n  ".join(definitions) + "\n)")
+
+    placeholders = ", ".join(["%s"] * len(columns))
+    insert = f"INSERT IGNORE INTO `{table}` ({', '.join(f'`{column}`' for column in columns)}) VALUES ({placeholders})"
+    converters = [converter for _, converter in inferred]
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        cursor.executemany(insert, [tuple(convert(value) for convert, value in zip(converters, row)) for row in batch])
+    return len(rows)
+
+
+def start_container(password: str, database: str, port: int) -> None:
+    subprocess.run(["docker", "rm", "-f", CONTAINER_NAME], capture_output=True)
+    subprocess.run(
+        [
+            "docker", "run", "-d", "--rm", "--name", CONTAINER_NAME, "-p", f"{port}:3306",
+            "-e", f"MYSQL_ROOT_PASSWORD={password}", "-e", f"MYSQL_DATABASE={database}",
+            CONTAINER_IMAGE,
+        ],
+        check=True,
+    )
+
+
+def connect_with_wait(host: str, port: int, user: str, password: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return mysql.connector.connect(host=host, port=port, user=user, password=password)
+        except mysql.connector.Error as e:
+            if time.monotonic() > deadline:
+                raise e
+            time.sleep(2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Seed a MySQL database for load testing SQLMate")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--database", default="spotify")
+    parser.add_argument("--start-container", action="store_true", help=f"Start a {CONTAINER_IMAGE} container named {CONTAINER_NAME} first")
+    parser.add_argument("--wait", type=float, default=120, help="Seconds to wait for the server to accept connections")
+    args = parser.parse_args()
+
+    if args.start_container:
+        start_container(args.password, args.database, args.port)
+
+    connection = connect_with_wait(args.host, args.port, args.user, args.password, args.wait)
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.database}`")
+    cursor.execute(f"USE `{args.database}`")
+    # The processed CSVs are not guaranteed to be referentially complete, load them as they are
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in reversed(list(SCHEMA)):
+        cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
+    for table, (csv_file, primary_key, foreign_keys) in SCHEMA.items():
+        start = time.perf_counter()
+        count = seed_table(cursor, table, csv_file, primary_key, foreign_keys)
+        connection.commit()
+        print(f"Loaded {count} rows into {table} in {time.perf_counter() - start:.1f}s")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+    cursor.execute(CREATE_SQLMATE_DATABASE)
+    cursor.close()
+    if not create_tables(connection) or not create_triggers_and_procedures(connection, args.database):
+        sys.exit(1)
+    connection.close()
+
+    print(f"\nSeeded '{args.database}'. Start the backend against it with:")
+    print(f"  DB_HOST={args.host} DB_USER={args.user} DB_PASSWORD={args.password} DB_NAME={args.database} JWT_SECRET=loadtest")
+
+
+if __name__ == "__main__":
+    main()
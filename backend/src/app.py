@@ -1,12 +1,57 @@
 from utils.constants import PORT
+from utils.db import warm_pools, close_pools, get_pool_stats
+from utils.generators import query_cache
+from utils.result_cache import result_cache
+from utils.auth import token_cache
+from utils.revocations import revocation_log
+from utils.passwords import password_hasher
+from utils.users import user_cache
+from utils.rate_limit import login_ip_limiter, login_username_limiter
+from utils.jobs import job_manager
+from utils import guardrails
+from utils.middleware import CancelOnDisconnectMiddleware
+from utils.metrics import MetricsMiddleware, render_metrics
+from utils.log import configure_logging
+from classes.metadata import metadata
 
 import uvicorn
 from routers import auth, user_data, query
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+import logging
 
-app = FastAPI()
+configure_logging()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load metadata in the background so the server starts accepting connections right away,
+    # /ready reports when it is done
+    metadata.start_loading()
+    metadata.start_sync()
+    revocation_log.start_sync()
+    try:
+        await warm_pools()
+    except Exception as e:
+        logger.warning("Failed to warm connection pools: %s", e)
+    await job_manager.start()
+    password_hasher.start()
+    yield
+    password_hasher.stop()
+    metadata.stop_sync()
+    revocation_log.stop_sync()
+    await job_manager.stop()
+    await close_pools()
+
+# Routes that build queries need metadata, reject them instead of blocking while it loads
+def require_metadata() -> None:
+    if not metadata.loaded.is_set():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Metadata is still loading")
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "https://sqlmate-ruddy.vercel.app"],
@@ -14,14 +59,70 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
 )
+app.add_middleware(CancelOnDisconnectMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 def home():
     return "Welcome to SQLMate API!"
 
+# Liveness: the process is up
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+# Readiness: metadata is loaded and requests can be served
+@app.get("/ready")
+def ready(response: Response):
+    if not metadata.loaded.is_set():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "loading", "metadata_loaded": False, "error": metadata.load_error or None}
+    return {"status": "ready", "metadata_loaded": True, "metadata_version": metadata.version, "schema_version": metadata.schema_version, "tables": len(metadata.col_types)}
+
+# Per-phase and per-route latency histograms in the Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/pool")
+def pool_stats():
+    return get_pool_stats()
+
+@app.get("/stats/query_cache")
+def query_cache_stats():
+    return query_cache.stats()
+
+@app.get("/stats/result_cache")
+def result_cache_stats():
+    return result_cache.stats()
+
+@app.get("/stats/token_cache")
+def token_cache_stats():
+    return {**token_cache.stats(), "revocations": revocation_log.stats()}
+
+@app.get("/stats/passwords")
+def password_stats():
+    return password_hasher.stats()
+
+@app.get("/stats/users")
+def user_stats():
+    return {
+        "user_cache": user_cache.stats(),
+        "login_ip_limiter": login_ip_limiter.stats(),
+        "login_username_limiter": login_username_limiter.stats(),
+    }
+
+@app.get("/stats/guardrails")
+def guardrail_stats():
+    return guardrails.stats
+
+@app.get("/stats/jobs")
+def job_stats():
+    return job_manager.stats()
+
 app.include_router(router=auth.router, prefix="/auth")
-app.include_router(router=user_data.router, prefix="/users")
-app.include_router(router=query.router, prefix="/query")
+app.include_router(router=user_data.router, prefix="/users", dependencies=[Depends(require_metadata)])
+app.include_router(router=query.router, prefix="/query", dependencies=[Depends(require_metadata)])
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=True, )
\ No newline at end of file
+    uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=True, )
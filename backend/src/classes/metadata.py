@@ -1,15 +1,31 @@
-from collections import defaultdict, deque
-from utils.constants import DB_NAME
+from collections import OrderedDict, defaultdict, deque
+from utils.constants import DB_NAME, METADATA_SNAPSHOT_PATH, METADATA_SYNC_INTERVAL, SCHEMA_CHANGE_LOG_SIZE, JOIN_PATH_CACHE_SIZE
 from utils.db import get_cursor
-from typing import List, Any
+from utils.result_cache import result_cache
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import mysql.connector
 from mysql.connector.abstracts import MySQLCursorAbstract
 
+logger = logging.getLogger(__name__)
+
+# change_type of a schema_changes entry for a table whose rows changed but not its columns or keys
+DATA_CHANGE = "update"
+
 
 class Edge:
 	def __init__(self, source: str,  destination: str, source_column: str, destination_column: str) -> None:
+		self.source = source
 		self.destination = destination
 		self.source_column = f"{source}.{source_column}"
 		self.destination_column = f"{destination}.{destination_column}"
+		# Built once here so join generation only has to concatenate finished clauses
+		self.join_clause = f"JOIN {destination} ON {self.source_column}={self.destination_column}"
 	
 	def __str__(self) -> str:
 		return f"{self.source_column}={self.destination_column}"
@@ -41,15 +57,76 @@ class TableTypes:
 		return self.types[column] if column in self.types else ""
 
 
+# Shortest paths over the FK graph, one BFS tree per source table worked out the first time a query joins from
+# it. Only the most recently used trees are kept: all-pairs tables grow with the square of the number of tables
+# (about 1.5GB at 5,000) and would have to be rebuilt on every foreign key change.
+class ShortestPaths:
+	def __init__(self, graph: Dict[str, List[Edge]], max_size: int = JOIN_PATH_CACHE_SIZE) -> None:
+		self.graph = graph
+		self.max_size = max_size
+		self._trees: OrderedDict[str, Tuple[Dict[str, Edge], Dict[str, int]]] = OrderedDict()
+		self._lock = threading.Lock()
+
+	# Returns (parents, distances) for source: parents[table] is the edge used to reach table on the shortest
+	# path from source, distances[table] is the number of joins on that path
+	def tree(self, source: str) -> Tuple[Dict[str, Edge], Dict[str, int]]:
+		with self._lock:
+			tree = self._trees.get(source)
+			if tree is not None:
+				self._trees.move_to_end(source)
+				return tree
+
+		tree = self.bfs(source)
+		with self._lock:
+			self._trees[source] = tree
+			while len(self._trees) > self.max_size:
+				self._trees.popitem(last=False)
+		return tree
+
+	def bfs(self, source: str) -> Tuple[Dict[str, Edge], Dict[str, int]]:
+		parents: Dict[str, Edge] = {}
+		distances: Dict[str, int] = {source: 0}
+		queue = deque([source])
+
+		while queue:
+			node = queue.popleft()
+			for edge in self.graph.get(node, []):
+				if edge.destination not in distances:
+					distances[edge.destination] = distances[node] + 1
+					parents[edge.destination] = edge
+					queue.append(edge.destination)
+
+		return parents, distances
+
+
 # This class is used to manage the metadata of the database in the form of a graph.
 # It fetches the foreign key relationships between tables to construct the graph.
 class Metadata:
-	def __init__(self, cursor: MySQLCursorAbstract) -> None:
+	SNAPSHOT_FORMAT_VERSION = 2
+
+	def __init__(self, cursor: Optional[MySQLCursorAbstract] = None) -> None:
 		self.col_types: defaultdict[str, TableTypes] = defaultdict(TableTypes)
-		self.cursor: MySQLCursorAbstract = cursor
+		self.cursor: Optional[MySQLCursorAbstract] = cursor
 		self.graph: dict[str, List[Edge]] = defaultdict(list)
-		self.get_col_types()
-		self.generate_graph()
+		self.foreign_keys: List[Tuple[str, str, str, str]] = []  # (table, column, referenced table, referenced column)
+		self.primary_keys: Dict[str, List[str]] = {}  # Primary key columns of each table, in key order
+		self.fingerprint: str = ""  # Schema fingerprint at the time this metadata was loaded
+		self.version: int = 0  # Bumped when the join graph changes (or on a reload) so caches built on top of it can be invalidated
+		self.table_versions: Dict[str, int] = {}  # Bumped for a table whenever its columns and keys are refreshed
+		self.schema_version: int = 0  # Last entry of sqlmate.schema_changes this metadata includes (see sync)
+		self.paths: ShortestPaths = ShortestPaths(self.graph)  # Join paths over graph, replaced along with it
+		self.timings: Dict[str, float] = {}  # Seconds spent in each phase of the last load
+
+		# Metadata is loaded lazily (see initialize), these track whether that has happened yet
+		self.loaded = threading.Event()
+		self.load_error: str = ""
+		self._load_lock = threading.Lock()
+		self._change_lock = threading.Lock()
+		self._stop_sync = threading.Event()
+
+		if cursor is not None:
+			self.load()
+			self.loaded.set()
 
 	def __str__(self) -> str:
 		return "\n".join(
@@ -59,19 +136,247 @@ class Metadata:
 			]
 		)
 	
+	# Loads everything with two bulk INFORMATION_SCHEMA queries (columns, then primary and foreign keys),
+	# timing each phase
+	def load(self) -> None:
+		start = time.perf_counter()
+		# Read before anything else, so changes made while loading are replayed by the next sync
+		self.schema_version = self.get_schema_version()
+		self.fingerprint = self.get_fingerprint()
+		self.get_col_types()
+		columns_done = time.perf_counter()
+		self.generate_graph()
+		self.build_paths()
+		graph_done = time.perf_counter()
+
+		self.timings = {
+			"columns": columns_done - start,
+			"foreign_keys": graph_done - columns_done,
+			"total": graph_done - start,
+		}
+		logger.info(
+			"Metadata loaded in %.1fms (columns: %.1fms, foreign keys: %.1fms) for %d tables and %d foreign keys",
+			self.timings["total"] * 1000, self.timings["columns"] * 1000, self.timings["foreign_keys"] * 1000,
+			len(self.col_types), sum(len(edges) for edges in self.graph.values()) // 2,
+			extra={"timings": self.timings}
+		)
+
+	# Loads the metadata into this instance, from the snapshot if there is a usable one (checking it against
+	# the database, in the background unless told otherwise) and otherwise from the database. Safe to call more than once.
+	def initialize(self, background_revalidate: bool = True) -> None:
+		with self._load_lock:
+			if self.loaded.is_set():
+				return
+
+			snapshot = read_snapshot()
+			if snapshot is not None:
+				try:
+					self.replace(Metadata.from_snapshot(snapshot))
+					self.loaded.set()
+				except (KeyError, TypeError, ValueError) as e:
+					logger.warning("Ignoring unreadable metadata snapshot: %s", e)
+				else:
+					if background_revalidate:
+						threading.Thread(target=self.revalidate, name="metadata-revalidate", daemon=True).start()
+					else:
+						self.revalidate()
+					return
+
+			with get_cursor() as cur:
+				fresh = Metadata(cur)
+			fresh.cursor = None
+			self.replace(fresh)
+			self.loaded.set()
+		self.save_snapshot()
+
+	# Loads the metadata on a background thread, retrying until the database is reachable
+	def start_loading(self, retry_delay: float = 2.0) -> threading.Thread:
+		def run() -> None:
+			while not self.loaded.is_set():
+				try:
+					self.initialize()
+					self.load_error = ""
+				except Exception as e:
+					self.load_error = str(e)
+					logger.warning("Failed to load metadata, retrying in %ss: %s", retry_delay, e)
+					time.sleep(retry_delay)
+
+		thread = threading.Thread(target=run, name="metadata-loader", daemon=True)
+		thread.start()
+		return thread
+
+	# Blocks until the metadata is loaded, loading it on the calling thread if nobody has started yet
+	def ensure_loaded(self) -> None:
+		if not self.loaded.is_set():
+			self.initialize()
+
+	# Incremental table changes. The change is logged in sqlmate.schema_changes and then applied through sync,
+	# which is also how every other worker picks it up, so all of them end up with the same metadata and none
+	# serves cached results of a changed table.
 	def add_table(self, table_name: str) -> None:
-		with get_cursor() as cur:
+		self.record_changes([table_name], "add")
+
+	def drop_tables(self, table_names: List[str]) -> None:
+		self.record_changes(table_names, "drop")
+
+	# Only the rows changed, the metadata stays as it is and just the cached results are dropped
+	def update_table(self, table_name: str) -> None:
+		self.record_changes([table_name], DATA_CHANGE)
+
+	def record_changes(self, table_names: List[str], change_type: str) -> None:
+		if not table_names:
+			return
+		try:
+			with get_cursor("sqlmate") as cur:
+				cur.executemany(
+					"INSERT INTO schema_changes (table_name, change_type) VALUES (%s, %s)",
+					[(table_name, change_type) for table_name in table_names]
+				)
+				# Only the most recent changes are kept, a worker further behind than that reloads on restart anyway
+				cur.execute("DELETE FROM schema_changes WHERE version <= LAST_INSERT_ID() - %s", (SCHEMA_CHANGE_LOG_SIZE,))
+		except mysql.connector.Error as e:
+			logger.warning("Failed to record schema change, other workers will not see it until they reload: %s", e)
+			if self.loaded.is_set() and change_type != DATA_CHANGE:
+				with get_cursor() as cur:
+					self.cursor = cur
+					try:
+						with self._change_lock:
+							self.refresh_tables(table_names)
+					finally:
+						self.cursor = None
+			result_cache.invalidate(table_names)
+			return
+
+		# Until the metadata is loaded there is nothing to apply the change to, loading reads the latest schema
+		if not self.loaded.is_set():
+			result_cache.invalidate(table_names)
+			return
+		self.sync()
+		if change_type != DATA_CHANGE:
+			# Keep the snapshot current so workers starting later don't find it stale and reload everything
+			threading.Thread(target=self.save_snapshot, name="metadata-snapshot", daemon=True).start()
+
+	# Applies every change other workers (and this one) logged since the last sync
+	def sync(self) -> int:
+		with self._change_lock, get_cursor("sqlmate") as cur:
 			cur.execute(
-				"""
-				SELECT COLUMN_NAME, DATA_TYPE
-				FROM INFORMATION_SCHEMA.COLUMNS
-				WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s;
-				""", (DB_NAME, table_name)
+				"SELECT version, table_name, change_type FROM schema_changes WHERE version > %s ORDER BY version",
+				(self.schema_version,)
 			)
 			rows: List[Any] = cur.fetchall()
-			for column, data_type in rows:
-				self.col_types[table_name].add(column, data_type)
-	
+			if not rows:
+				return 0
+			table_names = list(dict.fromkeys(table_name for _, table_name, _ in rows))
+			altered = list(dict.fromkeys(table_name for _, table_name, change_type in rows if change_type != DATA_CHANGE))
+			if altered:
+				self.cursor = cur
+				try:
+					self.refresh_tables(altered)
+					self.fingerprint = self.get_fingerprint()
+				finally:
+					self.cursor = None
+			self.schema_version = rows[-1][0]
+		result_cache.invalidate(table_names)
+		logger.info("Applied %d schema changes (%s), now at schema version %d", len(rows), ", ".join(table_names), self.schema_version)
+		return len(rows)
+
+	# Polls for schema changes made by other workers until stop_sync is called
+	def start_sync(self, interval: float = METADATA_SYNC_INTERVAL) -> Optional[threading.Thread]:
+		if interval <= 0:
+			return None
+
+		def run() -> None:
+			last_error = ""
+			while not self._stop_sync.wait(interval):
+				if not self.loaded.is_set():
+					continue
+				try:
+					self.sync()
+					last_error = ""
+				except Exception as e:
+					# Logged once rather than every interval (e.g. sqlmate.schema_changes missing until `sqlmate init` is re-run)
+					if str(e) != last_error:
+						logger.warning("Failed to sync metadata: %s", e)
+					last_error = str(e)
+
+		self._stop_sync.clear()
+		thread = threading.Thread(target=run, name="metadata-sync", daemon=True)
+		thread.start()
+		return thread
+
+	def stop_sync(self) -> None:
+		self._stop_sync.set()
+
+	# Re-reads the columns and keys of the given tables from the database with the same filters as a full load,
+	# forgetting the ones that no longer exist. Only rebuilds the join paths if a foreign key changed, which
+	# saved user tables never have. Everything is built on the side and swapped in at once.
+	def refresh_tables(self, table_names: Iterable[str]) -> None:
+		changed = set(table_names)
+		placeholders = ", ".join(["%s"] * len(changed))
+		self.cursor.execute(
+			f"""
+			SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE
+			FROM INFORMATION_SCHEMA.COLUMNS
+			WHERE (TABLE_SCHEMA = 'sqlmate' OR TABLE_SCHEMA = %s AND TABLE_NAME NOT LIKE 'u_%')
+				AND TABLE_NAME IN ({placeholders})
+			ORDER BY TABLE_NAME, ORDINAL_POSITION;
+			""", (DB_NAME, *changed)
+		)
+		column_rows: List[Any] = self.cursor.fetchall()
+		self.cursor.execute(
+			f"""
+			SELECT
+				kcu.TABLE_NAME,
+				kcu.COLUMN_NAME,
+				kcu.REFERENCED_TABLE_NAME,
+				kcu.REFERENCED_COLUMN_NAME
+			FROM
+				INFORMATION_SCHEMA.KEY_COLUMN_USAGE AS kcu
+			WHERE
+				kcu.TABLE_SCHEMA = %s
+				AND (kcu.REFERENCED_TABLE_NAME IS NOT NULL OR kcu.CONSTRAINT_NAME = 'PRIMARY')
+				AND kcu.TABLE_NAME IN ({placeholders})
+			ORDER BY kcu.TABLE_NAME, kcu.CONSTRAINT_NAME, kcu.ORDINAL_POSITION;
+			""", (DB_NAME, *changed)
+		)
+		key_rows: List[Any] = self.cursor.fetchall()
+
+		col_types: defaultdict[str, TableTypes] = defaultdict(TableTypes, {table: types for table, types in self.col_types.items() if table not in changed})
+		for table, column, data_type in column_rows:
+			col_types[table].add(column, data_type)
+
+		primary_keys = {table: columns for table, columns in self.primary_keys.items() if table not in changed}
+		for table, column, referenced_table, _ in key_rows:
+			if referenced_table is None:
+				primary_keys.setdefault(table, []).append(column)
+
+		# Foreign keys of the changed tables are replaced, ones pointing at a table that is gone are dropped
+		foreign_keys = [
+			foreign_key for foreign_key in self.foreign_keys
+			if foreign_key[0] not in changed and (foreign_key[2] not in changed or foreign_key[2] in col_types)
+		] + [tuple(row) for row in key_rows if row[2] is not None]
+
+		if set(foreign_keys) != set(self.foreign_keys):
+			rebuilt = Metadata()
+			rebuilt.add_foreign_keys(foreign_keys)
+			rebuilt.build_paths()
+			self.graph, self.foreign_keys = rebuilt.graph, rebuilt.foreign_keys
+			self.paths = rebuilt.paths
+			self.version += 1
+		self.col_types = col_types
+		self.primary_keys = primary_keys
+		for table in changed:
+			self.table_versions[table] = self.table_versions.get(table, 0) + 1
+
+	def get_schema_version(self) -> int:
+		try:
+			self.cursor.execute("SELECT COALESCE(MAX(version), 0) FROM sqlmate.schema_changes")
+			row: Any = self.cursor.fetchone()
+		except mysql.connector.Error as e:
+			logger.warning("Failed to read the schema version, is sqlmate.schema_changes missing? %s", e)
+			return 0
+		return int(row[0]) if row and row[0] is not None else 0
+
 	def get_col_types(self) -> None:
 		self.cursor.execute(
 			"""
@@ -84,24 +389,14 @@ class Metadata:
 		)
 		rows: List[Any] = self.cursor.fetchall()
 		for table, column, data_type in rows:
-			if table == "u_mee_yessuh":
-				print(column, data_type)
 			self.col_types[table].add(column, data_type)
 
+	# Fetches every foreign key (and primary key, used for paging) in the schema in one query, instead of one query per table
 	def generate_graph(self) -> None:
 		self.cursor.execute(
 			"""
-			SELECT TABLE_NAME
-			FROM INFORMATION_SCHEMA.TABLES
-			WHERE TABLE_SCHEMA = %s;
-			""", (DB_NAME,)
-		)
-		rows: List[Any] = self.cursor.fetchall()
-		tables: List[str] = [table[0] for table in rows]
-
-		for table in tables:
-			self.cursor.execute("""
 			SELECT
+				kcu.TABLE_NAME,
 				kcu.COLUMN_NAME,
 				kcu.REFERENCED_TABLE_NAME,
 				kcu.REFERENCED_COLUMN_NAME
@@ -109,51 +404,229 @@ class Metadata:
 				INFORMATION_SCHEMA.KEY_COLUMN_USAGE AS kcu
 			WHERE
 				kcu.TABLE_SCHEMA = %s
-				AND kcu.TABLE_NAME = %s
-				AND kcu.REFERENCED_TABLE_NAME IS NOT NULL;
-    		""", (DB_NAME, table))
-			metadata: List[Any] = self.cursor.fetchall()
-
-			for column, referenced_table, referenced_column in metadata:
-				self.graph[table].append(
-					Edge(table, referenced_table, column, referenced_column)
-				)
-				self.graph[referenced_table].append(
-					Edge(referenced_table, table, referenced_column, column)
-				)
-	
-    # Finds shortest path using DFS
+				AND (kcu.REFERENCED_TABLE_NAME IS NOT NULL OR kcu.CONSTRAINT_NAME = 'PRIMARY')
+			ORDER BY kcu.TABLE_NAME, kcu.CONSTRAINT_NAME, kcu.ORDINAL_POSITION;
+			""", (DB_NAME,)
+		)
+		rows: List[Any] = self.cursor.fetchall()
+		self.add_foreign_keys([tuple(row) for row in rows if row[2] is not None])
+		for table, column, referenced_table, _ in rows:
+			if referenced_table is None:
+				self.primary_keys.setdefault(table, []).append(column)
+
+	def add_foreign_keys(self, foreign_keys: List[Tuple[str, str, str, str]]) -> None:
+		self.foreign_keys += foreign_keys
+		for table, column, referenced_table, referenced_column in foreign_keys:
+			self.graph[table].append(
+				Edge(table, referenced_table, column, referenced_column)
+			)
+			self.graph[referenced_table].append(
+				Edge(referenced_table, table, referenced_column, column)
+			)
+
+	# Summary of everything the metadata is built from: the columns (with their types) and the primary and foreign
+	# key rows. Counts alone miss a column being renamed or changing type, so every row is hashed and the hashes
+	# are XORed together, which doesn't depend on the row order and, unlike GROUP_CONCAT, isn't cut off at
+	# group_concat_max_len on large schemas.
+	def get_fingerprint(self) -> str:
+		self.cursor.execute(
+			"""
+			SELECT
+				(SELECT CONCAT(COUNT(*), ':', BIT_XOR(CAST(CONV(LEFT(MD5(CONCAT_WS('|', TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, DATA_TYPE)), 16), 16, 10) AS UNSIGNED)))
+					FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA IN ('sqlmate', %s)),
+				(SELECT CONCAT(COUNT(*), ':', BIT_XOR(CAST(CONV(LEFT(MD5(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME, CONSTRAINT_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME)), 16), 16, 10) AS UNSIGNED)))
+					FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = %s AND (REFERENCED_TABLE_NAME IS NOT NULL OR CONSTRAINT_NAME = 'PRIMARY'));
+			""", (DB_NAME, DB_NAME)
+		)
+		row: Any = self.cursor.fetchone()
+		return hashlib.sha1("|".join([str(value) for value in row]).encode("utf-8")).hexdigest()
+
+	def to_snapshot(self) -> Dict[str, Any]:
+		return {
+			"format_version": self.SNAPSHOT_FORMAT_VERSION,
+			"db_name": DB_NAME,
+			"fingerprint": self.fingerprint,
+			"schema_version": self.schema_version,
+			"col_types": {table: types.types for table, types in self.col_types.items()},
+			"foreign_keys": self.foreign_keys,
+			"primary_keys": self.primary_keys,
+		}
+
+	@classmethod
+	def from_snapshot(cls, snapshot: Dict[str, Any]) -> "Metadata":
+		start = time.perf_counter()
+		loaded = cls()
+		loaded.fingerprint = snapshot["fingerprint"]
+		loaded.schema_version = snapshot.get("schema_version", 0)
+		for table, types in snapshot["col_types"].items():
+			# Types in the snapshot are already normalized, so bypass TableTypes.add
+			loaded.col_types[table].types.update(types)
+		loaded.add_foreign_keys([tuple(foreign_key) for foreign_key in snapshot["foreign_keys"]])
+		loaded.primary_keys = {table: list(columns) for table, columns in snapshot["primary_keys"].items()}
+		loaded.build_paths()
+		loaded.timings = {"snapshot": time.perf_counter() - start}
+		loaded.loaded.set()
+		logger.info("Metadata loaded from snapshot in %.1fms", loaded.timings["snapshot"] * 1000, extra={"timings": loaded.timings})
+		return loaded
+
+	def save_snapshot(self, path: str = METADATA_SNAPSHOT_PATH) -> None:
+		try:
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			# Write to a temporary file first so other workers never read a half-written snapshot
+			temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+			with open(temp_path, "w") as f:
+				json.dump(self.to_snapshot(), f)
+			os.replace(temp_path, path)
+		except OSError as e:
+			logger.warning("Failed to write metadata snapshot: %s", e)
+
+	# Takes over the contents of another Metadata object, used to swap in a reload without
+	# replacing the module-level instance everything else holds a reference to
+	def replace(self, other: "Metadata") -> None:
+		self.col_types = other.col_types
+		self.graph = other.graph
+		self.foreign_keys = other.foreign_keys
+		self.primary_keys = other.primary_keys
+		self.paths = other.paths
+		self.fingerprint = other.fingerprint
+		self.schema_version = other.schema_version
+		self.timings = other.timings
+		self.version += 1
+
+	# Reloads from the database if the schema changed since this metadata was loaded
+	def revalidate(self) -> bool:
+		# Holds off sync, which shares self.cursor and would be overwritten by the reload anyway
+		with self._change_lock:
+			try:
+				with get_cursor() as cur:
+					self.cursor = cur
+					fingerprint = self.get_fingerprint()
+					if fingerprint == self.fingerprint:
+						return False
+					logger.info("Metadata snapshot is stale, reloading from the database")
+					fresh = Metadata(cur)
+			except Exception as e:
+				logger.warning("Failed to revalidate metadata: %s", e)
+				return False
+			finally:
+				self.cursor = None
+
+			self.replace(fresh)
+		self.save_snapshot()
+		return True
+
+	# Starts over with the join paths, has to be re-run whenever the graph changes
+	def build_paths(self) -> None:
+		self.paths = ShortestPaths(self.graph)
+
+	# Returns the edges on the shortest path from source to destination, in join order
+	def get_path(self, source: str, destination: str) -> List[Edge]:
+		self.ensure_loaded()
+		if source == destination:
+			return []
+		parents, _ = self.paths.tree(source)
+		if destination not in parents:
+			raise ValueError(f"No path found between {source} and {destination}")
+
+		path: List[Edge] = []
+		node = destination
+		while node != source:
+			edge = parents[node]
+			path.append(edge)
+			node = edge.source
+		path.reverse()
+
+		return path
+
+	# Returns the JOIN clauses needed to get from source to destination
 	def shortest_path(self, source: str, destination: str) -> str:
-		queue = deque([(source, "")])
-		visited = set([source])
-		
-		while queue:
-			node, clause = queue.popleft()
-			if node == destination:
-				return clause
-			for edge in self.get_edges(node):
-				if edge.destination not in visited:
-					visited.add(edge.destination)
-					queue.append((edge.destination, f'{clause}{"" if node == source else " "}JOIN {edge.destination} ON {str(edge)}'))
-		
-		raise ValueError(f"No path found between {source} and {destination}")
+		return " ".join([edge.join_clause for edge in self.get_path(source, destination)])
+
+	# Plans the joins connecting all of the given tables, starting from the first one (the FROM table).
+	# This approximates a minimal Steiner tree over the FK graph: the tree grows by repeatedly attaching the
+	# requested table closest to any table already joined, so every table is joined exactly once and
+	# intermediate tables are shared between requested tables instead of being joined again.
+	def plan_joins(self, tables: List[str]) -> List[Edge]:
+		self.ensure_loaded()
+		if not tables:
+			return []
+
+		# Kept in join order (dicts are ordered) so ties resolve the same way on every run
+		joined: Dict[str, None] = {tables[0]: None}
+		remaining = [table for table in dict.fromkeys(tables) if table not in joined]
+		edges: List[Edge] = []
+
+		while remaining:
+			best = None
+			distances = {tree_table: self.paths.tree(tree_table)[1] for tree_table in joined}
+			# Ties go to the earliest requested table and the earliest joined attachment point
+			for table in remaining:
+				for tree_table in joined:
+					distance = distances[tree_table].get(table)
+					if distance is not None and (best is None or distance < best[0]):
+						best = (distance, tree_table, table)
+			if best is None:
+				raise ValueError(f"No path found between {tables[0]} and {', '.join(remaining)}")
+
+			_, tree_table, table = best
+			for edge in self.get_path(tree_table, table):
+				# The closest attachment point means the rest of the path is made up of new tables
+				joined[edge.destination] = None
+				edges.append(edge)
+			remaining = [table for table in remaining if table not in joined]
+
+		return edges
+
+	# Returns the JOIN clauses for plan_joins
+	def get_JOIN_clause(self, tables: List[str]) -> str:
+		return " ".join([edge.join_clause for edge in self.plan_joins(tables)])
 	
 	def get_edge(self, source: str, destination: str) -> str:
+		self.ensure_loaded()
 		for edge in self.graph[source]:
 			if edge.destination == destination:
 				return str(edge)
 		raise ValueError(f"No edge found between {source} and {destination}")
 
 	def get_edges(self, source: str) -> List[Edge]:
+		self.ensure_loaded()
 		return self.graph[source]
 	
 	def get_type(self, table_name: str, column_name: str) -> str:
+		self.ensure_loaded()
 		return self.col_types[table_name].get(column_name)
 
-with get_cursor() as cur:
-	metadata: Metadata = Metadata(cur)
-	# with open("logs/metadata.txt", "w") as f:
-	# 		f.write(str(metadata))
+	# Name checks for user supplied identifiers, these never add entries to col_types
+	def has_table(self, table_name: str) -> bool:
+		self.ensure_loaded()
+		return table_name in self.col_types
+
+	def has_column(self, table_name: str, column_name: str) -> bool:
+		self.ensure_loaded()
+		return table_name in self.col_types and column_name in self.col_types[table_name].types
+
+	# Queries over these tables built from this metadata stay valid as long as these and version are unchanged
+	def get_table_versions(self, table_names: Iterable[str]) -> Tuple[int, ...]:
+		return tuple(self.table_versions.get(table, 0) for table in table_names)
+
+	def get_primary_key(self, table_name: str) -> List[str]:
+		self.ensure_loaded()
+		return self.primary_keys.get(table_name, [])
+
+def read_snapshot(path: str = METADATA_SNAPSHOT_PATH) -> Optional[Dict[str, Any]]:
+	try:
+		with open(path, "r") as f:
+			snapshot = json.load(f)
+	except (OSError, ValueError):
+		return None
+	if snapshot.get("format_version") != Metadata.SNAPSHOT_FORMAT_VERSION or snapshot.get("db_name") != DB_NAME:
+		return None
+	return snapshot
+
+# Nothing is loaded at import time, the app warms this up in its lifespan hook (see app.py)
+metadata: Metadata = Metadata()
+# with open("logs/metadata.txt", "w") as f:
+# 		f.write(str(metadata))
 
 """tracks JOIN artists -> tracks JOIN track_artists ON ... JOIN artists ON ...
 
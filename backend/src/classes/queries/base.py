@@ -1,18 +1,28 @@
 from ..metadata import metadata
-from typing import List
+from typing import Any, List, Tuple
 from ..http import QueryParams, UpdateQueryParams
 
+# Everything below ends up in the SQL text, so anything the user picks is checked against these
+# (or against the schema for table and column names) rather than interpolated as sent
+COMPARISON_OPERATORS = ("=", "!=", "<", ">", "<=", ">=")
+LIKE_PATTERNS = {"SUBSTRING": "%{}%", "PREFIX": "{}%", "SUFFIX": "%{}"}
+AGGREGATION_TYPES = ("SUM", "AVG", "MIN", "MAX", "COUNT")
+SORT_DIRECTIONS = ("ASC", "DESC")
+MAX_ALIAS_LENGTH = 64  # MySQL's limit on column aliases
+
 
 # Class that will be used to initialize a TableQuery object
 # which we will use to generate the query
 class BaseQuery:
     def __init__(self, input: QueryParams | UpdateQueryParams, username: str = "") -> None:
         self.table_name: str = self.format_table_name(username, input.get("table", ""))
+        if not metadata.has_table(self.table_name):
+            raise ValueError(f"Unknown table {input.get('table', '')}")
         if not input.get("attributes") and not input.get("updates"):
             raise ValueError(f"No attribues or updates selected for {self.table_name} table")
         self.attributes: List[Attribute] = [Attribute(details, self.table_name) for details in input.get("attributes", [])]
         self.constraints: List[Constraint] = [Constraint(details, self.table_name) for details in input.get("constraints", [])]
-        self.group_by: List[str] = [f"{self.table_name}.{attribute}" for attribute in input.get("group_by", [])]
+        self.group_by: List[str] = [column_name(self.table_name, attribute) for attribute in input.get("group_by", [])]
         self.aggregations: List[Aggregation] = [Aggregation(details, self.table_name) for details in input.get("aggregations", [])]
         self.order_by: List[Ordering] = [Ordering(details, self.table_name) for details in input.get("order_by", [])]
 
@@ -39,7 +49,7 @@ class BaseQuery:
                 clause += f"{attr.attribute}"
                 alias = attr.alias if attr.alias else ("_".join(attr.attribute.split(".")) if num_tables > 1 else attr.attribute.split(".")[-1])
             self.alias_map[attr.attribute] = alias # For use in the ORDER BY clause
-            clause += f" AS {alias},"
+            clause += f" AS {quote_alias(alias)},"
         clause = clause[:-1]
 
         return clause
@@ -60,6 +70,10 @@ class BaseQuery:
             clause += f"{constraint.attribute} {constraint.operator} {constraint.value} AND "
 
         return clause
+
+    # Bind parameters for the placeholders emitted by get_WHERE_clause, in the same order
+    def get_WHERE_params(self) -> List[Any]:
+        return [constraint.param for constraint in self.constraints]
     
     def get_GROUP_BY_clause(self) -> str:
         clause = ','.join(self.group_by)
@@ -70,7 +84,7 @@ class BaseQuery:
         clause = ""
 
         for ordering in self.order_by:
-            name_or_alias = self.alias_map.get(ordering.attribute, ordering.attribute)
+            name_or_alias = quote_alias(self.alias_map[ordering.attribute]) if ordering.attribute in self.alias_map else ordering.attribute
             clause += f"{name_or_alias} {ordering.sort},"
 
         return clause
@@ -95,8 +109,11 @@ class BaseQuery:
 
 class Attribute:
     def __init__(self, input: dict, table_name: str) -> None:
-        self.attribute: str = f"{table_name}.{input.get('attribute', '')}"
+        self.attribute: str = column_name(table_name, input.get("attribute", ""))
         self.alias: str = input.get("alias", "")
+        if "%" in self.alias or len(self.alias) > MAX_ALIAS_LENGTH:
+            # A % would also be taken for a placeholder when the parameters are inlined (see CompiledQuery.render)
+            raise ValueError(f"Invalid alias for {self.attribute}: {self.alias}")
 
     def __str__(self) -> str:
         return f"""
@@ -109,33 +126,19 @@ class Attribute:
 
 class Constraint:
     def __init__(self, input: dict, table_name: str) -> None:
-        self.attribute: str = f'{table_name}.{input.get("attribute", "")}'
+        self.attribute: str = column_name(table_name, input.get("attribute", ""))
         self.operator: str = input.get("operator", "")
-        self.value: str = self.process_value(input.get("value", ""))
+        # The value is sent separately as a bind parameter, the SQL only ever contains the placeholder
+        self.value: str = "%s"
+        self.param: Any = self.process_value(input.get("value", ""))
 
     # Handles if we are comparing strings
-    def process_value(self, value: str) -> str:
+    def process_value(self, value: str) -> Any:
         table_name, attribute_name = self.attribute.split(".")
-        db_type = metadata.get_type(table_name, attribute_name)
-        if db_type in ["STR", "DATE"]:
-            new_value = ""
-            if self.operator in ["=", "!="]:
-                new_value = f"'{value}'"
-            else:
-                if self.operator == "SUBSTRING":
-                    new_value = f"'%{value}%'"
-                elif self.operator == "PREFIX":
-                    new_value = f"'{value}%'"
-                elif self.operator == "SUFFIX":
-                    new_value = f"'%{value}'" 
-                self.operator = "LIKE"
-        else:
-            if value.isnumeric():
-                new_value = value
-            else:
-                raise ValueError(f"Invalid value for constraint on {self.attribute}: {value}")
+        self.operator, param = bind_constraint_value(table_name, attribute_name, self.operator, value)
+
+        return param
 
-        return new_value
 
     def __str__(self) -> str:
         return f"""
@@ -149,10 +152,10 @@ class Constraint:
 
 class Aggregation:
     def __init__(self, input: dict, table_name: str) -> None:
-        self.attribute: str = (
-            f'{table_name}.{input.get("attribute", "")}'
-        )
+        self.attribute: str = column_name(table_name, input.get("attribute", ""))
         self.type: str = input.get("type", "")
+        if self.type.upper() not in AGGREGATION_TYPES:
+            raise ValueError(f"Invalid aggregation on {self.attribute}: {self.type}")
 
     def __str__(self):
         return f"""
@@ -164,8 +167,8 @@ class Aggregation:
 
 class Ordering:
     def __init__(self, input: dict, table_name: str) -> None:
-        self.attribute: str = f'{table_name}.{input.get("attribute", "")}'
-        self.sort: str = input.get("sort", "")
+        self.attribute: str = column_name(table_name, input.get("attribute", ""))
+        self.sort: str = sort_direction(input.get("sort", ""))
 
     def __str__(self):
         return f"""
@@ -173,4 +176,40 @@ class Ordering:
                 'attribute': {self.attribute}
                 'sort': {self.sort}
             )
-        """
\ No newline at end of file
+        """
+
+
+# Returns table_name.attribute, which must be a column of the table
+def column_name(table_name: str, attribute: str) -> str:
+    if not metadata.has_column(table_name, attribute):
+        raise ValueError(f"Unknown column {attribute} in {table_name}")
+    return f"{table_name}.{attribute}"
+
+
+def quote_alias(alias: str) -> str:
+    return "`" + alias.replace("`", "``") + "`"
+
+
+def sort_direction(sort: str | None) -> str:
+    direction = (sort or "ASC").upper()
+    if direction not in SORT_DIRECTIONS:
+        raise ValueError(f"Invalid sort direction: {sort}")
+    return direction
+
+
+# Returns the SQL operator and bind parameter for a constraint on table_name.attribute_name.
+# Kept separate from Constraint so compiled queries can re-bind new values without rebuilding the query.
+def bind_constraint_value(table_name: str, attribute_name: str, operator: str, value: str) -> Tuple[str, Any]:
+    db_type = metadata.get_type(table_name, attribute_name)
+    if db_type in ["STR", "DATE"]:
+        if operator in COMPARISON_OPERATORS:
+            return operator, value
+        if operator in LIKE_PATTERNS:
+            # The value is matched literally, its own wildcards are escaped
+            escaped = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            return "LIKE", LIKE_PATTERNS[operator].format(escaped)
+    elif operator in COMPARISON_OPERATORS:
+        if str(value).isnumeric():
+            return operator, int(value)
+        raise ValueError(f"Invalid value for constraint on {table_name}.{attribute_name}: {value}")
+    raise ValueError(f"Invalid operator for constraint on {table_name}.{attribute_name}: {operator}")
@@ -1,7 +1,10 @@
 from ..metadata import metadata
-from .base import BaseQuery
+from .base import BaseQuery, column_name
 from ..http import UpdateQueryParams
 from typing import List, Any
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Update query class
 class UpdateQuery(BaseQuery):
@@ -20,23 +23,27 @@ class UpdateQuery(BaseQuery):
 
         return clause
 
+    # Bind parameters for the placeholders emitted by get_SET_clause, in the same order
+    def get_SET_params(self) -> List[Any]:
+        return [update.param for update in self.updates]
+
 class Update:
     def __init__(self, input: dict, table_name: str) -> None:
         self.table_name: str = table_name
-        self.attribute: str = f'{table_name}.{input.get("attribute", "")}'
-        self.value: str = self.process_value(input.get("value", ""))
+        self.attribute: str = column_name(table_name, input.get("attribute", ""))
+        self.value: str = "%s"
+        self.param: Any = self.process_value(input.get("value", ""))
 
-    def process_value(self, value: Any) -> str:
+    def process_value(self, value: Any) -> Any:
         table_name, attribute_name = self.attribute.split(".")
         db_type = metadata.get_type(table_name, attribute_name)
-        print(table_name, attribute_name)
-        print("DB_TYPE:", db_type)
+        logger.debug("Type of %s.%s is %s", table_name, attribute_name, db_type)
         if db_type in ["STR", "DATE"] :
-            return f"'{str(value)}'"
+            return str(value)
         # db_type in ["INT", "BOOL", "FLOAT"]
         else:
             if str(value).isnumeric():
-                return str(value)
+                return int(value)
             else:
                 raise ValueError(f"Invalid value for update on {self.attribute}: {value}")
     
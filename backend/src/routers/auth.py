@@ -1,11 +1,20 @@
-from utils.auth import create_access_token, check_user, hash_password, check_password, get_token
-from utils.db import get_cursor
+from utils.auth import create_access_token, check_user
+from utils.revocations import revoke_token, revoke_user_tokens
+from utils.passwords import password_hasher, PasswordQueueFullError, PasswordWorkerError
+from utils.db import get_async_cursor
+from utils.users import user_cache, find_user, find_user_by_id, username_key
+from utils.rate_limit import login_ip_limiter, login_username_limiter, retry_after_header
 from classes.http import StatusResponse
+from classes.metadata import metadata
 
-from typing import Any, Optional
-from fastapi import APIRouter, Header, Response, status
+from typing import Optional
+from fastapi import APIRouter, Header, Request, Response, status
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import mysql.connector
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -19,20 +28,43 @@ class RegisterRequest(BaseModel):
 class RegisterResponse(BaseModel):
     details: StatusResponse
 @router.post('/register', status_code=status.HTTP_201_CREATED)
-def register(req: RegisterRequest, response: Response) -> RegisterResponse:
+async def register(req: RegisterRequest, response: Response) -> RegisterResponse:
     username = req.username
     password = req.password
     email = req.email
 
-    # Generate a password hash
-    pw_hash = hash_password(password)
+    # Generate a password hash (bcrypt is CPU bound, it runs in the password worker processes)
+    try:
+        pw_hash = await password_hasher.hash(password)
+    except PasswordQueueFullError as e:
+        response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        response.headers["Retry-After"] = "1"
+        return RegisterResponse(
+			details=StatusResponse(
+				status="error",
+				message=str(e),
+                code=status.HTTP_429_TOO_MANY_REQUESTS
+			)
+		)
+    except PasswordWorkerError as e:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        response.headers["Retry-After"] = "1"
+        return RegisterResponse(
+			details=StatusResponse(
+				status="error",
+				message=str(e),
+                code=status.HTTP_503_SERVICE_UNAVAILABLE
+			)
+		)
 
     try:
-        with get_cursor("sqlmate") as cur:
-            cur.execute(
+        async with get_async_cursor("sqlmate") as cur:
+            await cur.execute(
                 "INSERT INTO users (username, password, email) VALUES (%s, %s, %s)",
                 (username, pw_hash, email)
             )
+        # The username may be cached as not existing
+        user_cache.invalidate(username)
             
     # If insertion fails due to duplicate username, or other error, return error
     except mysql.connector.IntegrityError as _:
@@ -46,7 +78,7 @@ def register(req: RegisterRequest, response: Response) -> RegisterResponse:
 		)
     
     except mysql.connector.Error as e:
-        print(e)
+        logger.error("Failed to register user %s: %s", username, e)
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return RegisterResponse(
 			details=StatusResponse(
@@ -72,7 +104,7 @@ class LoginResponse(BaseModel):
     details: StatusResponse
     token: str | None = None
 @router.post('/login', response_model=LoginResponse, status_code=status.HTTP_200_OK)
-def login(req: LoginRequest, response: Response) -> LoginResponse:
+async def login(req: LoginRequest, request: Request, response: Response) -> LoginResponse:
     username = req.username
     password = req.password
 
@@ -86,12 +118,50 @@ def login(req: LoginRequest, response: Response) -> LoginResponse:
 			)
 		)
 
-    with get_cursor("sqlmate") as cur:
-        cur.execute("SELECT id, password, email FROM users WHERE username = %s",(username,))
-        row: Any = cur.fetchone()
+    # Rate limited before anything else, so a burst of guesses is refused without DB or bcrypt work.
+    # Behind a proxy listed in FORWARDED_ALLOW_IPS, uvicorn has already set the client from X-Forwarded-For.
+    client_ip = request.client.host if request.client else ""
+    allowed, retry_after = login_ip_limiter.acquire(client_ip)
+    if allowed:
+        allowed, retry_after = login_username_limiter.acquire(username_key(username))
+    if not allowed:
+        response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        response.headers["Retry-After"] = retry_after_header(retry_after)
+        return LoginResponse(
+			details=StatusResponse(
+				status="error",
+				message="Too many login attempts, try again later",
+                code=status.HTTP_429_TOO_MANY_REQUESTS
+			)
+		)
+
+    user = await find_user(username)
+
+    try:
+        password_matches = user is not None and await password_hasher.check(password, user.password)
+    except PasswordQueueFullError as e:
+        response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        response.headers["Retry-After"] = "1"
+        return LoginResponse(
+			details=StatusResponse(
+				status="error",
+				message=str(e),
+                code=status.HTTP_429_TOO_MANY_REQUESTS
+			)
+		)
+    except PasswordWorkerError as e:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        response.headers["Retry-After"] = "1"
+        return LoginResponse(
+			details=StatusResponse(
+				status="error",
+				message=str(e),
+                code=status.HTTP_503_SERVICE_UNAVAILABLE
+			)
+		)
 
     # If user not found or password does not match, return error
-    if not row or not check_password(password, row[1]):
+    if user is None or not password_matches:
         response.status_code = status.HTTP_401_UNAUTHORIZED
         return LoginResponse(
 			details=StatusResponse(
@@ -101,11 +171,14 @@ def login(req: LoginRequest, response: Response) -> LoginResponse:
 			)
 		)
     
+    # Only failed attempts count against the username
+    login_username_limiter.release(username_key(username))
+
     # Generate JWT token with username
     payload = {
-        "id": row[0],
+        "id": user.id,
         "username": username,
-        "email": row[2]
+        "email": user.email
     }
     token = create_access_token(payload)
 
@@ -125,7 +198,7 @@ class UserInfoResponse(BaseModel):
     username: str | None = None
     email: str | None = None
 @router.get('/me', response_model=UserInfoResponse, status_code=status.HTTP_200_OK)
-def me(response: Response, authorization: Optional[str] = Header(None)) -> UserInfoResponse:
+async def me(response: Response, authorization: Optional[str] = Header(None)) -> UserInfoResponse:
     # Check the authentication of the user
     user_id, username, error = check_user(authorization)
     if error:
@@ -141,14 +214,9 @@ def me(response: Response, authorization: Optional[str] = Header(None)) -> UserI
 		)
 
     # Get the username from the token data
-    with get_cursor("sqlmate") as cur:
-        cur.execute(
-          "SELECT username, email FROM users WHERE id = %s",
-          (user_id,)
-        )
-        row: Any = cur.fetchone()
-
-    if not row:
+    user = await find_user_by_id(user_id)
+
+    if user is None:
         response.status_code = status.HTTP_404_NOT_FOUND
         return UserInfoResponse(
             details=StatusResponse(
@@ -166,18 +234,40 @@ def me(response: Response, authorization: Optional[str] = Header(None)) -> UserI
 			message="User info retrieved successfully",
             code=status.HTTP_200_OK
 		),
-		username=row[0],
-		email=row[1]
+		username=user.username,
+		email=user.email
+	)
+
+# User logout, the token is revoked so it can not be used again
+class LogoutResponse(BaseModel):
+    details: StatusResponse
+@router.post('/logout', response_model=LogoutResponse, status_code=status.HTTP_200_OK)
+async def logout(response: Response, authorization: Optional[str] = Header(None)) -> LogoutResponse:
+    if not await revoke_token(authorization):
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+        return LogoutResponse(
+            details=StatusResponse(
+				status="error",
+				message="Invalid token",
+                code=status.HTTP_401_UNAUTHORIZED
+			)
+		)
+
+    return LogoutResponse(
+		details=StatusResponse(
+			status="success",
+			message="Logged out successfully",
+            code=status.HTTP_200_OK
+		)
 	)
 
 # User account deletion
 class DeleteAccountResponse(BaseModel):
     details: StatusResponse
 @router.delete('/delete_user')
-def delete_account(authorization: Optional[str] = Header(None)) -> DeleteAccountResponse:
+async def delete_account(authorization: Optional[str] = Header(None)) -> DeleteAccountResponse:
     # Check the authentication of the user
-    token = get_token(authorization)
-    user_id, username, error = check_user(token)
+    user_id, username, error = check_user(authorization)
     if error:
         return DeleteAccountResponse(
 			details=StatusResponse(
@@ -186,30 +276,39 @@ def delete_account(authorization: Optional[str] = Header(None)) -> DeleteAccount
 			)
 		)
 
-    with get_cursor("sqlmate") as cur:
+    # Delete the user's saved tables first: the trigger that marks them for dropping doesn't fire for the rows
+    # ON DELETE CASCADE removes, and dropping them needs the user's name, which is gone once the user is deleted
+    async with get_async_cursor("sqlmate") as cur:
         try:
-            cur.execute("DELETE FROM users WHERE username = %s", (username,))
+            await cur.execute("SELECT table_name FROM user_tables WHERE user_id = %s", (user_id,))
+            table_names = [f"u_{username}_{row[0]}" for row in await cur.fetchall()]
+            await cur.execute("DELETE FROM user_tables WHERE user_id = %s", (user_id,))
+            await cur.callproc("process_tables_to_drop")
         except mysql.connector.Error as e:
-            print(e)
+            logger.error("Failed to drop tables of user %s: %s", username, e)
             return DeleteAccountResponse(
 				details=StatusResponse(
 					status="error",
-					message="Failed to delete account"
+					message="Failed to process tables for deletion"
 				)
 			)
-        
-    # Execute the stored procedure to drop the tables that were marked for deletion in the previous step
-    with get_cursor() as cur:
+    await run_in_threadpool(metadata.drop_tables, table_names)
+
+    async with get_async_cursor("sqlmate") as cur:
         try:
-            cur.callproc("process_tables_to_drop")
+            await cur.execute("DELETE FROM users WHERE username = %s", (username,))
         except mysql.connector.Error as e:
-            print(e)
+            logger.error("Failed to delete user %s: %s", username, e)
             return DeleteAccountResponse(
 				details=StatusResponse(
 					status="error",
-					message="Failed to process tables for deletion"
+					message="Failed to delete account"
 				)
 			)
+
+    # The account is gone, so neither its record nor any of its tokens may be used any more (cached or not)
+    user_cache.invalidate(username)
+    await revoke_user_tokens(user_id)
     
     return DeleteAccountResponse(
 		details=StatusResponse(
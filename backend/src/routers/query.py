@@ -1,13 +1,26 @@
-from utils.db import get_cursor, get_timestamp
-from utils.serialization import query_output_to_table
-from utils.generators import generate_query
+from utils.db import execute_prepared, get_timestamp, is_timeout
+from utils.serialization import clean_column_names, dumps, rows_to_ndjson, RowsJSONResponse
+from utils.streaming import OpenResult, open_result
+from utils.arrow import ARROW_STREAM_MEDIA_TYPE, arrow_available, wants_arrow, arrow_schema, arrow_stream
+from utils.pagination import validate_page_size
+from utils.result_cache import result_cache
+from utils.guardrails import check_query
+from utils.jobs import job_manager, JobQueueFullError
+from utils.generators import compile_query
+from utils.metrics import timed, record_since_request_start
+from utils.constants import STREAM_CHUNK_SIZE, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, QUERY_TIMEOUT, QUERY_STREAM_TIMEOUT
 from classes.http import StatusResponse, Table, QueryParams
-from classes.queries.base import BaseQuery
 
-from typing import Any, Dict, List, Optional
-from fastapi import APIRouter, status, Response
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Header, status, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import mysql.connector
+import gzip
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -16,16 +29,23 @@ router = APIRouter()
 class QueryRequest(BaseModel):
 	query_params: List[QueryParams]
 	options: Optional[Dict[str, Any]] = None
+	# Sending either of these returns one page of the result, the next page is requested with next_page_token
+	page_size: Optional[int] = None
+	page_token: Optional[str] = None
 class QueryResponse(BaseModel):
 	status: StatusResponse
 	table: Table | None = None
+	next_page_token: str | None = None
+	job_id: str | None = None  # Set instead of table when the query was too big to run inline (see /query/jobs)
 @router.post("", response_model=QueryResponse, status_code=status.HTTP_200_OK)
-def run_query(req: QueryRequest, response: Response) -> QueryResponse:
-	# Validate the input data
+async def run_query(req: QueryRequest, response: Response, accept: Optional[str] = Header(None)) -> QueryResponse | Response:
+	record_since_request_start("validation")
+	# Validate the input data and generate the query (or reuse the compiled one for this query shape)
 	try:
-		query: List[BaseQuery] = [BaseQuery(details) for details in req.query_params]
+		with timed("compile"):
+			compiled, params = compile_query(req.query_params, req.options or {})
 	except ValueError as e:
-		print(e)
+		logger.info("Invalid query parameters: %s", e)
 		response.status_code = status.HTTP_400_BAD_REQUEST
 		return QueryResponse(
 			status=StatusResponse(
@@ -35,44 +55,359 @@ def run_query(req: QueryRequest, response: Response) -> QueryResponse:
 			table=None
 		)
 
+	# Estimate what the query will cost before running it, too expensive queries are rejected, moved to a
+	# background job or limited
+	paged = req.page_size is not None or req.page_token is not None
+	arrow = wants_arrow(accept)
+	with timed("guardrails"):
+		decision = await check_query(compiled, params, can_limit=not paged, can_background=not paged and not arrow)
+	if decision.action == "reject":
+		response.status_code = status.HTTP_400_BAD_REQUEST
+		return QueryResponse(
+			status=StatusResponse(
+				status="error",
+				message=decision.message
+			),
+			table=None
+		)
+	if decision.action == "background":
+		try:
+			job = job_manager.submit(compiled, params)
+		except JobQueueFullError as e:
+			response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+			return QueryResponse(
+				status=StatusResponse(
+					status="error",
+					message=str(e)
+				)
+			)
+		response.status_code = status.HTTP_202_ACCEPTED
+		return QueryResponse(
+			status=StatusResponse(
+				status="success",
+				message=f"{decision.message} Poll /query/jobs/{job.id} for its status."
+			),
+			job_id=job.id
+		)
+
+	# Analytic clients can ask for the result as a columnar Arrow IPC stream instead of JSON
+	if arrow:
+		return await arrow_query_response(decision.sql, params, compiled.render(params, decision.sql), compiled.num_tables)
 
-	query_body = generate_query(query, req.options or {})
+	query_body = decision.sql
 	# with open("logs/query_log.txt", "w") as f:
 	#     f.write(query_body)
 
+	# Identical requests are answered from the result cache until it expires or one of the tables is changed
+	cache_key = result_cache.key(query_body, params, req.page_size, req.page_token)
+	cached = result_cache.get(cache_key) if result_cache.enabled else None
+	if cached is not None:
+		column_names, rows, next_page_token = cached
+	else:
+		generation = result_cache.generation
+		next_page_token = None
+		try:
+			if req.page_size is not None or req.page_token is not None:
+				page = await compiled.pager.fetch(params, validate_page_size(req.page_size, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX), req.page_token, timeout=QUERY_TIMEOUT)
+				rows, column_names, next_page_token = page.rows, page.column_names, page.next_page_token
+			else:
+				async with execute_prepared(query_body, params, timeout=QUERY_TIMEOUT) as cursor:
+					if cursor.description is None:
+						# If there are no results, return an error
+						logger.info("Query returned no result set")
+						response.status_code = status.HTTP_404_NOT_FOUND
+						return QueryResponse(
+							status=StatusResponse(
+								status="error",
+								message="No data found"
+							),
+							table=None
+						)
+					column_names = [i[0] for i in cursor.description]
+					with timed("fetch"):
+						rows: Any = await cursor.fetchall()
+		except ValueError as e:
+			logger.info("Invalid query request: %s", e)
+			response.status_code = status.HTTP_400_BAD_REQUEST
+			return QueryResponse(
+				status=StatusResponse(
+					status="error",
+					message=str(e)
+				),
+				table=None
+			)
+		except mysql.connector.Error as e:
+			logger.error("Failed to execute query: %s", e)
+			response.status_code = status.HTTP_504_GATEWAY_TIMEOUT if is_timeout(e) else status.HTTP_500_INTERNAL_SERVER_ERROR
+			return QueryResponse(
+				status=StatusResponse(
+					status="error",
+					message="Query timed out" if is_timeout(e) else "Failed to execute query"
+				),
+				table=None
+			)
+
+		if result_cache.enabled:
+			result_cache.put(cache_key, (column_names, rows, next_page_token), compiled.tables, generation)
+
+	# The rows go straight to the encoder as the cursor returned them, only the rest of the response goes through the model
+	with timed("serialize"):
+		content = QueryResponse(
+			status=StatusResponse(
+				status="success",
+				message=decision.message or "Query executed successfully"
+			),
+			table=Table(
+				query=compiled.render(params, query_body),
+				created_at=get_timestamp(),
+				columns=compiled.get_column_names(column_names)
+			),
+			next_page_token=next_page_token
+		).model_dump()
+		content["table"]["rows"] = rows
+	with timed("encode"):
+		return RowsJSONResponse(content=content)
+
+# Streams the query result as newline-delimited JSON instead of building the whole table in memory.
+# The first line is an object with the query and column names, every following line is one row (as an array),
+# and the last line is an object with the row count (or an error if the query failed part way through).
+@router.post("/stream", status_code=status.HTTP_200_OK)
+async def stream_query(req: QueryRequest) -> Response:
+	record_since_request_start("validation")
 	try:
-		with get_cursor() as cursor:
-			cursor.execute(query_body)
-			if cursor.description is None:
-				# If there are no results, return an error
-				print("No data found")
-				response.status_code = status.HTTP_404_NOT_FOUND
-				return QueryResponse(
-					status=StatusResponse(
-						status="error",
-						message="No data found"
-					),
-					table=None
+		with timed("compile"):
+			compiled, params = compile_query(req.query_params, req.options or {})
+	except ValueError as e:
+		logger.info("Invalid query parameters: %s", e)
+		return JSONResponse(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			content=QueryResponse(
+				status=StatusResponse(
+					status="error",
+					message=f"Invalid query parameters: {str(e)}"
 				)
-			column_names = [i[0] for i in cursor.description]
-			rows: Any = cursor.fetchall()
+			).model_dump()
+		)
+
+	with timed("guardrails"):
+		decision = await check_query(compiled, params, can_limit=True, can_background=False)
+	if decision.action == "reject":
+		return JSONResponse(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			content=QueryResponse(
+				status=StatusResponse(
+					status="error",
+					message=decision.message
+				)
+			).model_dump()
+		)
+
+	result, error = await open_query(decision.sql, params, timeout=QUERY_STREAM_TIMEOUT)
+	if error:
+		return error
+	column_names = compiled.get_column_names(result.column_names)
+
+	async def body() -> AsyncGenerator[bytes, None]:
+		try:
+			header = {"query": compiled.render(params, decision.sql), "created_at": get_timestamp(), "columns": column_names}
+			if decision.message:
+				header["message"] = decision.message
+			yield dumps(header) + b"\n"
+			async for rows in result.chunks(STREAM_CHUNK_SIZE):
+				yield rows_to_ndjson(rows)
+		except mysql.connector.Error as e:
+			logger.error("Failed to fetch streamed query results: %s", e)
+			await result.close(e)
+			message = "Query timed out" if is_timeout(e) else "Failed to fetch query results"
+			yield dumps({"error": message, "row_count": result.row_count}) + b"\n"
+			return
+		except BaseException as e:
+			# The client went away: give the connection back without reading the rest of the result
+			await result.close(e)
+			raise e
+		await result.close()
+		yield dumps({"row_count": result.row_count}) + b"\n"
+
+	return StreamingResponse(body(), media_type="application/x-ndjson")
+
+# Runs the query before the response starts so failures still get a proper status code.
+# The connection stays checked out (and the result unread on the server) while the rows are streamed.
+async def open_query(sql: str, params: Tuple[Any, ...], whose: str = "user", timeout: Optional[float] = None) -> Tuple[OpenResult | None, JSONResponse | None]:
+	try:
+		result = await open_result(sql, params, whose, timeout)
 	except mysql.connector.Error as e:
-		print(e)
-		response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-		return QueryResponse(
+		logger.error("Failed to execute query: %s", e)
+		return None, JSONResponse(
+			status_code=status.HTTP_504_GATEWAY_TIMEOUT if is_timeout(e) else status.HTTP_500_INTERNAL_SERVER_ERROR,
+			content=QueryResponse(
+				status=StatusResponse(
+					status="error",
+					message="Query timed out" if is_timeout(e) else "Failed to execute query"
+				)
+			).model_dump()
+		)
+
+	if result.cursor.description is None:
+		await result.close()
+		return None, JSONResponse(
+			status_code=status.HTTP_404_NOT_FOUND,
+			content=QueryResponse(
+				status=StatusResponse(
+					status="error",
+					message="No data found"
+				)
+			).model_dump()
+		)
+	return result, None
+
+# Streams the result as Arrow IPC record batches, one per chunk fetched from the cursor.
+# The query text and creation time go in the schema metadata, mirroring the fields of the JSON table.
+async def arrow_query_response(sql: str, params: Tuple[Any, ...], query: str, num_tables: int, whose: str = "user", timeout: Optional[float] = QUERY_STREAM_TIMEOUT) -> Response:
+	if not arrow_available():
+		return JSONResponse(
+			status_code=status.HTTP_406_NOT_ACCEPTABLE,
+			content=QueryResponse(
+				status=StatusResponse(
+					status="error",
+					message="Arrow responses are not supported by this server"
+				)
+			).model_dump()
+		)
+
+	result, error = await open_query(sql, params, whose, timeout)
+	if error:
+		return error
+	column_names = clean_column_names(result.column_names, num_tables)
+	schema = arrow_schema(result.cursor.description, column_names).with_metadata({"query": query, "created_at": get_timestamp()})
+
+	async def body() -> AsyncGenerator[bytes, None]:
+		try:
+			async for data in arrow_stream(schema, result.chunks(STREAM_CHUNK_SIZE)):
+				yield data
+		except mysql.connector.Error as e:
+			# The stream ends without its end-of-stream marker, which Arrow readers report as an error
+			logger.error("Failed to fetch Arrow query results: %s", e)
+			await result.close(e)
+			return
+		except BaseException as e:
+			await result.close(e)
+			raise e
+		await result.close()
+
+	return StreamingResponse(body(), media_type=ARROW_STREAM_MEDIA_TYPE)
+
+# =================================== QUERY JOBS ====================================
+
+class JobResponse(BaseModel):
+	status: StatusResponse
+	job: Dict[str, Any] | None = None
+
+# Runs the query in the background on the job workers, the result is fetched later from /query/jobs/{job_id}/results
+@router.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(req: QueryRequest, response: Response) -> JobResponse:
+	try:
+		compiled, params = compile_query(req.query_params, req.options or {})
+	except ValueError as e:
+		logger.info("Invalid query parameters: %s", e)
+		response.status_code = status.HTTP_400_BAD_REQUEST
+		return JobResponse(
 			status=StatusResponse(
 				status="error",
-				message="Failed to execute query"
-			),
-			table=None
+				message=f"Invalid query parameters: {str(e)}"
+			)
+		)
+
+	decision = await check_query(compiled, params, can_limit=False, can_background=False)
+	if decision.action == "reject":
+		response.status_code = status.HTTP_400_BAD_REQUEST
+		return JobResponse(
+			status=StatusResponse(
+				status="error",
+				message=decision.message
+			)
+		)
+
+	try:
+		job = job_manager.submit(compiled, params)
+	except JobQueueFullError as e:
+		response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+		return JobResponse(
+			status=StatusResponse(
+				status="error",
+				message=str(e)
+			)
 		)
+	return JobResponse(
+		status=StatusResponse(
+			status="success",
+			message="Job submitted"
+		),
+		job=job.to_dict()
+	)
 
-	table: Table = query_output_to_table(rows, column_names, query_body, len(query))
-	table.created_at = get_timestamp()
-	return QueryResponse(
+@router.get("/jobs/{job_id}", response_model=JobResponse, status_code=status.HTTP_200_OK)
+async def get_job(job_id: str, response: Response) -> JobResponse:
+	job = job_manager.get(job_id)
+	if job is None:
+		response.status_code = status.HTTP_404_NOT_FOUND
+		return JobResponse(
+			status=StatusResponse(
+				status="error",
+				message="Job not found"
+			)
+		)
+	return JobResponse(
 		status=StatusResponse(
 			status="success",
-			message="Query executed successfully"
+			message=f"Job {job.status}"
 		),
-		table=table
-	)
\ No newline at end of file
+		job=job.to_dict()
+	)
+
+# Streams the spooled result in the /query/stream format. Clients that accept gzip get the spool file as it is.
+@router.get("/jobs/{job_id}/results", status_code=status.HTTP_200_OK)
+async def get_job_results(job_id: str, accept_encoding: Optional[str] = Header(None)) -> Response:
+	job = job_manager.get(job_id)
+	if job is None or job.status != "succeeded":
+		return JSONResponse(
+			status_code=status.HTTP_404_NOT_FOUND if job is None else status.HTTP_409_CONFLICT,
+			content=JobResponse(
+				status=StatusResponse(
+					status="error",
+					message="Job not found" if job is None else f"Job {job.status}, there are no results to fetch"
+				),
+				job=job.to_dict() if job else None
+			).model_dump()
+		)
+
+	path = job_manager.result_path(job_id)
+	if accept_encoding and "gzip" in accept_encoding.lower():
+		return FileResponse(path, media_type="application/x-ndjson", headers={"Content-Encoding": "gzip"})
+
+	async def body() -> AsyncGenerator[bytes, None]:
+		spool = await run_in_threadpool(gzip.open, path, "rb")
+		try:
+			while chunk := await run_in_threadpool(spool.read, 256 * 1024):
+				yield chunk
+		finally:
+			spool.close()
+
+	return StreamingResponse(body(), media_type="application/x-ndjson")
+
+# Cancels the job if it is still queued or running and deletes its results
+@router.delete("/jobs/{job_id}", response_model=JobResponse, status_code=status.HTTP_200_OK)
+async def delete_job(job_id: str, response: Response) -> JobResponse:
+	if not job_manager.delete(job_id):
+		response.status_code = status.HTTP_404_NOT_FOUND
+		return JobResponse(
+			status=StatusResponse(
+				status="error",
+				message="Job not found"
+			)
+		)
+	return JobResponse(
+		status=StatusResponse(
+			status="success",
+			message="Job deleted"
+		)
+	)
@@ -1,7 +1,12 @@
-from utils.db import get_cursor, get_timestamp
+from utils.db import get_async_cursor, execute_prepared, get_timestamp, is_timeout, with_max_execution_time
 from utils.serialization import query_output_to_table
 from utils.auth import check_user
 from utils.generators import generate_update_query
+from utils.arrow import wants_arrow
+from utils.pagination import fetch_saved_table_page, validate_page_size
+from utils.result_cache import result_cache
+from utils.constants import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, USER_DATA_TIMEOUT
+from routers.query import arrow_query_response
 from classes.http import StatusResponse, Table, UpdateQueryParams
 from classes.queries.update import UpdateQuery
 from classes.metadata import metadata
@@ -9,8 +14,12 @@ from classes.metadata import metadata
 
 from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, Header, status, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import mysql.connector
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -22,7 +31,7 @@ class SaveTableRequest(BaseModel):
 class SaveTableResponse(BaseModel):
 	details: StatusResponse
 @router.post("/save_table", response_model=SaveTableResponse, status_code=status.HTTP_201_CREATED)
-def save_table(req: SaveTableRequest, response: Response, authorization: Optional[str] = Header(None)):
+async def save_table(req: SaveTableRequest, response: Response, authorization: Optional[str] = Header(None)):
 	# Check the authentication of the user
 	user_id, username, error = check_user(authorization)
 	if error:
@@ -49,11 +58,11 @@ def save_table(req: SaveTableRequest, response: Response, authorization: Optiona
 	
 	# Execute the stored procedure to create the table (this checks if the table already exists as well)
 	created_at = get_timestamp()
-	with get_cursor() as cur:
+	async with get_async_cursor() as cur:
 		try:
-			cur.callproc("save_user_table", [user_id, username, table_name, created_at, query])
+			await cur.callproc("save_user_table", [user_id, username, table_name, created_at, query])
 		except mysql.connector.IntegrityError as e:
-			print(e)
+			logger.info("Table %s already exists for user %s: %s", table_name, username, e)
 			response.status_code = status.HTTP_409_CONFLICT
 			return SaveTableResponse(
 				details=StatusResponse(
@@ -62,7 +71,7 @@ def save_table(req: SaveTableRequest, response: Response, authorization: Optiona
 				)
 			)
 		except mysql.connector.Error as e:
-			print(e)
+			logger.error("Failed to save table %s for user %s: %s", table_name, username, e)
 			response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
 			return SaveTableResponse(
 				details=StatusResponse(
@@ -71,9 +80,9 @@ def save_table(req: SaveTableRequest, response: Response, authorization: Optiona
 				)
 			)
 		
-	# After we save the table, we need to update metadata to include the new table
+	# After we save the table, we need to update metadata (in every worker) to include the new table
 	full_table_name = f"u_{username}_{table_name}"
-	metadata.add_table(full_table_name)
+	await run_in_threadpool(metadata.add_table, full_table_name)
 		
 	return SaveTableResponse(
 		details=StatusResponse(
@@ -88,9 +97,9 @@ class DeleteTableResponse(BaseModel):
 	details: StatusResponse
 	deleted_tables: list[str] | None = None
 @router.post("/delete_table", response_model=DeleteTableResponse, status_code=status.HTTP_200_OK)
-def drop_table(req: DeleteTableRequest, response: Response, authorization: Optional[str] = Header(None)):
+async def drop_table(req: DeleteTableRequest, response: Response, authorization: Optional[str] = Header(None)):
 	# Check the authentication of the user
-	user_id, _, error = check_user(authorization)
+	user_id, username, error = check_user(authorization)
 	if error:
 		response.status_code = status.HTTP_401_UNAUTHORIZED
 		return DeleteTableResponse(
@@ -125,7 +134,7 @@ def drop_table(req: DeleteTableRequest, response: Response, authorization: Optio
 		)
 	
 	# Execute the query to delete the entries from the user_tables table, which triggers insertion into tables_to_drop
-	with get_cursor("sqlmate") as cur:
+	async with get_async_cursor("sqlmate") as cur:
 		try:
 			for table_name in table_names:
 				if not table_name:
@@ -136,9 +145,9 @@ def drop_table(req: DeleteTableRequest, response: Response, authorization: Optio
 							message="Invalid table name"
 						)
 					)
-				cur.execute("DELETE FROM user_tables WHERE user_id = %s AND table_name = %s", (user_id, table_name))
+				await cur.execute("DELETE FROM user_tables WHERE user_id = %s AND table_name = %s", (user_id, table_name))
 		except mysql.connector.Error as e:
-			print(e)
+			logger.error("Failed to mark tables of user %s for deletion: %s", username, e)
 			response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
 			return DeleteTableResponse(
 				details=StatusResponse(
@@ -148,11 +157,12 @@ def drop_table(req: DeleteTableRequest, response: Response, authorization: Optio
 			)
 	
 	# Execute the stored procedure to drop the tables that were marked for deletion in the previous step
-	with get_cursor("sqlmate") as cur:
+	full_table_names = [f"u_{username}_{table_name}" for table_name in table_names]
+	async with get_async_cursor("sqlmate") as cur:
 		try:
-			cur.callproc("process_tables_to_drop")
+			await cur.callproc("process_tables_to_drop")
 		except mysql.connector.Error as e:
-			print(e)
+			logger.error("Failed to drop tables of user %s: %s", username, e)
 			response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
 			return DeleteTableResponse(
 				details=StatusResponse(
@@ -160,6 +170,10 @@ def drop_table(req: DeleteTableRequest, response: Response, authorization: Optio
 					message="Failed to drop table"
 				)
 			)
+
+	# Forget the dropped tables (and their cached results) in every worker, so they don't accumulate there
+	result_cache.invalidate(full_table_names)
+	await run_in_threadpool(metadata.drop_tables, full_table_names)
 	
 	return DeleteTableResponse(
 		details=StatusResponse(
@@ -173,7 +187,7 @@ class GetTablesReponse(BaseModel):
 	details: StatusResponse
 	tables: List[Dict[str, Any]] | None = None
 @router.get("/get_tables", response_model=GetTablesReponse, status_code=status.HTTP_200_OK)
-def get_tables(response: Response, authorization: Optional[str] = Header(None)) -> GetTablesReponse:
+async def get_tables(response: Response, authorization: Optional[str] = Header(None)) -> GetTablesReponse:
 	# Check the authentication of the user
 	user_id, username, error = check_user(authorization)
 	if error:
@@ -186,12 +200,12 @@ def get_tables(response: Response, authorization: Optional[str] = Header(None))
 		)
 
 	rows = []
-	with get_cursor("sqlmate") as cur:
+	async with get_async_cursor("sqlmate") as cur:
 		try:
-			cur.execute("SELECT table_name, created_at FROM user_tables WHERE user_id = %s", (user_id,))
-			rows: List[Any] = cur.fetchall()
+			await cur.execute("SELECT table_name, created_at FROM user_tables WHERE user_id = %s", (user_id,))
+			rows: List[Any] = await cur.fetchall()
 		except mysql.connector.Error as e:
-			print(e)
+			logger.error("Failed to get tables of user %s: %s", username, e)
 			return GetTablesReponse(
 				details=StatusResponse(
 					status="error",
@@ -218,8 +232,9 @@ def get_tables(response: Response, authorization: Optional[str] = Header(None))
 class GetTableDataResponse(BaseModel):
 	status: StatusResponse
 	table: Table | None = None
+	next_page_token: str | None = None
 @router.get("/get_table_data", response_model=GetTableDataResponse, status_code=status.HTTP_200_OK)
-def get_table_data(table_name: str, response: Response, authorization: Optional[str] = Header(None)) -> GetTableDataResponse:
+async def get_table_data(table_name: str, response: Response, page_size: Optional[int] = None, page_token: Optional[str] = None, authorization: Optional[str] = Header(None), accept: Optional[str] = Header(None)) -> GetTableDataResponse | Response:
 	# Check the authentication of the user
 	user_id, username, error = check_user(authorization)
 	if error:
@@ -242,27 +257,55 @@ def get_table_data(table_name: str, response: Response, authorization: Optional[
 	
 	formatted_table_name = f"u_{username}_{table_name}"
 	query = f"SELECT * FROM {formatted_table_name};"
-	with get_cursor("sqlmate") as cur:
+	if wants_arrow(accept):
+		return await arrow_query_response(query.rstrip(";"), (), query, 1, "sqlmate")
+
+	# Large saved tables can be read one page at a time instead of all at once
+	next_page_token = None
+	if page_size is not None or page_token is not None:
 		try:
-			cur.execute(query)
-			rows: List[Any] = cur.fetchall()
-			if cur.description is None:
-				return GetTableDataResponse(
-					status=StatusResponse(
-						status="error",
-						message="No data found"
-					)
+			page = await fetch_saved_table_page(formatted_table_name, validate_page_size(page_size, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX), page_token, USER_DATA_TIMEOUT)
+			rows, column_names, next_page_token = page.rows, page.column_names, page.next_page_token
+		except ValueError as e:
+			logger.info("Invalid page request for table %s: %s", formatted_table_name, e)
+			response.status_code = status.HTTP_400_BAD_REQUEST
+			return GetTableDataResponse(
+				status=StatusResponse(
+					status="error",
+					message=str(e)
 				)
-			column_names: List[str] = [i[0] for i in cur.description]
+			)
 		except mysql.connector.Error as e:
-			print(e)
-			response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+			logger.error("Failed to get a page of table %s: %s", formatted_table_name, e)
+			response.status_code = status.HTTP_504_GATEWAY_TIMEOUT if is_timeout(e) else status.HTTP_500_INTERNAL_SERVER_ERROR
 			return GetTableDataResponse(
 				status=StatusResponse(
 					status="error",
-					message="Failed to get table data"
+					message="Query timed out" if is_timeout(e) else "Failed to get table data"
 				)
 			)
+	else:
+		async with get_async_cursor("sqlmate") as cur:
+			try:
+				await cur.execute(with_max_execution_time(query, USER_DATA_TIMEOUT))
+				rows: List[Any] = await cur.fetchall()
+				if cur.description is None:
+					return GetTableDataResponse(
+						status=StatusResponse(
+							status="error",
+							message="No data found"
+						)
+					)
+				column_names: List[str] = [i[0] for i in cur.description]
+			except mysql.connector.Error as e:
+				logger.error("Failed to get table %s: %s", formatted_table_name, e)
+				response.status_code = status.HTTP_504_GATEWAY_TIMEOUT if is_timeout(e) else status.HTTP_500_INTERNAL_SERVER_ERROR
+				return GetTableDataResponse(
+					status=StatusResponse(
+						status="error",
+						message="Query timed out" if is_timeout(e) else "Failed to get table data"
+					)
+				)
 	if not rows:
 		response.status_code = status.HTTP_404_NOT_FOUND
 		return GetTableDataResponse(
@@ -279,7 +322,8 @@ def get_table_data(table_name: str, response: Response, authorization: Optional[
 			status="success",
 			message="Table data retrieved successfully"
 		),
-		table=table
+		table=table,
+		next_page_token=next_page_token
 	)
 
 class UpdateTableRequest(BaseModel):
@@ -288,7 +332,7 @@ class UpdateTableResponse(BaseModel):
 	status: StatusResponse
 	rows_affected: int | None = None
 @router.post("/update_table", response_model=UpdateTableResponse, status_code=status.HTTP_200_OK)
-def update(req: UpdateTableRequest, response: Response, authorization: Optional[str] = Header(None)):
+async def update(req: UpdateTableRequest, response: Response, authorization: Optional[str] = Header(None)):
 	# Check the authentication of the user
 	user_id, username, error = check_user(authorization)
 	if error:
@@ -300,13 +344,13 @@ def update(req: UpdateTableRequest, response: Response, authorization: Optional[
 			)
 		)
 	
-	print(f"User {username} is updating a table with query: {req.query_params}")
+	logger.info("User %s is updating a table with query: %s", username, req.query_params)
 
 	# Validate the input data
 	try:
 		query = UpdateQuery(req.query_params, username)
 	except ValueError as e:
-		print("Here:", e)
+		logger.info("Invalid update query from user %s: %s", username, e)
 		return UpdateTableResponse(
 			status=StatusResponse(
 				status="error",
@@ -315,7 +359,7 @@ def update(req: UpdateTableRequest, response: Response, authorization: Optional[
 		)
 
 
-	query_body = generate_update_query(query)
+	query_body, params = generate_update_query(query)
 	# with open("logs/update_log.txt", "w") as f:
 	#     f.write(query_body)
 
@@ -328,18 +372,19 @@ def update(req: UpdateTableRequest, response: Response, authorization: Optional[
 		)
 	
 	try:
-		with get_cursor("sqlmate") as cursor:
-			cursor.execute(query_body)
+		async with execute_prepared(query_body, params, "sqlmate", USER_DATA_TIMEOUT) as cursor:
 			result = cursor.rowcount
 	except mysql.connector.Error as e:
-		print(e)
+		logger.error("Failed to update table %s: %s", query.table_name, e)
 		return UpdateTableResponse(
 			status=StatusResponse(
 				status="error",
-				message="Failed to update table"
+				message="Update timed out" if is_timeout(e) else "Failed to update table"
 			)
 		)
 
+	# Drops the table's cached results in every worker
+	await run_in_threadpool(metadata.update_table, query.table_name)
 	return UpdateTableResponse(
 		status=StatusResponse(
 			status="success",
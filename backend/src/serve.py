@@ -0,0 +1,242 @@
+# Production launcher: a pre-fork master that loads the metadata graph once, binds the listening socket and
+# forks the uvicorn workers, which share both. The workers inherit the loaded metadata copy-on-write instead of
+# each scanning INFORMATION_SCHEMA (the snapshot on disk is kept current as well), and keep it up to date
+# themselves afterwards (see Metadata.sync).
+#
+# Signals sent to the master:
+#   SIGHUP           rolling restart: revalidate the metadata, then replace the workers one at a time, each
+#                    only once its replacement has started up, so there is no moment without a worker
+#   SIGTERM, SIGINT  graceful shutdown: workers finish their in-flight requests and exit
+#
+# Usage (from backend/src): python serve.py --workers 4   (or `sqlmate serve`)
+from utils.constants import PORT, WORKERS, WORKER_READY_TIMEOUT, WORKER_SHUTDOWN_TIMEOUT, FORWARDED_ALLOW_IPS
+from utils.db import pools
+from utils.log import configure_logging
+from classes.metadata import metadata
+
+from typing import Dict, List, Optional
+import argparse
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+configure_logging()
+logger = logging.getLogger("serve")
+
+# A worker exiting sooner than this after being started is treated as crashing on startup
+MIN_WORKER_UPTIME = 5.0
+
+
+# Tells the master over a pipe once the app's startup (lifespan) has finished and it is accepting connections
+class WorkerServer(uvicorn.Server):
+    def __init__(self, config: uvicorn.Config, ready_fd: int) -> None:
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        await super().startup(sockets=sockets)
+        try:
+            if not self.should_exit:
+                os.write(self.ready_fd, b"1")
+        except BrokenPipeError:
+            pass  # Only rolling restarts wait for this
+        finally:
+            os.close(self.ready_fd)
+
+
+class Master:
+    def __init__(self, workers: int, host: str, port: int) -> None:
+        self.num_workers = workers
+        self.host = host
+        self.port = port
+        self.socket: Optional[socket.socket] = None
+        self.workers: Dict[int, float] = {}  # pid -> started at
+        self.shutting_down = False
+        self.restart_requested = False
+
+    def run(self) -> None:
+        self.load_metadata()
+        self.socket = socket.create_server((self.host, self.port), backlog=2048)
+        self.socket.set_inheritable(True)
+
+        signal.signal(signal.SIGTERM, self.handle_shutdown)
+        signal.signal(signal.SIGINT, self.handle_shutdown)
+        signal.signal(signal.SIGHUP, self.handle_restart)
+
+        logger.info("Starting %d workers on %s:%d", self.num_workers, self.host, self.port)
+        for _ in range(self.num_workers):
+            self.spawn()
+
+        while not self.shutting_down:
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            self.reap(respawn=True)
+            time.sleep(0.5)
+
+        self.stop()
+
+    def handle_shutdown(self, signum: int, _) -> None:
+        self.shutting_down = True
+
+    def handle_restart(self, signum: int, _) -> None:
+        self.restart_requested = True
+
+    # Loads (or revalidates) the metadata in the master, so forked workers start with it. The connections
+    # used for that are closed again, a connection must never be shared between processes.
+    def load_metadata(self) -> None:
+        try:
+            if metadata.loaded.is_set():
+                metadata.revalidate()
+            else:
+                metadata.initialize(background_revalidate=False)
+            logger.info("Metadata ready for the workers: %d tables, schema version %d", len(metadata.col_types), metadata.schema_version)
+        except Exception as e:
+            # The workers load it themselves once the database is reachable
+            logger.warning("Failed to load metadata in the master, workers will load it themselves: %s", e)
+        finally:
+            for pool in pools.values():
+                pool.close()
+
+    # Forks a worker and returns its pid. With wait_ready, a worker that does not start up within
+    # WORKER_READY_TIMEOUT is stopped again and None is returned.
+    def spawn(self, wait_ready: bool = False) -> Optional[int]:
+        read_fd, write_fd = os.pipe()
+        # Objects that exist now are never collected in the workers, so the GC doesn't write to (and copy)
+        # every page of the shared metadata
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self.run_worker(write_fd)
+            os._exit(0)
+
+        os.close(write_fd)
+        self.workers[pid] = time.monotonic()
+        ready = self.wait_ready(read_fd) if wait_ready else True
+        os.close(read_fd)
+        if not ready:
+            logger.error("Worker %d did not start within %ss", pid, WORKER_READY_TIMEOUT)
+            self.terminate(pid)
+            return None
+        return pid
+
+    def run_worker(self, ready_fd: int) -> None:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        try:
+            # The app is imported in the worker, so a rolling restart picks up changes to the app and the routers.
+            # Modules the master imported (utils.constants, utils.db, classes.metadata and their imports) are
+            # inherited as they are, changes to those or to the environment need a full restart.
+            config = uvicorn.Config(
+                "app:app", timeout_graceful_shutdown=WORKER_SHUTDOWN_TIMEOUT, log_config=None,
+                proxy_headers=True, forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+            )
+            WorkerServer(config, ready_fd).run(sockets=[self.socket])
+        except BaseException as e:
+            logger.exception("Worker %d failed: %s", os.getpid(), e)
+            os._exit(1)
+
+    def wait_ready(self, read_fd: int) -> bool:
+        deadline = time.monotonic() + WORKER_READY_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([read_fd], [], [], min(remaining, 1.0))
+            if readable:
+                return os.read(read_fd, 1) == b"1"
+
+    # Collects exited workers, replacing them unless we are shutting down
+    def reap(self, respawn: bool) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            started_at = self.workers.pop(pid, None)
+            if started_at is None:
+                continue
+            logger.warning("Worker %d exited with status %d", pid, os.waitstatus_to_exitcode(status))
+            if respawn and not self.shutting_down:
+                if time.monotonic() - started_at < MIN_WORKER_UPTIME:
+                    # Don't fork in a tight loop while every worker dies on startup (e.g. a bad deploy)
+                    time.sleep(MIN_WORKER_UPTIME)
+                self.spawn()
+
+    def rolling_restart(self) -> None:
+        logger.info("Rolling restart of %d workers", len(self.workers))
+        self.load_metadata()
+        for old_pid in list(self.workers):
+            if self.shutting_down:
+                return
+            new_pid = self.spawn(wait_ready=True)
+            if new_pid is None:
+                # Keep the old workers serving rather than replacing them with ones that don't start
+                logger.error("Rolling restart aborted, old workers keep running")
+                return
+            self.terminate(old_pid)
+            logger.info("Replaced worker %d with %d", old_pid, new_pid)
+
+    # Asks a worker to shut down gracefully and waits for it, killing it if it takes too long
+    def terminate(self, pid: Optional[int]) -> None:
+        if pid is None or pid not in self.workers:
+            return
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT + 5
+        while time.monotonic() < deadline:
+            try:
+                finished, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if finished:
+                break
+            time.sleep(0.1)
+        else:
+            logger.warning("Worker %d did not shut down in time, killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.pop(pid, None)
+
+    def stop(self) -> None:
+        logger.info("Shutting down %d workers", len(self.workers))
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.workers):
+            self.terminate(pid)
+        if self.socket is not None:
+            self.socket.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the SQLMate API with multiple worker processes")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"Number of worker processes (default: {WORKERS})")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    Master(args.workers, args.host, args.port).run()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
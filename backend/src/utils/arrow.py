@@ -0,0 +1,85 @@
+from .serialization import json_default
+from mysql.connector.constants import FieldType
+from typing import Any, AsyncGenerator, List, Optional, Sequence
+from decimal import Decimal
+import io
+import json
+
+# pyarrow is optional, without it the Arrow response format is simply not offered
+try:
+	import pyarrow as pa
+except ImportError:
+	pa = None
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def arrow_available() -> bool:
+	return pa is not None
+
+def wants_arrow(accept: Optional[str]) -> bool:
+	return bool(accept) and ARROW_STREAM_MEDIA_TYPE in accept.lower()
+
+# Maps the MySQL column types from cursor.description to Arrow types. Decimals become float64
+# since the connector doesn't report their precision, and anything unusual is sent as a string.
+def arrow_type(type_code: int) -> Any:
+	if type_code in (FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.INT24, FieldType.LONGLONG, FieldType.YEAR, FieldType.BIT):
+		return pa.int64()
+	if type_code in (FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL, FieldType.NEWDECIMAL):
+		return pa.float64()
+	if type_code in (FieldType.DATE, FieldType.NEWDATE):
+		return pa.date32()
+	if type_code in (FieldType.DATETIME, FieldType.TIMESTAMP):
+		return pa.timestamp("us")
+	if type_code == FieldType.TIME:
+		return pa.duration("us")
+	if type_code == FieldType.NULL:
+		return pa.null()
+	return pa.string()
+
+def arrow_schema(description: List[Any], column_names: List[str]) -> Any:
+	return pa.schema([pa.field(name, arrow_type(column[1])) for name, column in zip(column_names, description)])
+
+def to_arrow_value(value: Any, arrow_type: Any) -> Any:
+	if value is None:
+		return None
+	if isinstance(value, Decimal):
+		return float(value)
+	if isinstance(value, bytearray) and arrow_type == pa.int64():
+		return int.from_bytes(value, "big")  # BIT columns
+	if arrow_type == pa.string() and not isinstance(value, str):
+		return value.decode("utf-8", errors="replace") if isinstance(value, (bytes, bytearray)) else json.dumps(value, default=json_default)
+	return value
+
+# Most columns hold values pyarrow converts natively (ints, floats, dates, datetimes, timedeltas, str), so the whole
+# column is handed to pa.array as is. Only a column it rejects goes through to_arrow_value value by value:
+# DECIMAL columns (Decimal), BIT columns (bytearray) and strings that are bytes, sets or JSON.
+def column_to_array(column: Sequence[Any], arrow_type: Any) -> Any:
+	try:
+		return pa.array(column, type=arrow_type)
+	except (pa.ArrowInvalid, pa.ArrowTypeError):
+		return pa.array([to_arrow_value(value, arrow_type) for value in column], type=arrow_type)
+
+# Builds one record batch from a chunk of rows, transposing them into columns
+def rows_to_record_batch(rows: List[Any], schema: Any) -> Any:
+	columns = list(zip(*rows)) if rows else [() for _ in schema]
+	arrays = [column_to_array(column, field.type) for column, field in zip(columns, schema)]
+	return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+# Encodes an Arrow IPC stream incrementally: the schema message first, then one message per chunk of rows
+async def arrow_stream(schema: Any, chunks: AsyncGenerator[List[Any], None]) -> AsyncGenerator[bytes, None]:
+	sink = io.BytesIO()
+	writer = pa.ipc.new_stream(sink, schema)
+
+	def drain() -> bytes:
+		data = sink.getvalue()
+		sink.seek(0)
+		sink.truncate(0)
+		return data
+
+	yield drain()
+	async for rows in chunks:
+		writer.write_batch(rows_to_record_batch(rows, schema))
+		yield drain()
+	writer.close()
+	yield drain()
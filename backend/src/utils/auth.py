@@ -1,18 +1,24 @@
-from .constants import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_DAYS
-from datetime import datetime, timedelta
-from typing import Tuple, Dict
+from .constants import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_DAYS, TOKEN_CACHE_SIZE, BCRYPT_ROUNDS
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Tuple, Dict, Optional
 import bcrypt
+import hashlib
+import threading
+import time
 import jwt
 
-def hash_password(password: str) -> str:
-	return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# bcrypt is CPU bound, the routers call these through utils.passwords.password_hasher
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+	return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
 
 def check_password(password: str, hashed_password: str) -> bool:
 	return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def create_access_token(data: Dict) -> str:
 	to_encode = data.copy()
-	to_encode.update({"exp": datetime.now() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)})
+	now = datetime.now(timezone.utc)
+	to_encode.update({"iat": now, "exp": now + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)})
 	if SECRET_KEY is None:
 		raise ValueError("SECRET_KEY cannot be None")
 	return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
@@ -24,30 +30,134 @@ def get_token(authorization: str | None) -> str:
 		return ""
 	return authorization.split(" ")[1]
 
-# Return (user_id, error_msg)
-def check_user(token: str | None) -> Tuple[str, str, str]:
-	if not token:
+def token_digest(token: str) -> str:
+	return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+# Thread-safe LRU of tokens whose signature has already been verified, keyed by the token's digest so
+# the tokens themselves are not kept around. An entry is only served until the token's exp and is
+# dropped as soon as the token, or every token of its user, is revoked.
+#
+# Revocations are kept until the tokens they cover would have expired: tokens revoked by logout, and for
+# deleted users the time of deletion, which rejects every token issued (iat) before it. They are shared
+# with the other workers through utils.revocations, which also applies theirs here.
+class TokenCache:
+	def __init__(self, max_size: int) -> None:
+		self.max_size = max_size
+		self._entries: OrderedDict[str, Tuple[Any, str, float]] = OrderedDict()  # digest -> (user_id, username, exp)
+		self._revoked_tokens: Dict[str, float] = {}  # digest -> exp
+		self._revoked_users: Dict[Any, float] = {}  # user_id -> revoked at
+		self._lock = threading.Lock()
+		self.hits: int = 0
+		self.misses: int = 0
+		self.rejections: int = 0
+
+	def get(self, digest: str) -> Optional[Tuple[Any, str]]:
+		with self._lock:
+			entry = self._entries.get(digest)
+			if entry is None:
+				self.misses += 1
+				return None
+			user_id, username, exp = entry
+			if time.time() >= exp:
+				del self._entries[digest]
+				self.misses += 1
+				return None
+			self._entries.move_to_end(digest)
+			self.hits += 1
+			return user_id, username
+
+	# Caches a freshly verified token unless it has been revoked, which is checked under the same lock
+	# so a revocation racing with the verification can not be cached over
+	def admit(self, digest: str, user_id: Any, username: str, iat: float, exp: float) -> bool:
+		with self._lock:
+			if digest in self._revoked_tokens or iat <= self._revoked_users.get(user_id, -1):
+				self.rejections += 1
+				return False
+			if self.max_size > 0:
+				self._entries[digest] = (user_id, username, exp)
+				self._entries.move_to_end(digest)
+				while len(self._entries) > self.max_size:
+					self._entries.popitem(last=False)
+			return True
+
+	def revoke_token(self, digest: str, exp: float) -> None:
+		with self._lock:
+			self._entries.pop(digest, None)
+			self._revoked_tokens[digest] = exp
+			self._prune()
+
+	def revoke_user(self, user_id: Any, revoked_at: float) -> None:
+		with self._lock:
+			for digest in [digest for digest, entry in self._entries.items() if entry[0] == user_id]:
+				del self._entries[digest]
+			self._revoked_users[user_id] = max(revoked_at, self._revoked_users.get(user_id, revoked_at))
+			self._prune()
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			total = self.hits + self.misses
+			return {
+				"size": len(self._entries),
+				"max_size": self.max_size,
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": round(self.hits / total, 4) if total else 0.0,
+				"rejections": self.rejections,
+				"revoked_tokens": len(self._revoked_tokens),
+				"revoked_users": len(self._revoked_users),
+			}
+
+	# Revocations only matter until the tokens they cover would have expired anyway
+	def _prune(self) -> None:
+		now = time.time()
+		for digest in [digest for digest, exp in self._revoked_tokens.items() if exp <= now]:
+			del self._revoked_tokens[digest]
+		oldest = now - timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS).total_seconds()
+		for user_id in [user_id for user_id, revoked_at in self._revoked_users.items() if revoked_at < oldest]:
+			del self._revoked_users[user_id]
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
+# Return (user_id, username, error_msg), authorization is the whole Authorization header
+def check_user(authorization: str | None) -> Tuple[str, str, str]:
+	if not authorization:
 		return "", "", "Token is missing"
 	
-	if not token.startswith("Bearer "):
+	if not authorization.startswith("Bearer "):
 		return "", "", "Invalid token format"
 	
-	token = token.split(" ")[1]
+	token = authorization.split(" ")[1]
+	digest = token_digest(token)
+	cached = token_cache.get(digest)
+	if cached is not None:
+		return cached[0], cached[1], ""
+
 	try:
 		payload = verify_and_decode_token(token)
-		user_id = payload.get("id")
-		username = payload.get("username")
-		if not user_id or not username:
-			return "", "", "Invalid token payload"
-		return user_id, username, ""
 	except Exception as _:
 		return "", "", "Invalid token"
+	user_id = payload.get("id")
+	username = payload.get("username")
+	if not user_id or not username:
+		return "", "", "Invalid token payload"
+
+	# Tokens issued before iat was added to the payload are treated as issued at the epoch
+	if not token_cache.admit(digest, user_id, username, payload.get("iat", 0), payload["exp"]):
+		return "", "", "Token has been revoked"
+	return user_id, username, ""
 
 def verify_and_decode_token(token: str) -> dict:
 		try:
 			if SECRET_KEY is None:
 				raise ValueError("SECRET_KEY cannot be None")
-			payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+			payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp"]})
 			return payload
 		except jwt.ExpiredSignatureError:
 			raise Exception("Token has expired")
@@ -8,10 +8,38 @@ load_dotenv(ENV_PATH if os.path.exists(ENV_PATH) else 'secrets.env')
 # Port
 PORT = int(os.getenv("PORT", 8080))
 
+# Worker processes started by serve.py (`sqlmate serve`). Every worker has its own connection pools (four of up to
+# DB_POOL_MAX_SIZE connections each), so the workers together must fit within MySQL's max_connections.
+WORKERS = int(os.getenv("WORKERS", os.cpu_count() or 1))
+WORKER_READY_TIMEOUT = float(os.getenv("WORKER_READY_TIMEOUT", 60))  # Seconds a new worker gets to start up during a rolling restart
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", 30))  # Seconds a worker gets to finish in-flight requests
+
 # JWT configuration
 SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))  # Verified tokens kept so hot tokens skip signature checks, 0 disables
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", 1))  # Seconds between checks for tokens revoked by other workers, 0 disables
+
+# Password hashing
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))  # bcrypt work factor of new hashes, each step doubles the cost
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", 2))  # Processes doing bcrypt work, 0 runs it on the threadpool
+PASSWORD_QUEUE_SIZE = int(os.getenv("PASSWORD_QUEUE_SIZE", 32))  # Hashes/checks queued or running before new ones are refused
+
+# User records cached for /auth/login and /auth/me
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))  # 0 disables the cache
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))  # Seconds a record is served for, bounds how stale other workers can be
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", 5))  # Seconds a username is known not to exist, bounds how long another worker rejects a new account
+
+# Login rate limiting, token buckets refilled at the rate (attempts per second) up to the burst (0 disables)
+LOGIN_RATE_PER_IP = float(os.getenv("LOGIN_RATE_PER_IP", 1))  # Every attempt from the same client IP
+LOGIN_BURST_PER_IP = int(os.getenv("LOGIN_BURST_PER_IP", 20))
+LOGIN_RATE_PER_USERNAME = float(os.getenv("LOGIN_RATE_PER_USERNAME", 0.1))  # Failed attempts for the same username
+LOGIN_BURST_PER_USERNAME = int(os.getenv("LOGIN_BURST_PER_USERNAME", 5))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))  # Buckets kept per limiter
+# Reverse proxies (addresses or CIDR ranges, comma separated) whose X-Forwarded-For is used as the client address,
+# which the per IP limit is keyed on. Never "*": the first address in the header is whatever the client sent.
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
 
 # DB configuration
 DB_HOST = os.getenv("DB_HOST")
@@ -19,3 +47,59 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 
+# Connection pool configuration (applies to both the "user" and "sqlmate" pools)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", 1800))  # Seconds before a connection is replaced
+DB_POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", 30))  # Idle seconds before a checkout health-check
+
+# Compiled-query cache configuration
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))  # Max number of distinct query shapes kept
+
+# Server-side prepared statements kept open per pooled connection
+PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("PREPARED_STATEMENT_CACHE_SIZE", 64))
+
+# Metadata snapshot, lets workers start without scanning INFORMATION_SCHEMA
+METADATA_SNAPSHOT_PATH = os.getenv("METADATA_SNAPSHOT_PATH", os.path.join(os.path.expanduser('~'), '.sqlmate', 'metadata_snapshot.json'))
+METADATA_SYNC_INTERVAL = float(os.getenv("METADATA_SYNC_INTERVAL", 2))  # Seconds between checks for schema changes made by other workers, 0 disables
+JOIN_PATH_CACHE_SIZE = int(os.getenv("JOIN_PATH_CACHE_SIZE", 128))  # Shortest-path trees (one per table queries join from) kept for join planning
+SCHEMA_CHANGE_LOG_SIZE = int(os.getenv("SCHEMA_CHANGE_LOG_SIZE", 10000))  # Entries kept in sqlmate.schema_changes
+
+# Streaming query results
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 1000))  # Rows fetched and sent per chunk
+
+# Paged query results
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 1000))  # Used when a page token is sent without a page size
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 10000))
+
+# Query result cache
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 60))  # Seconds a cached result is served for, 0 disables the cache
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", 4 * 1024 * 1024))  # Larger results are never cached
+
+# Query guardrails, based on the rows EXPLAIN estimates a query examines (0 turns a policy off)
+QUERY_REJECT_ROWS_EXAMINED = int(os.getenv("QUERY_REJECT_ROWS_EXAMINED", 50_000_000))  # Refuse to run the query
+QUERY_BACKGROUND_ROWS_EXAMINED = int(os.getenv("QUERY_BACKGROUND_ROWS_EXAMINED", 10_000_000))  # Run /query as a background job
+QUERY_LIMIT_ROWS_EXAMINED = int(os.getenv("QUERY_LIMIT_ROWS_EXAMINED", 1_000_000))  # Add a LIMIT of QUERY_AUTO_LIMIT rows
+QUERY_AUTO_LIMIT = int(os.getenv("QUERY_AUTO_LIMIT", 10000))
+QUERY_ESTIMATE_TTL = float(os.getenv("QUERY_ESTIMATE_TTL", 300))  # Seconds an estimate is reused for the same query shape
+
+# Background query jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # Jobs run at the same time (each holds one connection)
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 100))  # Jobs waiting to run before new ones are refused
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", os.path.join(os.path.expanduser('~'), '.sqlmate', 'jobs'))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", 3600))  # Seconds the results of a finished job are kept
+JOB_EXPIRY_INTERVAL = float(os.getenv("JOB_EXPIRY_INTERVAL", 60))  # Seconds between scans of the spool directory for expired jobs, 0 disables expiry
+
+# Statement timeouts in seconds, SELECTs get a MAX_EXECUTION_TIME hint and statements still running after that are killed (0 disables)
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", 30))  # /query JSON responses and pages
+QUERY_STREAM_TIMEOUT = float(os.getenv("QUERY_STREAM_TIMEOUT", 600))  # /query/stream and Arrow responses
+QUERY_JOB_TIMEOUT = float(os.getenv("QUERY_JOB_TIMEOUT", 3600))  # Background query jobs
+USER_DATA_TIMEOUT = float(os.getenv("USER_DATA_TIMEOUT", 30))  # Reading and updating saved tables
+
+# Logging and instrumentation
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text", or "json" for one JSON object per line
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")  # Send per-phase timings in a Server-Timing header
@@ -1,13 +1,23 @@
-from .constants import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
-from contextlib import contextmanager
-from typing import Generator, Any
+from .constants import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PING_INTERVAL, PREPARED_STATEMENT_CACHE_SIZE
+from .pool import ConnectionPool, AsyncConnectionPool
+from .metrics import timed
+from contextlib import contextmanager, asynccontextmanager
+from typing import Generator, AsyncGenerator, Any, Dict, Optional, Sequence
 from datetime import datetime
-from mysql.connector import connect
 from mysql.connector.abstracts import MySQLCursorAbstract
+from mysql.connector.aio.abstracts import MySQLCursorAbstract as AsyncMySQLCursorAbstract
+from mysql.connector.errors import OperationalError
+import anyio
+import asyncio
 import pytz
 from datetime import timedelta
 from abc import ABC, abstractmethod
 
+ER_QUERY_INTERRUPTED = 1317
+ER_QUERY_TIMEOUT = 3024
+# Extra time given to the server to enforce MAX_EXECUTION_TIME itself before the statement is killed from here
+STATEMENT_TIMEOUT_GRACE = 1.0
+
 class DBInterface(ABC):
     @abstractmethod
     def connect(self) -> Any:
@@ -56,22 +66,199 @@ sqlmate_db_config = {
 	"database": "sqlmate"
 }
 
+def create_pool(name: str, config: Dict[str, Any]) -> ConnectionPool:
+    return ConnectionPool(
+        name,
+        config,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        recycle=DB_POOL_RECYCLE,
+        ping_interval=DB_POOL_PING_INTERVAL
+    )
+
+def create_async_pool(name: str, config: Dict[str, Any]) -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        name,
+        config,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        recycle=DB_POOL_RECYCLE,
+        ping_interval=DB_POOL_PING_INTERVAL
+    )
+
+# Blocking pools, used outside of the request path (metadata loading, background work)
+pools: Dict[str, ConnectionPool] = {
+    "user": create_pool("user", user_db_config),
+    "sqlmate": create_pool("sqlmate", sqlmate_db_config)
+}
+
+# Asyncio pools, used by the routers
+async_pools: Dict[str, AsyncConnectionPool] = {
+    "user": create_async_pool("user", user_db_config),
+    "sqlmate": create_async_pool("sqlmate", sqlmate_db_config)
+}
+
 @contextmanager
 def get_cursor(whose: str = "user") -> Generator[MySQLCursorAbstract, None, None]:
-    db = (
-        connect(**user_db_config) if whose == "user"
-        else connect(**sqlmate_db_config)
-    )
-    cursor = db.cursor()
+    pool = pools["user"] if whose == "user" else pools["sqlmate"]
+    pooled = pool.acquire()
+    db = pooled.connection
+    discard = False
+    try:
+        cursor = db.cursor()
+    except Exception as e:
+        pool.release(pooled, discard=True)
+        raise e
     try:
         yield cursor
         db.commit()
     except Exception as e:
-        db.rollback()
+        try:
+            db.rollback()
+        except Exception as _:
+            discard = True
         raise e
     finally:
-        cursor.close()
-        db.close()
+        try:
+            # Never hand a connection with pending results to the next request
+            if db.unread_result:
+                db.consume_results()
+            cursor.close()
+        except Exception as _:
+            discard = True
+        pool.release(pooled, discard=discard)
+
+# Async version of get_cursor, the cursor's methods must be awaited
+@asynccontextmanager
+async def get_async_cursor(whose: str = "user") -> AsyncGenerator[AsyncMySQLCursorAbstract, None]:
+    pool = async_pools["user"] if whose == "user" else async_pools["sqlmate"]
+    with timed("acquire"):
+        pooled = await pool.acquire()
+    db = pooled.connection
+    discard = False
+    try:
+        cursor = await db.cursor()
+    except BaseException as e:
+        await pool.release(pooled, discard=True)
+        raise e
+    try:
+        yield cursor
+        await db.commit()
+    except BaseException as e:
+        # Also covers cancellation, in which case the connection may be mid-statement
+        with anyio.CancelScope(shield=True):
+            try:
+                if isinstance(e, Exception):
+                    await db.rollback()
+                else:
+                    discard = True
+                    await pool.kill_query(pooled)
+            except Exception as _:
+                discard = True
+        raise e
+    finally:
+        with anyio.CancelScope(shield=True):
+            try:
+                if not discard:
+                    if db.unread_result:
+                        await db.consume_results()
+                    await cursor.close()
+            except Exception as _:
+                discard = True
+            await pool.release(pooled, discard=discard)
+
+class QueryTimeoutError(OperationalError):
+    def __init__(self, timeout: float) -> None:
+        super().__init__(msg=f"Query timed out after {timeout:g}s", errno=ER_QUERY_TIMEOUT)
+
+# True for the errors MySQL raises when a statement runs past MAX_EXECUTION_TIME or is killed
+def is_timeout(error: Exception) -> bool:
+    return getattr(error, "errno", None) in (ER_QUERY_TIMEOUT, ER_QUERY_INTERRUPTED)
+
+# Adds a MAX_EXECUTION_TIME optimizer hint to a SELECT so the server aborts it by itself once it runs too long
+def with_max_execution_time(sql: str, timeout: Optional[float]) -> str:
+    stripped = sql.lstrip()
+    if not timeout or stripped[:6].upper() != "SELECT":
+        return sql
+    return f"SELECT /*+ MAX_EXECUTION_TIME({int(timeout * 1000)}) */{stripped[6:]}"
+
+# Executes sql as a server-side prepared statement and yields the cursor holding its result.
+# Statements are cached per pooled connection, so a query shape is only parsed and planned by MySQL
+# the first time it runs on a given connection.
+# With a timeout (in seconds), SELECTs carry a MAX_EXECUTION_TIME hint and any statement still running
+# shortly after the timeout is killed. A statement interrupted by cancellation (e.g. the client went away)
+# is killed as well, so the server doesn't keep working on a result nobody will read.
+@asynccontextmanager
+async def execute_prepared(sql: str, params: Sequence[Any], whose: str = "user", timeout: Optional[float] = None) -> AsyncGenerator[AsyncMySQLCursorAbstract, None]:
+    pool = async_pools["user"] if whose == "user" else async_pools["sqlmate"]
+    sql = with_max_execution_time(sql, timeout)
+    with timed("acquire"):
+        pooled = await pool.acquire()
+    db = pooled.connection
+    discard = False
+    cursor = None
+    try:
+        try:
+            with timed("execute"):
+                statement, cursor = await pooled.prepare(sql, PREPARED_STATEMENT_CACHE_SIZE)
+                if timeout:
+                    await asyncio.wait_for(cursor.execute(statement, tuple(params)), timeout + STATEMENT_TIMEOUT_GRACE)
+                else:
+                    await cursor.execute(statement, tuple(params))
+        except asyncio.TimeoutError:
+            discard = True
+            with anyio.CancelScope(shield=True):
+                await pool.kill_query(pooled)
+            raise QueryTimeoutError(timeout or 0)
+        except Exception as e:
+            # The statement may not have been prepared (e.g. syntax error), don't keep the cursor around
+            await pooled.forget(sql)
+            raise e
+        yield cursor
+        await db.commit()
+    except BaseException as e:
+        # Cleanup must finish even though the surrounding task may be getting cancelled
+        with anyio.CancelScope(shield=True):
+            try:
+                if discard:
+                    pass
+                elif isinstance(e, Exception):
+                    await db.rollback()
+                else:
+                    discard = True
+                    await pool.kill_query(pooled)
+            except Exception as _:
+                discard = True
+        raise e
+    finally:
+        with anyio.CancelScope(shield=True):
+            try:
+                # Drain what the caller didn't read, the cursor (and its statement) stays open for reuse
+                if not discard and cursor is not None and db.unread_result:
+                    await cursor.fetchall()
+            except Exception as _:
+                discard = True
+            await pool.release(pooled, discard=discard)
+
+# Opens min_size connections in each pool ahead of the first request
+async def warm_pools() -> None:
+    for pool in pools.values():
+        pool.fill()
+    for async_pool in async_pools.values():
+        await async_pool.fill()
+
+async def close_pools() -> None:
+    for pool in pools.values():
+        pool.close()
+    for async_pool in async_pools.values():
+        await async_pool.close()
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {name: pool.stats() for name, pool in pools.items()}
+    stats.update({f"{name}_async": pool.stats() for name, pool in async_pools.items()})
+    return stats
 
 
 def get_timestamp() -> str:
@@ -1,11 +1,56 @@
 from classes.queries.update import UpdateQuery
-from classes.queries.base import BaseQuery
-from classes.metadata import metadata
-from typing import List
+from classes.queries.base import BaseQuery, column_name, quote_alias, sort_direction
+from classes.metadata import metadata, Edge
+from classes.http import QueryParams
+from .query_cache import QueryCache, CompiledQuery, normalize_query_request
+from .pagination import Pager
+from .metrics import timed
+from .constants import QUERY_CACHE_SIZE
+from typing import Any, List, Optional, Tuple
 
+query_cache = QueryCache(QUERY_CACHE_SIZE)
 
-def generate_query(queries: List[BaseQuery], options: dict) -> str:
+# Returns the compiled query for the request along with the bind parameters for this call, only generating
+# the SQL when this query shape has not been seen since the metadata of the tables it selects from last changed
+def compile_query(query_params: List[QueryParams], options: dict) -> Tuple[CompiledQuery, Tuple[Any, ...]]:
+    key, values = normalize_query_request(query_params, options)
+    key = (key, metadata.get_table_versions(params.table for params in query_params))
+    version = metadata.version
+
+    compiled = query_cache.get(key, version)
+    if compiled is not None:
+        return compiled, compiled.bind(values)
+
+    with timed("build"):
+        queries: List[BaseQuery] = [BaseQuery(details) for details in query_params]
+    tables = [table_query.table_name for table_query in queries]
+    with timed("shortest_path"):
+        joins = metadata.plan_joins(tables)
+    with timed("generate"):
+        base_sql, params = generate_base_query(queries, joins)
+        order_by_clause, limit_clause = generate_ORDER_BY_clause(queries, options), generate_LIMIT_clause(options)
+        sql = base_sql + order_by_clause + limit_clause
+    param_specs = [
+        (table_query.table_name, details.get("attribute", ""), details.get("operator", ""))
+        for table_query, query_details in zip(queries, query_params)
+        for details in query_details.constraints or []
+    ]
+    limit = int(options["limit"]) if limit_clause else None
+    pager = Pager(base_sql, order_by_clause, get_keyset_columns(queries, options), limit)
+    tables += [edge.destination for edge in joins if edge.destination not in tables]
+    compiled = CompiledQuery(sql, param_specs, len(queries), pager, tables)
+    query_cache.put(key, compiled, version)
+    return compiled, tuple(params)
+
+def generate_query(queries: List[BaseQuery], options: dict) -> Tuple[str, List[Any]]:
+    query, params = generate_base_query(queries)
+    return query + generate_ORDER_BY_clause(queries, options) + generate_LIMIT_clause(options), params
+
+# Everything up to (and not including) the ORDER BY clause, which is the part paged queries wrap.
+# joins are the edges from metadata.plan_joins for these tables, planned here when not passed in.
+def generate_base_query(queries: List[BaseQuery], joins: Optional[List[Edge]] = None) -> Tuple[str, List[Any]]:
     query = ""
+    params: List[Any] = []
 
     select_clause = "SELECT "
     for table_query in queries:
@@ -17,18 +62,16 @@ def generate_query(queries: List[BaseQuery], options: dict) -> str:
     from_clause += queries[0].get_FROM_clause()
     query += from_clause + '\n'
 
-    join_clause = ""
-    for i in range(1, len(queries)):
-        temp_join_clause = f"{metadata.shortest_path(queries[i - 1].table_name, queries[i].table_name)} "
-        if len(temp_join_clause) == 1 and temp_join_clause == " ":
-            continue
-        join_clause += temp_join_clause
-    join_clause = join_clause[:-1]
+    if joins is None:
+        with timed("shortest_path"):
+            joins = metadata.plan_joins([table_query.table_name for table_query in queries])
+    join_clause = " ".join([edge.join_clause for edge in joins])
     query += join_clause + '\n' if join_clause else ""
 
     where_clause = "WHERE "
     for table_query in queries:
         where_clause += f"{table_query.get_WHERE_clause()}"
+        params += table_query.get_WHERE_params()
     if where_clause != "WHERE ":
         where_clause = where_clause[:-5]
         query += where_clause + '\n'
@@ -42,23 +85,62 @@ def generate_query(queries: List[BaseQuery], options: dict) -> str:
         group_by_clause = group_by_clause[:-1]
         query += group_by_clause + '\n'
 
+    return query, params
+
+def generate_ORDER_BY_clause(queries: List[BaseQuery], options: dict) -> str:
+    query = ""
     order_by_clause = "ORDER BY "
     if order_by_list := options.get("order_by"):
         for order_by in order_by_list:
             table_name, attr_name = order_by.get("table_name"), order_by.get("attribute")
-            order_by_clause += f"{lookup_alias(attr_name, table_name, queries)} {order_by.get('sort')},"
+            order_by_clause += f"{order_by_expression(attr_name, table_name, queries)} {sort_direction(order_by.get('sort'))},"
     if order_by_clause != "ORDER BY ":
         order_by_clause = order_by_clause[:-1]
         query += order_by_clause + '\n'
+    return query
 
+def generate_LIMIT_clause(options: dict) -> str:
+    query = ""
     limit_clause = "LIMIT "
     if limit := options.get("limit"):
-        limit_clause += f"{limit}"
+        try:
+            limit_clause += f"{int(limit)}"
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid limit: {limit}")
         query += limit_clause + '\n'
-    
     return query
 
-def generate_update_query(query: UpdateQuery):
+# Picks the result columns a paged query is ordered and seeked by: the requested ordering followed by
+# columns that make every row unique (the GROUP BY columns, or else the primary key of every table).
+# Returns None when those columns aren't all in the result, in which case the query is paged by offset.
+def get_keyset_columns(queries: List[BaseQuery], options: dict) -> Optional[List[Tuple[str, str]]]:
+    selected = {alias for query in queries for alias in query.alias_map.values()}
+    keys: List[Tuple[str, str]] = []
+    for order_by in options.get("order_by") or []:
+        alias = lookup_alias(order_by.get("attribute"), order_by.get("table_name"), queries)
+        direction = (order_by.get("sort") or "ASC").upper()
+        if alias not in selected or direction not in ("ASC", "DESC"):
+            return None
+        keys.append((alias, direction))
+
+    if any(query.group_by for query in queries):
+        unique_columns = [query.alias_map.get(column) for query in queries for column in query.group_by]
+    else:
+        unique_columns = []
+        for query in queries:
+            primary_key = metadata.get_primary_key(query.table_name)
+            if not primary_key or any(query.check_aggregation(f"{query.table_name}.{column}") for column in primary_key):
+                return None
+            unique_columns += [query.alias_map.get(f"{query.table_name}.{column}") for column in primary_key]
+
+    for alias in unique_columns:
+        if alias is None:
+            return None
+        if alias not in [column for column, _ in keys]:
+            keys.append((alias, "ASC"))
+    return keys
+
+def generate_update_query(query: UpdateQuery) -> Tuple[str, List[Any]]:
     update_query = ""
 
     update_clause = "UPDATE " + query.get_UPDATE_clause()
@@ -71,14 +153,18 @@ def generate_update_query(query: UpdateQuery):
     if where_clause != "WHERE ":
         where_clause = where_clause[:-5]
         update_query += where_clause
-    
-    update_query += ";"
 
-    return update_query
+    return update_query, query.get_SET_params() + query.get_WHERE_params()
+
+# The alias of the column when it is selected, the column itself otherwise
+def order_by_expression(attr_name: str, table_name: str, queries: List[BaseQuery]) -> str:
+    for query in queries:
+        if query.table_name == table_name and f'{table_name}.{attr_name}' in query.alias_map:
+            return quote_alias(query.alias_map[f'{table_name}.{attr_name}'])
+    return column_name(table_name, attr_name)
 
 def lookup_alias(attr_name: str, table_name: str, queries: List[BaseQuery]) -> str:
     for query in queries:
         if query.table_name == table_name:
-            print(query.alias_map)
             return query.alias_map.get(f'{table_name}.{attr_name}', attr_name)
     return attr_name
\ No newline at end of file
@@ -0,0 +1,131 @@
+from .db import get_async_cursor
+from .query_cache import CompiledQuery
+from .metrics import timed
+from .constants import QUERY_REJECT_ROWS_EXAMINED, QUERY_BACKGROUND_ROWS_EXAMINED, QUERY_LIMIT_ROWS_EXAMINED, QUERY_AUTO_LIMIT, QUERY_ESTIMATE_TTL
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import mysql.connector
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# What the optimizer expects a query to cost, from EXPLAIN FORMAT=JSON
+class QueryEstimate:
+	def __init__(self, rows_examined: float, cost: float) -> None:
+		self.rows_examined = rows_examined
+		self.cost = cost
+		self.estimated_at: float = time.monotonic()
+
+	def is_fresh(self, ttl: float) -> bool:
+		return time.monotonic() - self.estimated_at < ttl
+
+
+# The outcome of checking a query against the guardrails: "allow" runs it as it is, "limit" runs sql
+# (the query with a LIMIT added) instead, "background" runs it as a background job (see utils/jobs.py)
+# and "reject" refuses to run it, with message saying why
+class GuardrailDecision:
+	def __init__(self, action: str, sql: str, estimate: Optional[QueryEstimate] = None, message: str = "") -> None:
+		self.action = action
+		self.sql = sql
+		self.estimate = estimate
+		self.message = message
+
+
+# Counters for /stats/guardrails
+stats: Dict[str, int] = {"estimates": 0, "estimate_cache_hits": 0, "estimate_failures": 0, "allowed": 0, "limited": 0, "backgrounded": 0, "rejected": 0}
+
+
+# Estimates the query (re-using the estimate made for the same compiled query while it is fresh) and applies
+# the policies in order of severity. A query whose estimate fails is allowed, the guardrails never block a
+# query because EXPLAIN did not work. can_limit and can_background say which policies apply to the caller,
+# e.g. paged requests are already bounded by their page size and jobs are already running in the background.
+async def check_query(compiled: CompiledQuery, params: Tuple[Any, ...], can_limit: bool = True, can_background: bool = False) -> GuardrailDecision:
+	if not QUERY_REJECT_ROWS_EXAMINED and not QUERY_BACKGROUND_ROWS_EXAMINED and not QUERY_LIMIT_ROWS_EXAMINED:
+		return GuardrailDecision("allow", compiled.sql)
+
+	estimate = await get_estimate(compiled, params)
+	if estimate is None:
+		stats["allowed"] += 1
+		return GuardrailDecision("allow", compiled.sql)
+
+	rows_examined = round(estimate.rows_examined)
+	if QUERY_REJECT_ROWS_EXAMINED and rows_examined > QUERY_REJECT_ROWS_EXAMINED:
+		stats["rejected"] += 1
+		return GuardrailDecision(
+			"reject", compiled.sql, estimate,
+			f"Query is too expensive: it is estimated to examine {rows_examined:,} rows (the maximum is {QUERY_REJECT_ROWS_EXAMINED:,}). Add constraints to narrow it down."
+		)
+
+	if can_background and QUERY_BACKGROUND_ROWS_EXAMINED and rows_examined > QUERY_BACKGROUND_ROWS_EXAMINED:
+		stats["backgrounded"] += 1
+		return GuardrailDecision(
+			"background", compiled.sql, estimate,
+			f"The query is estimated to examine {rows_examined:,} rows, so it was started as a background job."
+		)
+
+	limit = compiled.pager.limit
+	if can_limit and QUERY_LIMIT_ROWS_EXAMINED and rows_examined > QUERY_LIMIT_ROWS_EXAMINED and (limit is None or limit > QUERY_AUTO_LIMIT):
+		stats["limited"] += 1
+		return GuardrailDecision(
+			"limit", f"{compiled.pager.base_sql}{compiled.pager.order_by}LIMIT {QUERY_AUTO_LIMIT}\n", estimate,
+			f"Results were limited to {QUERY_AUTO_LIMIT:,} rows because the query is estimated to examine {rows_examined:,} rows."
+		)
+
+	stats["allowed"] += 1
+	return GuardrailDecision("allow", compiled.sql, estimate)
+
+
+async def get_estimate(compiled: CompiledQuery, params: Tuple[Any, ...]) -> Optional[QueryEstimate]:
+	if compiled.estimate is not None and compiled.estimate.is_fresh(QUERY_ESTIMATE_TTL):
+		stats["estimate_cache_hits"] += 1
+		return compiled.estimate
+
+	try:
+		with timed("estimate"):
+			async with get_async_cursor() as cur:
+				await cur.execute(f"EXPLAIN FORMAT=JSON {compiled.sql}", params)
+				row: Any = await cur.fetchone()
+		estimate = parse_explain(json.loads(row[0]))
+	except (mysql.connector.Error, ValueError, TypeError, KeyError, IndexError) as e:
+		logger.warning("Failed to estimate query cost: %s", e)
+		stats["estimate_failures"] += 1
+		return None
+
+	stats["estimates"] += 1
+	compiled.estimate = estimate
+	return estimate
+
+
+# Sums the rows the plan examines. Tables in a nested loop are scanned once per row produced by the tables
+# joined before them, so each table's rows_examined_per_scan is weighted by the rows coming into it.
+def parse_explain(plan: Dict[str, Any]) -> QueryEstimate:
+	query_block = plan["query_block"]
+	cost = float(query_block.get("cost_info", {}).get("query_cost", 0))
+	return QueryEstimate(examined_rows(query_block), cost)
+
+def examined_rows(node: Any) -> float:
+	if isinstance(node, list):
+		return sum(examined_rows(item) for item in node)
+	if not isinstance(node, dict):
+		return 0.0
+
+	total = 0.0
+	for key, value in node.items():
+		if key == "nested_loop":
+			total += nested_loop_rows(value)
+		elif key == "table":
+			total += float(value.get("rows_examined_per_scan", 0)) + examined_rows(value)
+		else:
+			total += examined_rows(value)
+	return total
+
+def nested_loop_rows(tables: List[Dict[str, Any]]) -> float:
+	total = 0.0
+	scans = 1.0
+	for item in tables:
+		table = item.get("table", {})
+		total += scans * float(table.get("rows_examined_per_scan", 0)) + examined_rows(table)
+		scans = float(table.get("rows_produced_per_join", scans))
+	return total
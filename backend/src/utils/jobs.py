@@ -0,0 +1,310 @@
+from .streaming import open_result
+from .serialization import dumps, rows_to_ndjson
+from .query_cache import CompiledQuery
+from .db import get_timestamp, is_timeout
+from .constants import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_SPOOL_DIR, JOB_RESULT_TTL, JOB_EXPIRY_INTERVAL, STREAM_CHUNK_SIZE, QUERY_JOB_TIMEOUT
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class JobQueueFullError(Exception):
+	pass
+
+
+# A query run in the background. Its result is spooled to disk as gzipped NDJSON in the same layout as
+# /query/stream (header line, one array per row, row count line), next to a JSON file with the job's state
+# so any worker sharing the spool directory can report on it.
+class Job:
+	def __init__(self, compiled: Optional[CompiledQuery] = None, params: Tuple[Any, ...] = (), sql: str = "") -> None:
+		self.id: str = uuid.uuid4().hex
+		self.status: str = "queued"  # queued -> running -> succeeded | failed | cancelled
+		self.query: str = compiled.render(params, sql) if compiled else ""
+		self.created_at: str = get_timestamp()
+		self.started_at: Optional[str] = None
+		self.finished_at: Optional[str] = None
+		self.row_count: int = 0
+		self.error: Optional[str] = None
+		self.finished: float = 0.0  # time.time() when the job finished, for expiry
+
+		self.compiled = compiled
+		self.params = params
+		self.sql = sql or (compiled.sql if compiled else "")
+		self.task: Optional[asyncio.Task] = None
+
+	@property
+	def done(self) -> bool:
+		return self.status in ("succeeded", "failed", "cancelled")
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			"id": self.id,
+			"status": self.status,
+			"query": self.query,
+			"created_at": self.created_at,
+			"started_at": self.started_at,
+			"finished_at": self.finished_at,
+			"row_count": self.row_count,
+			"error": self.error,
+			"finished": self.finished,
+		}
+
+	@classmethod
+	def from_dict(cls, data: Dict[str, Any]) -> "Job":
+		job = cls()
+		for key, value in data.items():
+			setattr(job, key, value)
+		return job
+
+
+# Runs queued jobs on a fixed number of worker tasks, so background queries never take more than
+# JOB_WORKERS connections from the pool however many are submitted.
+#
+# Every expiry_interval the spool directory is scanned for jobs to expire, whichever worker ran them. A worker
+# touches the state files of its unfinished jobs on each scan, so a job left queued or running by a worker
+# that was killed stops being touched and expires result_ttl later like a finished one. A job whose state file
+# was deleted (by DELETE /query/jobs/{id} in another worker, or by expiry) is cancelled by the worker running it.
+class JobManager:
+	def __init__(self, workers: int, queue_size: int, spool_dir: str, result_ttl: float, expiry_interval: float = JOB_EXPIRY_INTERVAL) -> None:
+		self.workers = workers
+		self.spool_dir = spool_dir
+		self.result_ttl = result_ttl
+		self.expiry_interval = expiry_interval
+		self.jobs: Dict[str, Job] = {}
+		self._queue: asyncio.Queue[Job] = asyncio.Queue(queue_size)
+		self._tasks: List[asyncio.Task] = []
+		self._stopping = False
+
+	async def start(self) -> None:
+		os.makedirs(self.spool_dir, exist_ok=True)
+		self._tasks = [asyncio.create_task(self._worker(), name=f"query-job-worker-{i}") for i in range(self.workers)]
+		if self.expiry_interval > 0:
+			self._tasks.append(asyncio.create_task(self._expire_periodically(), name="query-job-expiry"))
+
+	async def stop(self) -> None:
+		self._stopping = True
+		for job in self.jobs.values():
+			if job.task is not None:
+				job.task.cancel()
+		for task in self._tasks:
+			task.cancel()
+		await asyncio.gather(*self._tasks, return_exceptions=True)
+		self._tasks = []
+
+	def submit(self, compiled: CompiledQuery, params: Tuple[Any, ...], sql: str = "") -> Job:
+		job = Job(compiled, params, sql)
+		try:
+			self._queue.put_nowait(job)
+		except asyncio.QueueFull:
+			raise JobQueueFullError(f"Too many queued jobs (the limit is {self._queue.maxsize}), try again later")
+		self.jobs[job.id] = job
+		self._save(job)
+		return job
+
+	# Jobs started by another worker process are found through their state file
+	def get(self, job_id: str) -> Optional[Job]:
+		if not JOB_ID_PATTERN.match(job_id):
+			return None
+		job = self.jobs.get(job_id)
+		if job is not None and not self._deleted(job):
+			return job
+		try:
+			with open(self.state_path(job_id), "r") as f:
+				return Job.from_dict(json.load(f))
+		except (OSError, ValueError):
+			return None
+
+	# Cancels the job if it hasn't finished and deletes its results
+	def delete(self, job_id: str) -> bool:
+		job = self.get(job_id)
+		if job is None:
+			return False
+		self._forget(job)
+		self._remove_files(job_id)
+		return True
+
+	# Forgets jobs whose results have been kept for longer than result_ttl and the ones deleted elsewhere,
+	# and marks the unfinished ones as still alive for expire_spool in the other workers. The files are
+	# handled on the threadpool, the jobs themselves (and their tasks) only on the event loop.
+	async def prune(self) -> None:
+		now = time.time()
+		expired = [job for job in self.jobs.values() if job.done and now - job.finished > self.result_ttl]
+		unfinished = [job for job in self.jobs.values() if not job.done]
+		deleted = await run_in_threadpool(self._prune_files, expired, unfinished)
+		for job in expired + deleted:
+			self._forget(job)
+
+	# Returns the unfinished jobs whose state file is gone
+	def _prune_files(self, expired: List[Job], unfinished: List[Job]) -> List[Job]:
+		for job in expired:
+			self._remove_files(job.id)
+		deleted: List[Job] = []
+		for job in unfinished:
+			try:
+				os.utime(self.state_path(job.id))
+			except FileNotFoundError:
+				deleted.append(job)
+			except OSError:
+				pass
+		return deleted
+
+	# Deletes the files of every job in the spool directory whose state file hasn't changed for result_ttl,
+	# except the ones of this worker's jobs (prune takes care of those). Files without a state file, e.g. the
+	# temporary result of a worker that was killed, expire by their own age. Returns how many were deleted.
+	def expire_spool(self, own_job_ids: Set[str]) -> int:
+		now = time.time()
+		files: Dict[str, List[str]] = {}
+		for name in os.listdir(self.spool_dir):
+			job_id = name.split(".", 1)[0]
+			if JOB_ID_PATTERN.match(job_id) and job_id not in own_job_ids:
+				files.setdefault(job_id, []).append(name)
+
+		removed = 0
+		for job_id, names in files.items():
+			state_name = os.path.basename(self.state_path(job_id))
+			try:
+				ages = {name: now - os.path.getmtime(os.path.join(self.spool_dir, state_name if state_name in names else name)) for name in names}
+			except OSError:
+				continue  # Deleted meanwhile
+			for name, age in ages.items():
+				if age > self.result_ttl:
+					try:
+						os.remove(os.path.join(self.spool_dir, name))
+						removed += 1
+					except OSError:
+						pass
+		if removed:
+			logger.info("Expired %d files of query jobs", removed)
+		return removed
+
+	def result_path(self, job_id: str) -> str:
+		return os.path.join(self.spool_dir, f"{job_id}.ndjson.gz")
+
+	def state_path(self, job_id: str) -> str:
+		return os.path.join(self.spool_dir, f"{job_id}.json")
+
+	def stats(self) -> Dict[str, Any]:
+		counts: Dict[str, int] = {}
+		for job in self.jobs.values():
+			counts[job.status] = counts.get(job.status, 0) + 1
+		return {"workers": self.workers, "queued": self._queue.qsize(), "max_queued": self._queue.maxsize, "jobs": counts}
+
+	async def _expire_periodically(self) -> None:
+		while True:
+			await asyncio.sleep(self.expiry_interval)
+			try:
+				await self.prune()
+				await run_in_threadpool(self.expire_spool, set(self.jobs))
+			except Exception as e:
+				logger.warning("Failed to expire query jobs: %s", e)
+
+	# Cancels a job of this worker whose state file is gone and forgets it, returning whether it was deleted
+	def _deleted(self, job: Job) -> bool:
+		if os.path.exists(self.state_path(job.id)):
+			return False
+		self._forget(job)
+		return True
+
+	def _forget(self, job: Job) -> None:
+		self.jobs.pop(job.id, None)
+		if not job.done:
+			job.status = "cancelled"
+			if job.task is not None:
+				job.task.cancel()
+
+	def _remove_files(self, job_id: str) -> None:
+		for path in (self.result_path(job_id), self.state_path(job_id)):
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+
+	async def _worker(self) -> None:
+		while True:
+			job = await self._queue.get()
+			try:
+				if job.status != "queued" or self._deleted(job):
+					continue  # Cancelled while it was waiting
+				job.task = asyncio.create_task(self._run(job))
+				try:
+					await job.task
+				except asyncio.CancelledError:
+					if self._stopping:
+						raise
+					# Only this job was cancelled (see delete), carry on with the next one
+				job.task = None
+			finally:
+				self._queue.task_done()
+
+	async def _run(self, job: Job) -> None:
+		job.status = "running"
+		job.started_at = get_timestamp()
+		self._save(job)
+		temp_path = f"{self.result_path(job.id)}.{os.getpid()}.tmp"
+		spool = await run_in_threadpool(gzip.open, temp_path, "wb", 6)
+		try:
+			result = await open_result(job.sql, job.params, timeout=QUERY_JOB_TIMEOUT)
+			try:
+				column_names = [i[0] for i in result.cursor.description or []]
+				if job.compiled is not None:
+					column_names = job.compiled.get_column_names(column_names)
+				header = {"query": job.query, "created_at": job.created_at, "columns": column_names}
+				await run_in_threadpool(spool.write, dumps(header) + b"\n")
+				async for rows in result.chunks(STREAM_CHUNK_SIZE):
+					if self._deleted(job):
+						raise asyncio.CancelledError()
+					await run_in_threadpool(spool.write, rows_to_ndjson(rows))
+					job.row_count = result.row_count
+			except BaseException as e:
+				await result.close(e)
+				raise e
+			await result.close()
+			await run_in_threadpool(spool.write, dumps({"row_count": job.row_count}) + b"\n")
+			await run_in_threadpool(spool.close)
+			os.replace(temp_path, self.result_path(job.id))
+			job.status = "succeeded"
+		except BaseException as e:
+			await run_in_threadpool(self._discard_spool, spool, temp_path)
+			if isinstance(e, asyncio.CancelledError):
+				job.status = "cancelled"
+			else:
+				logger.error("Job %s failed: %s", job.id, e)
+				job.status = "failed"
+				job.error = "Query timed out" if is_timeout(e) else "Failed to execute query"
+			if not isinstance(e, Exception):
+				raise e
+		finally:
+			job.finished_at = get_timestamp()
+			job.finished = time.time()
+			if job.id in self.jobs:
+				self._save(job)
+
+	def _discard_spool(self, spool: gzip.GzipFile, temp_path: str) -> None:
+		spool.close()
+		try:
+			os.remove(temp_path)
+		except OSError:
+			pass
+
+	def _save(self, job: Job) -> None:
+		temp_path = f"{self.state_path(job.id)}.{os.getpid()}.tmp"
+		try:
+			with open(temp_path, "w") as f:
+				json.dump(job.to_dict(), f)
+			os.replace(temp_path, self.state_path(job.id))
+		except OSError as e:
+			logger.warning("Failed to write state of job %s: %s", job.id, e)
+
+
+job_manager = JobManager(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_SPOOL_DIR, JOB_RESULT_TTL)
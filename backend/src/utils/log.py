@@ -0,0 +1,33 @@
+from .constants import LOG_LEVEL, LOG_FORMAT
+from typing import Any, Dict
+import json
+import logging
+
+# Attributes every LogRecord has, anything else on a record was passed through extra= and is logged as a field
+RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+
+# One JSON object per line with the fields passed through extra= next to the message
+class JsonFormatter(logging.Formatter):
+	def format(self, record: logging.LogRecord) -> str:
+		entry: Dict[str, Any] = {
+			"time": self.formatTime(record),
+			"level": record.levelname,
+			"logger": record.name,
+			"message": record.getMessage(),
+		}
+		entry.update({key: value for key, value in record.__dict__.items() if key not in RECORD_ATTRIBUTES})
+		if record.exc_info:
+			entry["exception"] = self.formatException(record.exc_info)
+		return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, format: str = LOG_FORMAT) -> None:
+	handler = logging.StreamHandler()
+	if format == "json":
+		handler.setFormatter(JsonFormatter())
+	else:
+		handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+	root = logging.getLogger()
+	root.handlers = [handler]
+	root.setLevel(level)
@@ -0,0 +1,133 @@
+from .constants import SERVER_TIMING
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+# A Prometheus histogram with one series per combination of label values, rendered in the text exposition format
+class Histogram:
+	def __init__(self, name: str, description: str, label_names: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+		self.name = name
+		self.description = description
+		self.label_names = tuple(label_names)
+		self.buckets = tuple(sorted(buckets))
+		self._series: Dict[Tuple[str, ...], List[float]] = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+		self._lock = threading.Lock()
+
+	def observe(self, value: float, *labels: str) -> None:
+		index = bisect_left(self.buckets, value)
+		with self._lock:
+			series = self._series.get(labels)
+			if series is None:
+				series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+			series[index] += 1
+			series[-1] += value
+
+	def render(self) -> List[str]:
+		lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+		with self._lock:
+			series = sorted((labels, list(values)) for labels, values in self._series.items())
+		for labels, values in series:
+			label_pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(self.label_names, labels)]
+			cumulative = 0.0
+			for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+				cumulative += count
+				le = "+Inf" if bound == float("inf") else repr(bound)
+				bucket_labels = ",".join(label_pairs + [f'le="{le}"'])
+				lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative:g}")
+			label_set = "{" + ",".join(label_pairs) + "}" if label_pairs else ""
+			lines.append(f"{self.name}_sum{label_set} {values[-1]!r}")
+			lines.append(f"{self.name}_count{label_set} {cumulative:g}")
+		return lines
+
+
+def escape_label(value: str) -> str:
+	return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+phase_seconds = Histogram("sqlmate_phase_seconds", "Time spent in each phase of handling a request.", ["phase"])
+request_seconds = Histogram("sqlmate_request_seconds", "Time from receiving a request until its handler returned.", ["method", "route", "status"])
+
+def render_metrics() -> str:
+	return "\n".join(phase_seconds.render() + request_seconds.render()) + "\n"
+
+
+# The phases of the request being handled, collected for the Server-Timing header.
+# Phases can nest (e.g. generate includes shortest_path), a phase timed more than once adds up.
+class RequestTimings:
+	def __init__(self) -> None:
+		self.started = time.perf_counter()
+		self.phases: Dict[str, float] = {}
+
+	def add(self, phase: str, seconds: float) -> None:
+		self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+	def server_timing(self) -> str:
+		phases = dict(self.phases, total=time.perf_counter() - self.started)
+		return ", ".join(f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in phases.items())
+
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+def record_phase(phase: str, seconds: float) -> None:
+	phase_seconds.observe(seconds, phase)
+	timings = current_timings.get()
+	if timings is not None:
+		timings.add(phase, seconds)
+
+# Times the block as one phase. Outside of a request (e.g. in a background job) it only feeds the histogram.
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		record_phase(phase, time.perf_counter() - start)
+
+# Records everything from the request arriving until now as one phase, for the work done before the handler
+# runs (reading the body, routing, validating it into the request model)
+def record_since_request_start(phase: str) -> None:
+	timings = current_timings.get()
+	if timings is not None:
+		record_phase(phase, time.perf_counter() - timings.started)
+
+
+# Times every request by method, route and status and, with SERVER_TIMING, sends the phases recorded while
+# handling it in a Server-Timing header. Phases of a streamed body are recorded after the header has been sent,
+# so they only show up in the histograms.
+class MetricsMiddleware:
+	def __init__(self, app: ASGIApp, server_timing: bool = SERVER_TIMING) -> None:
+		self.app = app
+		self.server_timing = server_timing
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		timings = RequestTimings()
+		token = current_timings.set(timings)
+		status_code = 500
+
+		async def send_wrapper(message: Message) -> None:
+			nonlocal status_code
+			if message["type"] == "http.response.start":
+				status_code = message["status"]
+				if self.server_timing:
+					headers = list(message.get("headers", []))
+					headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+					message = {**message, "headers": headers}
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			current_timings.reset(token)
+			# The matched route's path template keeps the number of series bounded
+			route = getattr(scope.get("route"), "path", "unmatched")
+			request_seconds.observe(time.perf_counter() - timings.started, scope["method"], route, str(status_code))
@@ -0,0 +1,50 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import asyncio
+
+
+# Cancels the request handler when the client disconnects before the response has started, so work for a
+# request nobody is waiting on stops (a cancelled execute_prepared kills its statement on the server).
+# The request is read as it arrives and handed to the app through a queue, which is what lets the
+# disconnect be seen while the handler is still busy. Streaming responses are already cancelled by Starlette.
+class CancelOnDisconnectMiddleware:
+	def __init__(self, app: ASGIApp) -> None:
+		self.app = app
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		messages: asyncio.Queue[Message] = asyncio.Queue()
+		response_started = False
+		disconnected = False
+
+		async def send_wrapper(message: Message) -> None:
+			nonlocal response_started
+			if message["type"] == "http.response.start":
+				response_started = True
+			await send(message)
+
+		handler = asyncio.create_task(self.app(scope, messages.get, send_wrapper))
+
+		async def listen() -> None:
+			nonlocal disconnected
+			while True:
+				message = await receive()
+				await messages.put(message)
+				if message["type"] == "http.disconnect":
+					if not response_started and not handler.done():
+						disconnected = True
+						handler.cancel()
+					return
+
+		listener = asyncio.create_task(listen())
+		try:
+			await handler
+		except asyncio.CancelledError:
+			current = asyncio.current_task()
+			if not disconnected or (current is not None and current.cancelling()):
+				raise
+			# The client is gone, there is no one to send a response to
+		finally:
+			listener.cancel()
@@ -0,0 +1,192 @@
+from .db import execute_prepared
+from .metrics import timed
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import base64
+import hashlib
+import json
+import mysql.connector
+
+ER_BAD_FIELD_ERROR = 1054
+
+
+# One page of a paged result, next_page_token is None on the last page
+class Page:
+	def __init__(self, rows: List[Any], column_names: List[str], next_page_token: Optional[str]) -> None:
+		self.rows = rows
+		self.column_names = column_names
+		self.next_page_token = next_page_token
+
+
+# Pages through the result of base_sql. With keys (the result columns that give a total order, each with
+# its sort direction) every page is fetched with a keyset condition on the last row of the previous page, so
+# the server seeks straight to the page through an index instead of counting rows. Without keys it falls
+# back to LIMIT/OFFSET paging. hidden_columns trailing columns are only used for paging and are not returned.
+class Pager:
+	def __init__(self, base_sql: str, order_by: str = "", keys: Optional[List[Tuple[str, str]]] = None, limit: Optional[int] = None, hidden_columns: int = 0, shape: str = "") -> None:
+		self.base_sql = base_sql
+		self.order_by = order_by  # ORDER BY clause (with trailing newline) used in offset mode, may be empty
+		self.keys = keys
+		self.limit = limit  # Total number of rows the query may return across all pages
+		self.hidden_columns = hidden_columns
+		# Tokens are tied to the query shape so one can't be replayed against a different query
+		self.shape = shape or hashlib.sha1(base_sql.encode("utf-8")).hexdigest()[:16]
+
+	def without_keys(self) -> "Pager":
+		return Pager(self.base_sql, self.order_by, None, self.limit, self.hidden_columns, self.shape)
+
+	async def fetch(self, params: Sequence[Any], page_size: int, page_token: Optional[str], whose: str = "user", timeout: Optional[float] = None) -> Page:
+		state = decode_page_token(page_token, self.shape) if page_token else {}
+		if self.keys is not None and "o" in state:
+			# The token was issued in offset mode, keep paging that way
+			return await self.without_keys().fetch(params, page_size, page_token, whose, timeout)
+
+		remaining = state.get("r", self.limit)
+		if remaining is not None and remaining <= 0:
+			return Page([], [], None)
+		fetch_size = page_size if remaining is None else min(page_size, remaining)
+
+		sql, page_params = self.page_sql(state, fetch_size)
+		# One extra row tells us whether there is a next page without a separate COUNT query
+		async with execute_prepared(sql, tuple(params) + tuple(page_params), whose, timeout) as cursor:
+			column_names = [i[0] for i in cursor.description or []]
+			with timed("fetch"):
+				rows: List[Any] = await cursor.fetchall()
+
+		has_more = len(rows) > fetch_size
+		rows = rows[:fetch_size]
+		remaining = None if remaining is None else remaining - len(rows)
+		next_page_token = None
+		if has_more and rows and (remaining is None or remaining > 0):
+			next_page_token = encode_page_token(self.next_state(state, rows, column_names, remaining))
+
+		if self.hidden_columns:
+			rows = [row[:-self.hidden_columns] for row in rows]
+			column_names = column_names[:-self.hidden_columns]
+		return Page(rows, column_names, next_page_token)
+
+	def page_sql(self, state: Dict[str, Any], fetch_size: int) -> Tuple[str, List[Any]]:
+		if self.keys is None:
+			return f"{self.base_sql}{self.order_by}LIMIT {fetch_size + 1} OFFSET {int(state.get('o', 0))}", []
+
+		where, params = "", []
+		if "k" in state:
+			values = [decode_key_value(value) for value in state["k"]]
+			if len(values) != len(self.keys):
+				raise ValueError("Invalid page token")
+			condition, params = keyset_condition(self.keys, values)
+			where = f"WHERE {condition}\n"
+		order_by = ",".join([f"{quote_identifier(column)} {direction}" for column, direction in self.keys])
+		return f"SELECT * FROM (\n{self.base_sql}) AS page\n{where}ORDER BY {order_by}\nLIMIT {fetch_size + 1}", params
+
+	def next_state(self, state: Dict[str, Any], rows: List[Any], column_names: List[str], remaining: Optional[int]) -> Dict[str, Any]:
+		next_state: Dict[str, Any] = {"q": self.shape}
+		if self.keys is None:
+			next_state["o"] = int(state.get("o", 0)) + len(rows)
+		else:
+			last_row = rows[-1]
+			next_state["k"] = [encode_key_value(last_row[column_names.index(column)]) for column, _ in self.keys]
+		if remaining is not None:
+			next_state["r"] = remaining
+		return next_state
+
+
+# Builds the condition selecting the rows that sort after values. For keys (a, b) that is
+# a > x OR (a = x AND b > y), with the comparison flipped for DESC keys and NULLs (which MySQL sorts
+# first in ascending order) handled explicitly so the condition never evaluates to NULL.
+def keyset_condition(keys: List[Tuple[str, str]], values: List[Any]) -> Tuple[str, List[Any]]:
+	terms: List[str] = []
+	params: List[Any] = []
+	for i, ((column, direction), value) in enumerate(zip(keys, values)):
+		column = quote_identifier(column)
+		if value is None:
+			if direction == "DESC":
+				continue  # Nothing sorts after NULL in descending order
+			after, after_params = f"{column} IS NOT NULL", []
+		elif direction == "DESC":
+			after, after_params = f"({column} < %s OR {column} IS NULL)", [value]
+		else:
+			after, after_params = f"{column} > %s", [value]
+
+		equal = [f"{quote_identifier(previous)} <=> %s" for previous, _ in keys[:i]]
+		terms.append("(" + " AND ".join(equal + [after]) + ")")
+		params += values[:i] + after_params
+
+	if not terms:
+		return "FALSE", []
+	return " OR ".join(terms), params
+
+
+def quote_identifier(name: str) -> str:
+	return "`" + name.replace("`", "``") + "`"
+
+
+def encode_page_token(state: Dict[str, Any]) -> str:
+	data = json.dumps(state, separators=(",", ":")).encode("utf-8")
+	return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+def decode_page_token(token: str, shape: str) -> Dict[str, Any]:
+	try:
+		state = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+	except (ValueError, TypeError):
+		raise ValueError("Invalid page token")
+	if not isinstance(state, dict) or state.get("q") != shape:
+		raise ValueError("Invalid page token")
+	if not all(isinstance(state.get(field, 0), int) for field in ("o", "r")) or not isinstance(state.get("k", []), list):
+		raise ValueError("Invalid page token")
+	return state
+
+# Key values go into the token as JSON, tagging the types JSON can't represent so they are bound back as the same type
+def encode_key_value(value: Any) -> Any:
+	if isinstance(value, datetime):
+		return {"datetime": value.isoformat()}
+	if isinstance(value, date):
+		return {"date": value.isoformat()}
+	if isinstance(value, timedelta):
+		return {"time": value.total_seconds()}
+	if isinstance(value, Decimal):
+		return {"decimal": str(value)}
+	if isinstance(value, (bytes, bytearray)):
+		return {"bytes": base64.b64encode(value).decode("ascii")}
+	return value
+
+def decode_key_value(value: Any) -> Any:
+	if not isinstance(value, dict):
+		return value
+	try:
+		if "datetime" in value:
+			return datetime.fromisoformat(value["datetime"])
+		if "date" in value:
+			return date.fromisoformat(value["date"])
+		if "time" in value:
+			return timedelta(seconds=value["time"])
+		if "decimal" in value:
+			return Decimal(value["decimal"])
+		if "bytes" in value:
+			return base64.b64decode(value["bytes"], validate=True)
+	except (ValueError, TypeError, ArithmeticError):
+		pass
+	raise ValueError("Invalid page token")
+
+
+def validate_page_size(page_size: Optional[int], default: int, maximum: int) -> int:
+	if page_size is None:
+		return default
+	if page_size < 1 or page_size > maximum:
+		raise ValueError(f"Invalid page size: {page_size} (must be between 1 and {maximum})")
+	return page_size
+
+
+# Saved tables get an invisible auto-increment primary key (see save_user_table), which is what they are paged by.
+# Tables saved before that column existed are paged by offset instead.
+SAVED_TABLE_ROW_ID = "sqlmate_row_id"
+
+async def fetch_saved_table_page(table_name: str, page_size: int, page_token: Optional[str], timeout: Optional[float] = None) -> Page:
+	pager = Pager(f"SELECT *, {SAVED_TABLE_ROW_ID} FROM {table_name}\n", keys=[(SAVED_TABLE_ROW_ID, "ASC")], hidden_columns=1, shape=table_name)
+	try:
+		return await pager.fetch((), page_size, page_token, "sqlmate", timeout)
+	except mysql.connector.Error as e:
+		if e.errno != ER_BAD_FIELD_ERROR:
+			raise e
+	return await Pager(f"SELECT * FROM {table_name}\n", shape=table_name).fetch((), page_size, page_token, "sqlmate", timeout)
@@ -0,0 +1,96 @@
+from .auth import hash_password, check_password
+from .constants import PASSWORD_WORKERS, PASSWORD_QUEUE_SIZE, BCRYPT_ROUNDS
+from .metrics import timed
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordQueueFullError(Exception):
+	pass
+
+
+class PasswordWorkerError(Exception):
+	pass
+
+
+# Runs bcrypt in a dedicated pool of worker processes, so a burst of logins neither holds the event loop
+# nor the threadpool the rest of the API (e.g. /query) runs its blocking work on. At most queue_size
+# hashes/checks are queued or running at once, anything beyond that is refused straight away (429)
+# rather than queued behind work that will take seconds to drain. With workers set to 0 bcrypt runs
+# on the threadpool as before.
+class PasswordHasher:
+	def __init__(self, workers: int, queue_size: int, rounds: int) -> None:
+		self.workers = workers
+		self.queue_size = queue_size
+		self.rounds = rounds
+		self._executor: Optional[ProcessPoolExecutor] = None
+		self._pending: int = 0
+		self.completed: int = 0
+		self.rejected: int = 0
+
+	# Spawned rather than forked, the server process has threads (pools, metadata loading) running by now
+	def start(self) -> None:
+		if self.workers > 0 and self._executor is None:
+			self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+	def stop(self) -> None:
+		if self._executor is not None:
+			self._executor.shutdown(wait=False, cancel_futures=True)
+			self._executor = None
+
+	async def hash(self, password: str) -> str:
+		return await self._run(hash_password, password, self.rounds)
+
+	async def check(self, password: str, hashed_password: str) -> bool:
+		return await self._run(check_password, password, hashed_password)
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"workers": self.workers,
+			"pending": self._pending,
+			"max_pending": self.queue_size,
+			"completed": self.completed,
+			"rejected": self.rejected,
+			"rounds": self.rounds,
+		}
+
+	async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+		if self._pending >= self.queue_size:
+			self.rejected += 1
+			raise PasswordQueueFullError("Too many login attempts in progress, try again later")
+		self._pending += 1
+		try:
+			with timed("password"):
+				if self.workers <= 0:
+					result = await run_in_threadpool(func, *args)
+				else:
+					result = await self._run_in_pool(func, *args)
+		finally:
+			self._pending -= 1
+		self.completed += 1
+		return result
+
+	# A worker dying (e.g. OOM killed) breaks the whole pool and fails every call waiting on it, so the pool is
+	# replaced and the call retried once on the new one before giving up (503)
+	async def _run_in_pool(self, func: Callable[..., Any], *args: Any) -> Any:
+		for _ in range(2):
+			self.start()
+			executor = self._executor
+			try:
+				return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+			except BrokenProcessPool:
+				logger.error("Password worker pool broke, restarting it")
+				# Calls that failed along with this one must not stop the pool another one already replaced
+				if self._executor is executor:
+					self.stop()
+		raise PasswordWorkerError("Password checks are temporarily unavailable, try again later")
+
+
+password_hasher = PasswordHasher(PASSWORD_WORKERS, PASSWORD_QUEUE_SIZE, BCRYPT_ROUNDS)
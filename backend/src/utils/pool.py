@@ -0,0 +1,363 @@
+from mysql.connector import connect
+from mysql.connector.aio import connect as async_connect
+from mysql.connector.abstracts import MySQLConnectionAbstract
+from mysql.connector.aio.abstracts import MySQLConnectionAbstract as AsyncMySQLConnectionAbstract
+from mysql.connector.pooling import PooledMySQLConnection
+from mysql.connector.errors import PoolError
+from mysql.connector.aio.abstracts import MySQLCursorAbstract as AsyncMySQLCursorAbstract
+from collections import deque, OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Bookkeeping shared by the sync and async connection wrappers: when the connection was opened and last handed
+# back, which is what the pools use to decide when to recycle or health-check it. No I/O happens here.
+class ConnectionTimes:
+	def __init__(self) -> None:
+		self.created_at: float = time.monotonic()
+		self.last_used: float = self.created_at
+
+	def is_stale(self, recycle: float) -> bool:
+		return recycle > 0 and time.monotonic() - self.created_at > recycle
+
+	# Only connections that have been sitting idle are pinged, recently used ones are assumed to be alive
+	def needs_ping(self, ping_interval: float) -> bool:
+		return time.monotonic() - self.last_used >= ping_interval
+
+	def mark_used(self) -> None:
+		self.last_used = time.monotonic()
+
+
+# Wrapper around a raw connection, see ConnectionTimes
+class PooledConnection(ConnectionTimes):
+	def __init__(self, connection: MySQLConnectionAbstract | PooledMySQLConnection) -> None:
+		super().__init__()
+		self.connection = connection
+
+	def is_healthy(self, ping_interval: float) -> bool:
+		if not self.needs_ping(ping_interval):
+			return True
+		try:
+			self.connection.ping(reconnect=False)
+			return True
+		except Exception as _:
+			return False
+
+	def close(self) -> None:
+		try:
+			self.connection.close()
+		except Exception as _:
+			pass
+
+
+# Async counterpart of PooledConnection, wrapping a mysql.connector.aio connection.
+# It also owns the server-side prepared statements created on that connection, keyed by SQL text.
+class AsyncPooledConnection(ConnectionTimes):
+	def __init__(self, connection: AsyncMySQLConnectionAbstract) -> None:
+		super().__init__()
+		self.connection = connection
+		self.statements: OrderedDict[str, Tuple[str, AsyncMySQLCursorAbstract]] = OrderedDict()
+
+	# Returns a prepared cursor for sql along with the SQL string it must be executed with.
+	# The connector only skips re-preparing when it is handed the exact same string object,
+	# so callers have to use the returned string rather than their own copy.
+	async def prepare(self, sql: str, max_statements: int) -> Tuple[str, AsyncMySQLCursorAbstract]:
+		if sql in self.statements:
+			self.statements.move_to_end(sql)
+			return self.statements[sql]
+
+		cursor = await self.connection.cursor(prepared=True)
+		self.statements[sql] = (sql, cursor)
+		while len(self.statements) > max_statements:
+			_, (_, evicted) = self.statements.popitem(last=False)
+			await self._close_statement(evicted)
+		return sql, cursor
+
+	async def forget(self, sql: str) -> None:
+		if sql in self.statements:
+			_, cursor = self.statements.pop(sql)
+			await self._close_statement(cursor)
+
+	# Closing the cursor deallocates the statement on the server
+	async def _close_statement(self, cursor: AsyncMySQLCursorAbstract) -> None:
+		try:
+			await cursor.close()
+		except Exception as _:
+			pass
+
+	async def is_healthy(self, ping_interval: float) -> bool:
+		if not self.needs_ping(ping_interval):
+			return True
+		try:
+			await self.connection.ping(reconnect=False)
+			return True
+		except Exception as _:
+			return False
+
+	async def close(self) -> None:
+		self.statements.clear()
+		try:
+			await self.connection.close()
+		except Exception as _:
+			pass
+
+
+# Size bounds, idle connections and metrics shared by ConnectionPool and AsyncConnectionPool, which add the
+# locking and the I/O. Connections are opened lazily up to max_size, at least min_size are kept open once the
+# pool is used, and callers wait (up to timeout seconds) when every connection is checked out.
+# The helpers must be called with the pool's lock held.
+class BasePool:
+	def __init__(self, name: str, config: Dict[str, Any], min_size: int, max_size: int, timeout: float, recycle: float, ping_interval: float) -> None:
+		if max_size < 1 or min_size < 0 or min_size > max_size:
+			raise ValueError(f"Invalid size bounds for pool '{name}': min={min_size}, max={max_size}")
+		self.name = name
+		self.config = config
+		self.min_size = min_size
+		self.max_size = max_size
+		self.timeout = timeout
+		self.recycle = recycle
+		self.ping_interval = ping_interval
+
+		self._idle: deque[Any] = deque()
+		self._size: int = 0  # Open connections, idle or checked out
+
+		# Metrics
+		self.checkouts: int = 0
+		self.waits: int = 0
+		self.wait_time_total: float = 0.0
+		self.wait_time_max: float = 0.0
+		self.timeouts: int = 0
+		self.created: int = 0
+		self.recycled: int = 0
+		self.failed_health_checks: int = 0
+
+	def _stats(self) -> Dict[str, Any]:
+		return {
+			"size": self._size,
+			"idle": len(self._idle),
+			"in_use": self._size - len(self._idle),
+			"min_size": self.min_size,
+			"max_size": self.max_size,
+			"checkouts": self.checkouts,
+			"waits": self.waits,
+			"wait_time_total": round(self.wait_time_total, 6),
+			"wait_time_max": round(self.wait_time_max, 6),
+			"timeouts": self.timeouts,
+			"created": self.created,
+			"recycled": self.recycled,
+			"failed_health_checks": self.failed_health_checks,
+		}
+
+	def _exhausted(self) -> bool:
+		return not self._idle and self._size >= self.max_size
+
+	# Seconds a caller that has to wait may still wait until deadline, raising once it has passed
+	def _remaining(self, deadline: float) -> float:
+		remaining = deadline - time.monotonic()
+		if remaining <= 0:
+			self.timeouts += 1
+			raise PoolError(f"Timed out after {self.timeout}s waiting for a connection from the '{self.name}' pool")
+		return remaining
+
+	def _start_wait(self) -> float:
+		self.waits += 1
+		return time.monotonic()
+
+	# Returns an idle connection, or None if a slot was reserved for a new connection
+	def _take(self, waited_since: Optional[float]) -> Any:
+		if waited_since is not None:
+			waited = time.monotonic() - waited_since
+			self.wait_time_total += waited
+			self.wait_time_max = max(self.wait_time_max, waited)
+
+		if self._idle:
+			# Most recently used first, so surplus connections age out through recycling
+			return self._idle.pop()
+		self._size += 1
+		return None
+
+	def _is_stale(self, pooled: ConnectionTimes) -> bool:
+		if pooled.is_stale(self.recycle):
+			self.recycled += 1
+			return True
+		return False
+
+
+# Bounded pool of MySQL connections for a single configuration ("user" or "sqlmate"), see BasePool
+class ConnectionPool(BasePool):
+	def __init__(self, name: str, config: Dict[str, Any], min_size: int, max_size: int, timeout: float, recycle: float, ping_interval: float) -> None:
+		super().__init__(name, config, min_size, max_size, timeout, recycle, ping_interval)
+		self._lock = threading.Condition()
+
+	def acquire(self) -> PooledConnection:
+		deadline = time.monotonic() + self.timeout
+		with self._lock:
+			self.checkouts += 1
+		while True:
+			pooled = self._checkout(deadline)
+			if pooled is None:
+				# We reserved a slot, so open a new connection outside of the lock
+				return self._open()
+
+			if not self._is_stale(pooled):
+				if pooled.is_healthy(self.ping_interval):
+					return pooled
+				self.failed_health_checks += 1
+			self._discard(pooled)
+
+	def release(self, pooled: PooledConnection, discard: bool = False) -> None:
+		if discard:
+			self._discard(pooled)
+			return
+
+		pooled.mark_used()
+		with self._lock:
+			self._idle.append(pooled)
+			self._lock.notify()
+
+	def fill(self) -> None:
+		while True:
+			with self._lock:
+				if self._size >= self.min_size:
+					return
+				self._size += 1
+			pooled = self._open()
+			self.release(pooled)
+
+	def close(self) -> None:
+		with self._lock:
+			while self._idle:
+				self._idle.pop().close()
+				self._size -= 1
+			self._lock.notify_all()
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			return self._stats()
+
+	def _checkout(self, deadline: float) -> PooledConnection | None:
+		with self._lock:
+			waited_since = None
+			while self._exhausted():
+				remaining = self._remaining(deadline)
+				if waited_since is None:
+					waited_since = self._start_wait()
+				self._lock.wait(remaining)
+			return self._take(waited_since)
+
+	def _open(self) -> PooledConnection:
+		try:
+			pooled = PooledConnection(connect(**self.config))
+		except Exception as e:
+			with self._lock:
+				self._size -= 1
+				self._lock.notify()
+			raise e
+		self.created += 1
+		return pooled
+
+	def _discard(self, pooled: PooledConnection) -> None:
+		pooled.close()
+		with self._lock:
+			self._size -= 1
+			self._lock.notify()
+
+
+# Asyncio version of ConnectionPool used by the routers. Waiting for a connection suspends
+# the coroutine instead of blocking a worker thread, so one event loop can multiplex many queries.
+# Must only be used from the event loop it was first used on.
+class AsyncConnectionPool(BasePool):
+	def __init__(self, name: str, config: Dict[str, Any], min_size: int, max_size: int, timeout: float, recycle: float, ping_interval: float) -> None:
+		super().__init__(name, config, min_size, max_size, timeout, recycle, ping_interval)
+		self._lock = asyncio.Condition()
+		self.killed_queries: int = 0
+
+	async def acquire(self) -> AsyncPooledConnection:
+		deadline = time.monotonic() + self.timeout
+		self.checkouts += 1
+		while True:
+			pooled = await self._checkout(deadline)
+			if pooled is None:
+				return await self._open()
+
+			if not self._is_stale(pooled):
+				if await pooled.is_healthy(self.ping_interval):
+					return pooled
+				self.failed_health_checks += 1
+			await self._discard(pooled)
+
+	async def release(self, pooled: AsyncPooledConnection, discard: bool = False) -> None:
+		if discard:
+			await self._discard(pooled)
+			return
+
+		pooled.mark_used()
+		async with self._lock:
+			self._idle.append(pooled)
+			self._lock.notify()
+
+	# Interrupts whatever statement is running on pooled. This has to go through a separate connection since
+	# pooled itself is busy waiting for the statement, a fresh one is used so it works even when the pool is exhausted.
+	async def kill_query(self, pooled: AsyncPooledConnection) -> None:
+		connection_id = pooled.connection.connection_id
+		try:
+			side = await asyncio.wait_for(async_connect(**self.config), self.timeout)
+			try:
+				cursor = await side.cursor()
+				await cursor.execute(f"KILL QUERY {int(connection_id)}")
+			finally:
+				await side.close()
+			self.killed_queries += 1
+		except Exception as e:
+			logger.warning("Failed to kill the query running on connection %s: %s", connection_id, e)
+
+	async def fill(self) -> None:
+		while self._size < self.min_size:
+			self._size += 1
+			pooled = await self._open()
+			await self.release(pooled)
+
+	async def close(self) -> None:
+		async with self._lock:
+			while self._idle:
+				await self._idle.pop().close()
+				self._size -= 1
+			self._lock.notify_all()
+
+	def stats(self) -> Dict[str, Any]:
+		return {**self._stats(), "killed_queries": self.killed_queries}
+
+	async def _checkout(self, deadline: float) -> AsyncPooledConnection | None:
+		async with self._lock:
+			waited_since = None
+			while self._exhausted():
+				remaining = self._remaining(deadline)
+				if waited_since is None:
+					waited_since = self._start_wait()
+				try:
+					await asyncio.wait_for(self._lock.wait(), remaining)
+				except asyncio.TimeoutError:
+					pass
+			return self._take(waited_since)
+
+	async def _open(self) -> AsyncPooledConnection:
+		try:
+			pooled = AsyncPooledConnection(await async_connect(**self.config))
+		except BaseException as e:
+			async with self._lock:
+				self._size -= 1
+				self._lock.notify()
+			raise e
+		self.created += 1
+		return pooled
+
+	async def _discard(self, pooled: AsyncPooledConnection) -> None:
+		await pooled.close()
+		async with self._lock:
+			self._size -= 1
+			self._lock.notify()
@@ -0,0 +1,130 @@
+from classes.http import QueryParams
+from classes.queries.base import bind_constraint_value
+from .pagination import Pager
+from .serialization import clean_column_names
+from mysql.connector.conversion import MySQLConverter
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import threading
+
+
+# A generated SQL template (with %s placeholders for constraint values) together with what is
+# needed to bind a fresh set of values to it, so repeated query shapes skip query generation entirely
+class CompiledQuery:
+	def __init__(self, sql: str, param_specs: List[Tuple[str, str, str]], num_tables: int, pager: Pager, tables: List[str]) -> None:
+		self.sql: str = sql
+		self.param_specs: List[Tuple[str, str, str]] = param_specs  # (table, attribute, operator) per placeholder
+		self.num_tables: int = num_tables
+		self.pager: Pager = pager  # How to fetch this query one page at a time
+		self.tables: List[str] = tables  # Every table the query reads, including the ones only joined through
+		self._columns: Tuple[Tuple[str, ...], List[str]] = ((), [])  # (column names from the cursor, cleaned column names)
+		self.estimate: Optional[Any] = None  # Last QueryEstimate made for this query (see utils/guardrails.py)
+
+	def bind(self, values: List[str]) -> Tuple[Any, ...]:
+		return tuple(
+			bind_constraint_value(table_name, attribute_name, operator, value)[1]
+			for (table_name, attribute_name, operator), value in zip(self.param_specs, values)
+		)
+
+	# The cleaned column names only depend on the query, so they are worked out once and reused by every execution
+	def get_column_names(self, column_names: List[str]) -> List[str]:
+		raw, cleaned = self._columns
+		if raw != tuple(column_names):
+			cleaned = clean_column_names(column_names, self.num_tables)
+			self._columns = (tuple(column_names), cleaned)
+		return cleaned
+
+	# Inlines the parameters, which is what gets shown to the user and sent back to save_table
+	def render(self, params: Tuple[Any, ...], sql: Optional[str] = None) -> str:
+		sql = sql or self.sql
+		if not params:
+			return sql
+		return sql % tuple(render_literal(param) for param in params)
+
+
+def render_literal(value: Any) -> str:
+	if isinstance(value, (int, float)):
+		return str(value)
+	return f"'{MySQLConverter.escape(str(value))}'"
+
+
+# Builds the cache key for a request. Everything that changes the generated SQL is part of the key,
+# constraint values are returned separately since they only end up in the bind parameters.
+def normalize_query_request(query_params: List[QueryParams], options: Dict[str, Any]) -> Tuple[Hashable, List[str]]:
+	tables: List[Tuple[Any, ...]] = []
+	values: List[str] = []
+	for params in query_params:
+		constraints = params.constraints or []
+		tables.append((
+			params.table,
+			tuple((attr.get("attribute", ""), attr.get("alias", "")) for attr in params.attributes),
+			tuple((constraint.get("attribute", ""), constraint.get("operator", "")) for constraint in constraints),
+			tuple(params.group_by or []),
+			tuple((agg.get("attribute", ""), agg.get("type", "")) for agg in params.aggregations or []),
+		))
+		values.extend(constraint.get("value", "") for constraint in constraints)
+
+	order_by = tuple(
+		(order.get("table_name"), order.get("attribute"), order.get("sort"))
+		for order in options.get("order_by") or []
+	)
+	key = (tuple(tables), order_by, options.get("limit"))
+	return key, values
+
+
+# Thread-safe LRU cache of CompiledQuery objects. Entries are only valid for the metadata version they were
+# compiled against, the whole cache is dropped when the join graph changes. Changes to single tables are
+# covered by the table versions compile_query puts in the key, so entries for other tables are kept.
+class QueryCache:
+	def __init__(self, max_size: int) -> None:
+		self.max_size = max_size
+		self._entries: OrderedDict[Hashable, CompiledQuery] = OrderedDict()
+		self._version: Optional[int] = None
+		self._lock = threading.Lock()
+		self.hits: int = 0
+		self.misses: int = 0
+		self.invalidations: int = 0
+
+	def get(self, key: Hashable, version: int) -> Optional[CompiledQuery]:
+		with self._lock:
+			if version != self._version:
+				self._reset(version)
+			compiled = self._entries.get(key)
+			if compiled is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return compiled
+
+	def put(self, key: Hashable, compiled: CompiledQuery, version: int) -> None:
+		with self._lock:
+			if version != self._version:
+				self._reset(version)
+			self._entries[key] = compiled
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_size:
+				self._entries.popitem(last=False)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+			self.invalidations += 1
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			total = self.hits + self.misses
+			return {
+				"size": len(self._entries),
+				"max_size": self.max_size,
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": round(self.hits / total, 4) if total else 0.0,
+				"invalidations": self.invalidations,
+			}
+
+	def _reset(self, version: int) -> None:
+		if self._version is not None:
+			self.invalidations += 1
+		self._entries.clear()
+		self._version = version
@@ -0,0 +1,67 @@
+from .constants import LOGIN_RATE_PER_IP, LOGIN_BURST_PER_IP, LOGIN_RATE_PER_USERNAME, LOGIN_BURST_PER_USERNAME, RATE_LIMIT_MAX_KEYS
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+import math
+import threading
+import time
+
+
+# Thread-safe token buckets, one per key (e.g. a client IP). Every bucket holds up to burst tokens and
+# refills at rate tokens per second, an attempt takes one. Only the max_keys most recently used buckets
+# are kept, a bucket that is dropped would have refilled to full anyway unless it was used very recently.
+class TokenBucketLimiter:
+	def __init__(self, rate: float, burst: int, max_keys: int) -> None:
+		self.rate = rate
+		self.burst = burst
+		self.max_keys = max_keys
+		self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()  # key -> (tokens, updated at)
+		self._lock = threading.Lock()
+		self.allowed: int = 0
+		self.limited: int = 0
+
+	@property
+	def enabled(self) -> bool:
+		return self.rate > 0 and self.burst > 0
+
+	# Takes a token for key, returning (allowed, seconds until a token is available again)
+	def acquire(self, key: str) -> Tuple[bool, float]:
+		if not self.enabled:
+			return True, 0.0
+		with self._lock:
+			tokens = self._refill(key)
+			if tokens < 1:
+				self._buckets[key] = (tokens, time.monotonic())
+				self.limited += 1
+				return False, (1 - tokens) / self.rate
+			self._buckets[key] = (tokens - 1, time.monotonic())
+			self._buckets.move_to_end(key)
+			while len(self._buckets) > self.max_keys:
+				self._buckets.popitem(last=False)
+			self.allowed += 1
+			return True, 0.0
+
+	# Gives back the token of an attempt that should not count (e.g. a successful login)
+	def release(self, key: str) -> None:
+		if not self.enabled:
+			return
+		with self._lock:
+			if key in self._buckets:
+				self._buckets[key] = (min(self._refill(key) + 1, self.burst), time.monotonic())
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			return {"rate": self.rate, "burst": self.burst, "keys": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+	def _refill(self, key: str) -> float:
+		tokens, updated_at = self._buckets.get(key, (self.burst, time.monotonic()))
+		return min(self.burst, tokens + (time.monotonic() - updated_at) * self.rate)
+
+
+def retry_after_header(seconds: float) -> str:
+	return str(max(1, math.ceil(seconds)))
+
+
+# Every login attempt counts against the client's IP, only failed ones against the username, so users
+# logging in often are never limited while guessing at one account quickly is
+login_ip_limiter = TokenBucketLimiter(LOGIN_RATE_PER_IP, LOGIN_BURST_PER_IP, RATE_LIMIT_MAX_KEYS)
+login_username_limiter = TokenBucketLimiter(LOGIN_RATE_PER_USERNAME, LOGIN_BURST_PER_USERNAME, RATE_LIMIT_MAX_KEYS)
@@ -0,0 +1,178 @@
+from .constants import RESULT_CACHE_BACKEND, RESULT_CACHE_TTL, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRY_BYTES
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import hashlib
+import pickle
+import threading
+import time
+
+
+# Storage behind ResultCache. Values are opaque bytes, each tagged with the tables it was read from so
+# everything read from a table can be dropped when that table changes. Anything that can do this
+# (e.g. a local Redis with a set of keys per table) can be plugged in by registering it in RESULT_CACHE_BACKENDS.
+class ResultCacheBackend(ABC):
+	@abstractmethod
+	def get(self, key: str) -> Optional[bytes]:
+		pass
+
+	@abstractmethod
+	def set(self, key: str, value: bytes, tables: List[str], ttl: float) -> None:
+		pass
+
+	# Drops every entry read from any of tables, returning how many were dropped
+	@abstractmethod
+	def invalidate(self, tables: Iterable[str]) -> int:
+		pass
+
+	@abstractmethod
+	def clear(self) -> None:
+		pass
+
+	def stats(self) -> Dict[str, Any]:
+		return {}
+
+
+# Thread-safe LRU bounded by the total size of the cached values rather than the number of entries
+class InProcessResultCacheBackend(ResultCacheBackend):
+	def __init__(self, max_bytes: int) -> None:
+		self.max_bytes = max_bytes
+		self._entries: OrderedDict[str, Tuple[bytes, float, List[str]]] = OrderedDict()  # key -> (value, expires at, tables)
+		self._keys_by_table: Dict[str, Set[str]] = {}
+		self._bytes: int = 0
+		self._lock = threading.Lock()
+		self.evictions: int = 0
+		self.expirations: int = 0
+
+	def get(self, key: str) -> Optional[bytes]:
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return None
+			value, expires_at, _ = entry
+			if time.monotonic() >= expires_at:
+				self._remove(key)
+				self.expirations += 1
+				return None
+			self._entries.move_to_end(key)
+			return value
+
+	def set(self, key: str, value: bytes, tables: List[str], ttl: float) -> None:
+		if len(value) > self.max_bytes:
+			return
+		with self._lock:
+			self._remove(key)
+			self._entries[key] = (value, time.monotonic() + ttl, tables)
+			self._bytes += len(value)
+			for table in tables:
+				self._keys_by_table.setdefault(table, set()).add(key)
+			while self._bytes > self.max_bytes:
+				self._remove(next(iter(self._entries)))
+				self.evictions += 1
+
+	def invalidate(self, tables: Iterable[str]) -> int:
+		with self._lock:
+			keys = set()
+			for table in tables:
+				keys |= self._keys_by_table.get(table, set())
+			for key in keys:
+				self._remove(key)
+			return len(keys)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+			self._keys_by_table.clear()
+			self._bytes = 0
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			return {
+				"entries": len(self._entries),
+				"bytes": self._bytes,
+				"max_bytes": self.max_bytes,
+				"evictions": self.evictions,
+				"expirations": self.expirations,
+			}
+
+	def _remove(self, key: str) -> None:
+		entry = self._entries.pop(key, None)
+		if entry is None:
+			return
+		value, _, tables = entry
+		self._bytes -= len(value)
+		for table in tables:
+			keys = self._keys_by_table.get(table)
+			if keys is not None:
+				keys.discard(key)
+				if not keys:
+					del self._keys_by_table[table]
+
+
+RESULT_CACHE_BACKENDS = {
+	"memory": lambda: InProcessResultCacheBackend(RESULT_CACHE_MAX_BYTES),
+}
+
+
+# Cache of query results keyed by the executed SQL and its bind parameters. Results are pickled (they only
+# ever come from our own database) so the backend can account for and store them as plain bytes.
+class ResultCache:
+	def __init__(self, backend: ResultCacheBackend, ttl: float, max_entry_bytes: int) -> None:
+		self.backend = backend
+		self.ttl = ttl
+		self.max_entry_bytes = max_entry_bytes
+		# Bumped on every invalidation, a result read before an invalidation is not stored after it
+		self.generation: int = 0
+		self.hits: int = 0
+		self.misses: int = 0
+		self.invalidations: int = 0
+		self.skipped: int = 0  # Results not stored because they were too large or possibly stale
+
+	@property
+	def enabled(self) -> bool:
+		return self.ttl > 0
+
+	def key(self, sql: str, params: Tuple[Any, ...], *extra: Hashable) -> str:
+		return hashlib.sha256(repr((sql, params, extra)).encode("utf-8")).hexdigest()
+
+	def get(self, key: str) -> Optional[Any]:
+		value = self.backend.get(key)
+		if value is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return pickle.loads(value)
+
+	def put(self, key: str, result: Any, tables: List[str], generation: int) -> None:
+		value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+		if len(value) > self.max_entry_bytes or generation != self.generation:
+			self.skipped += 1
+			return
+		self.backend.set(key, value, tables, self.ttl)
+
+	def invalidate(self, tables: Iterable[str]) -> None:
+		self.generation += 1
+		self.invalidations += 1
+		self.backend.invalidate(tables)
+
+	def clear(self) -> None:
+		self.generation += 1
+		self.backend.clear()
+
+	def stats(self) -> Dict[str, Any]:
+		total = self.hits + self.misses
+		return {
+			"enabled": self.enabled,
+			"ttl": self.ttl,
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": round(self.hits / total, 4) if total else 0.0,
+			"invalidations": self.invalidations,
+			"skipped": self.skipped,
+			**self.backend.stats(),
+		}
+
+
+if RESULT_CACHE_BACKEND not in RESULT_CACHE_BACKENDS:
+	raise ValueError(f"Unknown result cache backend: {RESULT_CACHE_BACKEND}")
+result_cache = ResultCache(RESULT_CACHE_BACKENDS[RESULT_CACHE_BACKEND](), RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRY_BYTES)
@@ -0,0 +1,117 @@
+from .auth import TokenCache, token_cache, get_token, token_digest, verify_and_decode_token
+from .db import get_cursor, get_async_cursor
+from .constants import ACCESS_TOKEN_EXPIRE_DAYS, REVOCATION_SYNC_INTERVAL
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+import logging
+import threading
+import time
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+
+# Token revocations are shared between the workers through sqlmate.revoked_tokens. A revocation is logged there
+# and applied to this worker's token cache straight away, and every worker polls the log for the ones other
+# workers made (the way Metadata.sync polls schema_changes), dropping the tokens from its cache. The cache keeps
+# the revocations until the tokens would have expired, so a token missing from the cache is checked against
+# the shared list as of the last poll. A row with a digest revokes that token, one without a digest every
+# token of the user issued up to revoked_at.
+class RevocationLog:
+	def __init__(self, cache: TokenCache) -> None:
+		self.cache = cache
+		self.version: int = 0
+		self._lock = threading.Lock()
+		self._stop_sync = threading.Event()
+
+	async def revoke_token(self, digest: str, user_id: Any, exp: float) -> None:
+		await self._record(digest, user_id, time.time(), exp)
+		self.cache.revoke_token(digest, exp)
+
+	async def revoke_user(self, user_id: Any) -> None:
+		revoked_at = time.time()
+		await self._record(None, user_id, revoked_at, revoked_at + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS).total_seconds())
+		self.cache.revoke_user(user_id, revoked_at)
+
+	# Applies every revocation logged since the last sync that has not expired yet, the first sync loads all of them
+	def sync(self) -> int:
+		with self._lock, get_cursor("sqlmate") as cur:
+			cur.execute(
+				"SELECT version, token_digest, user_id, revoked_at, expires_at FROM revoked_tokens WHERE version > %s AND expires_at > %s ORDER BY version",
+				(self.version, time.time())
+			)
+			rows: List[Any] = cur.fetchall()
+			if not rows:
+				return 0
+			for _, digest, user_id, revoked_at, expires_at in rows:
+				if digest is None:
+					self.cache.revoke_user(user_id, revoked_at)
+				else:
+					self.cache.revoke_token(digest, expires_at)
+			self.version = rows[-1][0]
+		logger.debug("Applied %d token revocations, now at version %d", len(rows), self.version)
+		return len(rows)
+
+	# Polls for revocations made by other workers until stop_sync is called
+	def start_sync(self, interval: float = REVOCATION_SYNC_INTERVAL) -> Optional[threading.Thread]:
+		if interval <= 0:
+			return None
+
+		def run() -> None:
+			last_error = ""
+			while True:
+				try:
+					self.sync()
+					last_error = ""
+				except Exception as e:
+					# Logged once rather than every interval (e.g. sqlmate.revoked_tokens missing until `sqlmate init` is re-run)
+					if str(e) != last_error:
+						logger.warning("Failed to sync token revocations: %s", e)
+					last_error = str(e)
+				if self._stop_sync.wait(interval):
+					return
+
+		self._stop_sync.clear()
+		thread = threading.Thread(target=run, name="revocation-sync", daemon=True)
+		thread.start()
+		return thread
+
+	def stop_sync(self) -> None:
+		self._stop_sync.set()
+
+	def stats(self) -> Dict[str, Any]:
+		return {"version": self.version}
+
+	# A revocation that can not be logged still applies to this worker, the others keep accepting the token
+	async def _record(self, digest: Optional[str], user_id: Any, revoked_at: float, expires_at: float) -> None:
+		try:
+			async with get_async_cursor("sqlmate") as cur:
+				await cur.execute(
+					"INSERT INTO revoked_tokens (token_digest, user_id, revoked_at, expires_at) VALUES (%s, %s, %s, %s)",
+					(digest, user_id, revoked_at, expires_at)
+				)
+				# Revocations only matter until the tokens they cover would have expired anyway
+				await cur.execute("DELETE FROM revoked_tokens WHERE expires_at <= %s", (revoked_at,))
+		except mysql.connector.Error as e:
+			logger.warning("Failed to record token revocation, other workers will not see it: %s", e)
+
+
+revocation_log = RevocationLog(token_cache)
+
+
+# Logout: the token is rejected from now on, even though its signature is still valid
+async def revoke_token(authorization: str | None) -> bool:
+	token = get_token(authorization)
+	if not token:
+		return False
+	try:
+		payload = verify_and_decode_token(token)
+	except Exception as _:
+		return False
+	await revocation_log.revoke_token(token_digest(token), payload.get("id"), payload["exp"])
+	return True
+
+
+# Account deletion: every token of the user issued up to now is rejected
+async def revoke_user_tokens(user_id: Any) -> None:
+	await revocation_log.revoke_user(user_id)
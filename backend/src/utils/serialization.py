@@ -1,4 +1,49 @@
 from classes.http import Table
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+from typing import Any, List
+import json
+
+# orjson is optional, it encodes rows several times faster than the standard library
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+# If the query is a single table query, we can remove the table name from the column names
+def clean_column_names(column_names: List[str], num_tables: int) -> List[str]:
+	if num_tables != 1:
+		return column_names
+	return [col_name.split("_", 1)[-1] for col_name in column_names]
+
+# Converts the values MySQL hands back that json can't encode, the same way the pydantic responses do
+def json_default(value: Any) -> Any:
+	if isinstance(value, (datetime, date, time)):
+		return value.isoformat()
+	if isinstance(value, (Decimal, timedelta)):
+		return str(value)
+	if isinstance(value, (bytes, bytearray)):
+		return value.decode("utf-8", errors="replace")
+	if isinstance(value, set):
+		return list(value)
+	raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value: Any) -> bytes:
+	if orjson is not None:
+		return orjson.dumps(value, default=json_default)
+	return json.dumps(value, default=json_default, separators=(",", ":")).encode("utf-8")
+
+# Encodes a chunk of rows as newline-delimited JSON, one array per row
+def rows_to_ndjson(rows: List[Any]) -> bytes:
+	return b"".join([dumps(row) + b"\n" for row in rows])
+
+# JSON response that encodes its content directly instead of validating it against a response model first,
+# used for query results where the rows (the cursor's tuples, as returned) make up nearly all of the body
+class RowsJSONResponse(JSONResponse):
+	def render(self, content: Any) -> bytes:
+		return dumps(content)
+
 
 def query_output_to_table(query_output: list[tuple], column_names: list[str], query_body: str, num_tables: int) -> Table:
 	if not query_output:
@@ -9,28 +54,14 @@ def query_output_to_table(query_output: list[tuple], column_names: list[str], qu
 			rows=[]
 		)
 	
-	# If the query is a single table query, we can remove the table name from the column names
-	if num_tables == 1:
-		cleaned_column_names = []
-		for col_name in column_names:
-			for i in range(len(col_name)):
-				if col_name[i] == "_":
-					cleaned_column_names.append(col_name[i + 1:])
-					break
-			else: # Executed if the for loop is not broken out of (even though it should be)
-				cleaned_column_names.append(col_name)
-		column_names = cleaned_column_names
-
-	# Convert each row to a list
-	rows = [
-		[val for val in row] for row in query_output
-	]
-
-	# This is what the frontend expects to be able to deserialize into the table
+	column_names = clean_column_names(column_names, num_tables)
+
+	# This is what the frontend expects to be able to deserialize into the table,
+	# the row tuples serialize as lists so they are passed through as they are
 	response: Table = Table(
 		query=query_body,
 		created_at=None,  # This can be set to None as we don't have this information in the query output yet
 		columns=column_names,
-		rows=rows
+		rows=query_output
 	)
 	return response
\ No newline at end of file
@@ -0,0 +1,45 @@
+from .db import execute_prepared
+from .metrics import timed
+from contextlib import AsyncExitStack
+from typing import Any, AsyncGenerator, List, Optional, Sequence
+from mysql.connector.aio.abstracts import MySQLCursorAbstract as AsyncMySQLCursorAbstract
+
+
+# A prepared statement whose result is read after the route handler has returned (streaming responses).
+# The pooled connection stays checked out until close is called.
+class OpenResult:
+	def __init__(self, stack: AsyncExitStack, cursor: AsyncMySQLCursorAbstract) -> None:
+		self.stack = stack
+		self.cursor = cursor
+		self.row_count: int = 0
+
+	@property
+	def column_names(self) -> List[str]:
+		return [i[0] for i in self.cursor.description or []]
+
+	async def chunks(self, size: int) -> AsyncGenerator[List[Any], None]:
+		while True:
+			with timed("fetch"):
+				rows = await self.cursor.fetchmany(size)
+			if not rows:
+				return
+			self.row_count += len(rows)
+			yield rows
+
+	# Passing the error that interrupted the stream (client disconnect, failed fetch) gives the connection
+	# back without reading the rest of the result
+	async def close(self, error: Optional[BaseException] = None) -> None:
+		if error is None:
+			await self.stack.aclose()
+		else:
+			await self.stack.__aexit__(type(error), error, error.__traceback__)
+
+
+async def open_result(sql: str, params: Sequence[Any], whose: str = "user", timeout: Optional[float] = None) -> OpenResult:
+	stack = AsyncExitStack()
+	try:
+		cursor = await stack.enter_async_context(execute_prepared(sql, params, whose, timeout))
+	except BaseException as e:
+		await stack.aclose()
+		raise e
+	return OpenResult(stack, cursor)
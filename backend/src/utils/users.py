@@ -0,0 +1,167 @@
+from .db import get_async_cursor
+from .constants import USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_NEGATIVE_TTL
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+
+
+# A row of sqlmate.users
+class UserRecord:
+	def __init__(self, id: Any, username: str, password: str, email: str) -> None:
+		self.id = id
+		self.username = username
+		self.password = password  # bcrypt hash
+		self.email = email
+
+
+# Usernames compare case-insensitively in MySQL's default collation, so cache keys must as well
+def username_key(username: str) -> str:
+	return username.casefold()
+
+
+# Thread-safe LRU of user records by username, with an index by id for /auth/me. Usernames that don't
+# exist are cached too (as None), so repeated attempts against made-up accounts skip the DB as well.
+# Entries expire after ttl seconds, which bounds how long another worker can serve a record this one
+# has already invalidated, and usernames that don't exist after the much shorter negative_ttl, so an
+# account registered through another worker can log in everywhere almost right away.
+# Registration, deletion and any change to a user must call invalidate.
+#
+# A record read from the DB is cached with the generation from before the read, and dropped if its username
+# was invalidated since then, so a read racing with e.g. a registration can't cache what it read before.
+class UserCache:
+	def __init__(self, max_size: int, ttl: float, negative_ttl: float = 0) -> None:
+		self.max_size = max_size
+		self.ttl = ttl
+		self.negative_ttl = negative_ttl
+		self._entries: OrderedDict[str, Tuple[Optional[UserRecord], float]] = OrderedDict()  # username key -> (record, expires at)
+		self._keys_by_id: Dict[Any, str] = {}
+		self._generation: int = 0
+		self._invalidated: OrderedDict[str, int] = OrderedDict()  # username key -> generation it was last invalidated at
+		self._invalidated_floor: int = 0  # Every key counts as invalidated at this generation (clear, forgotten keys)
+		self._lock = threading.Lock()
+		self.hits: int = 0
+		self.misses: int = 0
+		self.invalidations: int = 0
+		self.stale_puts: int = 0
+
+	@property
+	def enabled(self) -> bool:
+		return self.max_size > 0 and self.ttl > 0
+
+	# Returns (found in the cache, record), the record is None for a username known not to exist
+	def get(self, username: str) -> Tuple[bool, Optional[UserRecord]]:
+		with self._lock:
+			return self._get(username_key(username))
+
+	def get_by_id(self, user_id: Any) -> Optional[UserRecord]:
+		with self._lock:
+			key = self._keys_by_id.get(user_id)
+			if key is None:
+				self.misses += 1
+				return None
+			return self._get(key)[1]
+
+	# To pass to put, taken before reading the record from the DB
+	def generation(self) -> int:
+		with self._lock:
+			return self._generation
+
+	def put(self, username: str, record: Optional[UserRecord], generation: int) -> None:
+		ttl = self.ttl if record is not None else self.negative_ttl
+		if not self.enabled or ttl <= 0:
+			return
+		with self._lock:
+			key = username_key(username)
+			if generation < max(self._invalidated_floor, self._invalidated.get(key, 0)):
+				self.stale_puts += 1
+				return
+			self._remove(key)
+			self._entries[key] = (record, time.monotonic() + ttl)
+			if record is not None:
+				self._keys_by_id[record.id] = key
+			while len(self._entries) > self.max_size:
+				self._remove(next(iter(self._entries)))
+
+	def invalidate(self, username: str) -> None:
+		with self._lock:
+			key = username_key(username)
+			self._remove(key)
+			self._generation += 1
+			self._invalidated[key] = self._generation
+			self._invalidated.move_to_end(key)
+			while len(self._invalidated) > max(self.max_size, 1):
+				_, generation = self._invalidated.popitem(last=False)
+				self._invalidated_floor = max(self._invalidated_floor, generation)
+			self.invalidations += 1
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+			self._keys_by_id.clear()
+			self._generation += 1
+			self._invalidated.clear()
+			self._invalidated_floor = self._generation
+			self.invalidations += 1
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			total = self.hits + self.misses
+			return {
+				"size": len(self._entries),
+				"max_size": self.max_size,
+				"ttl": self.ttl,
+				"negative_ttl": self.negative_ttl,
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": round(self.hits / total, 4) if total else 0.0,
+				"invalidations": self.invalidations,
+				"stale_puts": self.stale_puts,
+			}
+
+	def _get(self, key: str) -> Tuple[bool, Optional[UserRecord]]:
+		entry = self._entries.get(key)
+		if entry is None or time.monotonic() >= entry[1]:
+			if entry is not None:
+				self._remove(key)
+			self.misses += 1
+			return False, None
+		self._entries.move_to_end(key)
+		self.hits += 1
+		return True, entry[0]
+
+	def _remove(self, key: str) -> None:
+		entry = self._entries.pop(key, None)
+		if entry is not None and entry[0] is not None:
+			self._keys_by_id.pop(entry[0].id, None)
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_NEGATIVE_TTL)
+
+
+async def find_user(username: str) -> Optional[UserRecord]:
+	found, record = user_cache.get(username)
+	if found:
+		return record
+	generation = user_cache.generation()
+	async with get_async_cursor("sqlmate") as cur:
+		await cur.execute("SELECT id, username, password, email FROM users WHERE username = %s", (username,))
+		row: Any = await cur.fetchone()
+	record = UserRecord(*row) if row else None
+	user_cache.put(username, record, generation)
+	return record
+
+
+async def find_user_by_id(user_id: Any) -> Optional[UserRecord]:
+	record = user_cache.get_by_id(user_id)
+	if record is not None:
+		return record
+	generation = user_cache.generation()
+	async with get_async_cursor("sqlmate") as cur:
+		await cur.execute("SELECT id, username, password, email FROM users WHERE id = %s", (user_id,))
+		row: Any = await cur.fetchone()
+	if not row:
+		return None
+	record = UserRecord(*row)
+	user_cache.put(record.username, record, generation)
+	return record
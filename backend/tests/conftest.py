@@ -0,0 +1,53 @@
+# Unit tests for the parts of the backend that need no database. Modules are imported from src/ the same way
+# the server imports them.
+#
+# Usage (from backend/):
+#   pip install -r requirements.txt -r tests/requirements.txt
+#   pytest tests
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# Tokens can only be issued with a secret, any will do here
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+from classes.metadata import Metadata, metadata
+
+# A small schema for the query builder: track_artist links tracks and artists, tracks belong to albums and
+# albums to labels. release has no foreign keys, so nothing can be joined to it.
+COLUMNS = {
+    "track": [("id", "int"), ("name", "varchar"), ("popularity", "int"), ("album_id", "int")],
+    "artist": [("id", "int"), ("name", "varchar")],
+    "track_artist": [("track_id", "int"), ("artist_id", "int")],
+    "album": [("id", "int"), ("name", "varchar"), ("label_id", "int")],
+    "label": [("id", "int"), ("name", "varchar")],
+    "release": [("id", "int"), ("name", "varchar")],
+}
+FOREIGN_KEYS = [
+    ("track_artist", "track_id", "track", "id"),
+    ("track_artist", "artist_id", "artist", "id"),
+    ("track", "album_id", "album", "id"),
+    ("album", "label_id", "label", "id"),
+]
+
+
+# Loads the schema into the module-level metadata the query builder reads from, without a database
+@pytest.fixture
+def loaded_metadata(monkeypatch) -> Metadata:
+    from utils.generators import query_cache
+
+    loaded = Metadata()
+    for table, columns in COLUMNS.items():
+        for column, data_type in columns:
+            loaded.col_types[table].add(column, data_type)
+    loaded.add_foreign_keys(FOREIGN_KEYS)
+    loaded.primary_keys = {table: ["id"] for table in COLUMNS if table != "track_artist"}
+    loaded.build_paths()
+    metadata.replace(loaded)
+    metadata.loaded.set()
+    monkeypatch.setattr(metadata, "table_versions", {})
+    query_cache.clear()
+    return metadata
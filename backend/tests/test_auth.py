@@ -0,0 +1,116 @@
+import contextlib
+import time
+
+import pytest
+
+from utils import revocations
+from utils.auth import TokenCache, create_access_token, check_user, token_cache, token_digest
+from utils.revocations import RevocationLog
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+def test_admitted_tokens_are_served_until_they_expire():
+    cache = TokenCache(10)
+    now = time.time()
+    assert cache.get("live") is None
+    assert cache.admit("live", 1, "alice", now, now + 60)
+    assert cache.admit("expired", 1, "alice", now - 120, now - 60)
+    assert cache.get("live") == (1, "alice")
+    assert cache.get("expired") is None
+    assert cache.stats()["size"] == 1
+
+
+def test_least_recently_used_tokens_are_evicted():
+    cache = TokenCache(2)
+    exp = time.time() + 60
+    for digest in ("a", "b"):
+        cache.admit(digest, 1, "alice", 0, exp)
+    cache.get("a")
+    cache.admit("c", 1, "alice", 0, exp)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_revoked_token_is_dropped_and_not_admitted_again():
+    cache = TokenCache(10)
+    now = time.time()
+    cache.admit("token", 1, "alice", now, now + 60)
+    cache.revoke_token("token", now + 60)
+    assert cache.get("token") is None
+    assert not cache.admit("token", 1, "alice", now, now + 60)
+    assert cache.stats()["rejections"] == 1
+
+
+def test_revoking_a_user_rejects_only_tokens_issued_before():
+    cache = TokenCache(10)
+    now = time.time()
+    cache.admit("old", 1, "alice", now - 10, now + 60)
+    cache.admit("other user", 2, "bob", now - 10, now + 60)
+    cache.revoke_user(1, now)
+    assert cache.get("old") is None
+    assert cache.get("other user") == (2, "bob")
+    assert not cache.admit("old", 1, "alice", now - 10, now + 60)
+    assert cache.admit("new", 1, "alice", now + 1, now + 60)
+
+
+def test_expired_revocations_are_pruned():
+    cache = TokenCache(10)
+    cache.revoke_token("expired", time.time() - 1)
+    cache.revoke_token("live", time.time() + 60)
+    assert cache.stats()["revoked_tokens"] == 1
+
+
+def test_check_user_caches_and_honours_revocation():
+    token = create_access_token({"id": 7, "username": "carol"})
+    authorization = f"Bearer {token}"
+    assert check_user(authorization) == (7, "carol", "")
+    assert token_cache.get(token_digest(token)) == (7, "carol")
+
+    token_cache.revoke_token(token_digest(token), time.time() + 60)
+    assert check_user(authorization) == ("", "", "Token has been revoked")
+    assert check_user("Bearer not-a-jwt")[2] == "Invalid token"
+    assert check_user(token)[2] == "Invalid token format"
+
+
+# Stands in for sqlmate.revoked_tokens
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, operation, params):
+        version, now = params
+        self.result = [row for row in self.rows if row[0] > version and row[4] > now]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_sync_applies_revocations_made_by_other_workers(monkeypatch):
+    now = time.time()
+    rows = [
+        (1, "logged out", 1, now - 5, now + 60),
+        (2, None, 2, now - 5, now + 60),  # Deleted user
+        (3, "already expired", 3, now - 120, now - 60),
+    ]
+    monkeypatch.setattr(revocations, "get_cursor", lambda whose: contextlib.nullcontext(FakeCursor(rows)))
+    cache = TokenCache(10)
+    cache.admit("logged out", 1, "alice", now - 10, now + 60)
+    cache.admit("bob's", 2, "bob", now - 10, now + 60)
+    log = RevocationLog(cache)
+
+    assert log.sync() == 2
+    assert log.version == 2
+    assert cache.get("logged out") is None
+    assert cache.get("bob's") is None
+    assert not cache.admit("bob's", 2, "bob", now - 10, now + 60)
+
+    rows.append((4, "later", 1, now, now + 60))
+    assert log.sync() == 1
+    assert log.version == 4
+    assert log.sync() == 0
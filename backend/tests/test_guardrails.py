@@ -0,0 +1,52 @@
+import pytest
+
+from utils.guardrails import parse_explain
+
+
+def table(name, examined, produced):
+    return {"table": {"table_name": name, "rows_examined_per_scan": examined, "rows_produced_per_join": produced}}
+
+
+def test_single_table():
+    plan = {"query_block": {"cost_info": {"query_cost": "1021.50"}, "table": {"table_name": "t", "rows_examined_per_scan": 10000, "rows_produced_per_join": 1000}}}
+    estimate = parse_explain(plan)
+    assert estimate.rows_examined == 10000
+    assert estimate.cost == pytest.approx(1021.5)
+
+
+# Each table of a nested loop is scanned once per row produced by the join before it
+def test_nested_loop_weights_inner_tables():
+    plan = {"query_block": {"cost_info": {"query_cost": "5000"}, "nested_loop": [
+        table("a", 100, 50),
+        table("b", 10, 500),
+        table("c", 2, 1000),
+    ]}}
+    assert parse_explain(plan).rows_examined == 100 + 50 * 10 + 500 * 2
+
+
+def test_nested_loop_under_grouping_and_ordering():
+    plan = {"query_block": {"cost_info": {"query_cost": "10"}, "ordering_operation": {"grouping_operation": {"nested_loop": [
+        table("a", 1000, 1000),
+        table("b", 1, 1000),
+    ]}}}}
+    assert parse_explain(plan).rows_examined == 1000 + 1000 * 1
+
+
+def test_derived_table_inside_nested_loop():
+    derived = table("page", 20, 20)
+    derived["table"]["materialized_from_subquery"] = {"query_block": {"nested_loop": [table("a", 100, 100), table("b", 3, 300)]}}
+    plan = {"query_block": {"nested_loop": [derived, table("c", 5, 100)]}}
+    # The subquery is materialized once, the outer join scans c once per row of page
+    assert parse_explain(plan).rows_examined == (20 + 100 + 100 * 3) + 20 * 5
+
+
+def test_union_sums_every_branch():
+    plan = {"query_block": {"union_result": {"query_specifications": [
+        {"query_block": {"table": {"table_name": "a", "rows_examined_per_scan": 7}}},
+        {"query_block": {"nested_loop": [table("b", 4, 4), table("c", 2, 8)]}},
+    ]}}}
+    assert parse_explain(plan).rows_examined == 7 + 4 + 4 * 2
+
+
+def test_missing_cost_info():
+    assert parse_explain({"query_block": {"message": "No tables used"}}).cost == 0
@@ -0,0 +1,75 @@
+import pytest
+
+
+def joins(edges):
+    return [str(edge) for edge in edges]
+
+
+@pytest.mark.parametrize("source, destination, expected", [
+    ("track", "track", []),
+    ("track", "album", ["track.album_id=album.id"]),
+    ("artist", "label", [
+        "artist.id=track_artist.artist_id",
+        "track_artist.track_id=track.id",
+        "track.album_id=album.id",
+        "album.label_id=label.id",
+    ]),
+    ("label", "artist", [
+        "label.id=album.label_id",
+        "album.id=track.album_id",
+        "track.id=track_artist.track_id",
+        "track_artist.artist_id=artist.id",
+    ]),
+])
+def test_get_path(loaded_metadata, source, destination, expected):
+    assert joins(loaded_metadata.get_path(source, destination)) == expected
+
+
+@pytest.mark.parametrize("tables, expected", [
+    (["track"], []),
+    # artist and album both hang off track, which is joined once and shared instead of reached twice from artist
+    (["artist", "album", "track"], [
+        "artist.id=track_artist.artist_id",
+        "track_artist.track_id=track.id",
+        "track.album_id=album.id",
+    ]),
+    # The intermediate tables are joined even though they weren't asked for
+    (["label", "artist"], [
+        "label.id=album.label_id",
+        "album.id=track.album_id",
+        "track.id=track_artist.track_id",
+        "track_artist.artist_id=artist.id",
+    ]),
+    # A table on the path to another requested table isn't joined again
+    (["artist", "label", "album"], [
+        "artist.id=track_artist.artist_id",
+        "track_artist.track_id=track.id",
+        "track.album_id=album.id",
+        "album.label_id=label.id",
+    ]),
+    # Repeated tables are only joined once, and never to the FROM table
+    (["track", "album", "track", "album"], ["track.album_id=album.id"]),
+    (["track", "track"], []),
+])
+def test_plan_joins(loaded_metadata, tables, expected):
+    edges = loaded_metadata.plan_joins(tables)
+    assert joins(edges) == expected
+    assert len({edge.destination for edge in edges}) == len(edges)
+    assert tables[0] not in {edge.destination for edge in edges}
+
+
+@pytest.mark.parametrize("tables", [
+    ["track", "release"],
+    ["release", "track"],
+    ["artist", "album", "release"],
+])
+def test_plan_joins_unreachable_table(loaded_metadata, tables):
+    with pytest.raises(ValueError, match="No path found"):
+        loaded_metadata.plan_joins(tables)
+
+
+def test_get_path_unreachable_table(loaded_metadata):
+    with pytest.raises(ValueError):
+        loaded_metadata.get_path("track", "release")
+    with pytest.raises(ValueError):
+        loaded_metadata.get_path("release", "track")
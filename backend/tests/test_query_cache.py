@@ -0,0 +1,86 @@
+import pytest
+
+from classes.http import QueryParams
+from utils.generators import compile_query, query_cache
+
+OPTIONS = {"order_by": [{"table_name": "track", "attribute": "name", "sort": "DESC"}], "limit": "10"}
+
+
+def make_request(popularity=(">", "50"), artist=("PREFIX", "Ab"), alias=""):
+    return [
+        QueryParams(table="track", attributes=[{"attribute": "name", "alias": alias}],
+                    constraints=[{"attribute": "popularity", "operator": popularity[0], "value": popularity[1]}], group_by=[], aggregations=[]),
+        QueryParams(table="artist", attributes=[{"attribute": "name"}],
+                    constraints=[{"attribute": "name", "operator": artist[0], "value": artist[1]}], group_by=[], aggregations=[]),
+    ]
+
+
+def test_compiled_sql(loaded_metadata):
+    compiled, params = compile_query(make_request(), OPTIONS)
+    assert compiled.sql == (
+        "SELECT track.name AS `track_name`,artist.name AS `artist_name`\n"
+        "FROM track\n"
+        "JOIN track_artist ON track.id=track_artist.track_id JOIN artist ON track_artist.artist_id=artist.id\n"
+        "WHERE track.popularity > %s AND artist.name LIKE %s\n"
+        "ORDER BY `track_name` DESC\n"
+        "LIMIT 10\n"
+    )
+    assert params == (50, "Ab%")
+    assert compiled.tables == ["track", "artist", "track_artist"]
+
+
+# Only the constraint values differ, so the cached query is reused with the new values bound in placeholder order
+@pytest.mark.parametrize("popularity, artist, expected", [
+    ((">", "50"), ("PREFIX", "Ab"), (50, "Ab%")),
+    ((">", "75"), ("PREFIX", "Zz"), (75, "Zz%")),
+    ((">", "0"), ("PREFIX", "50% off_"), (0, "50\\% off\\_%")),
+])
+def test_same_shape_is_reused(loaded_metadata, popularity, artist, expected):
+    first, _ = compile_query(make_request(), OPTIONS)
+    hits = query_cache.stats()["hits"]
+    compiled, params = compile_query(make_request(popularity, artist), OPTIONS)
+    assert compiled is first
+    assert params == expected
+    assert query_cache.stats()["hits"] == hits + 1
+
+
+@pytest.mark.parametrize("changed", [
+    make_request(popularity=("<", "50")),
+    make_request(artist=("SUFFIX", "Ab")),
+    make_request(alias="title"),
+])
+def test_different_shape_is_compiled_again(loaded_metadata, changed):
+    first, _ = compile_query(make_request(), OPTIONS)
+    misses = query_cache.stats()["misses"]
+    compiled, _ = compile_query(changed, OPTIONS)
+    assert compiled is not first
+    assert query_cache.stats()["misses"] == misses + 1
+
+
+def test_different_options_are_compiled_again(loaded_metadata):
+    first, _ = compile_query(make_request(), OPTIONS)
+    compiled, _ = compile_query(make_request(), {**OPTIONS, "limit": "20"})
+    assert compiled is not first
+    assert compiled.sql.endswith("LIMIT 20\n")
+
+
+# A change to one of the tables a query selects from recompiles it, changes to other tables don't
+def test_table_changes(loaded_metadata):
+    first, _ = compile_query(make_request(), OPTIONS)
+    loaded_metadata.table_versions["album"] = 1
+    assert compile_query(make_request(), OPTIONS)[0] is first
+    loaded_metadata.table_versions["artist"] = 1
+    assert compile_query(make_request(), OPTIONS)[0] is not first
+
+
+@pytest.mark.parametrize("request_params, options", [
+    (make_request(popularity=("LIKE", "50")), OPTIONS),
+    (make_request(popularity=(">", "fifty")), OPTIONS),
+    (make_request(alias="50%"), OPTIONS),
+    ([QueryParams(table="track; --", attributes=[{"attribute": "name"}], constraints=[], group_by=[], aggregations=[])], {}),
+    (make_request(), {"order_by": [{"table_name": "track", "attribute": "name", "sort": "DESC, 1"}]}),
+    (make_request(), {"order_by": [{"table_name": "track", "attribute": "missing", "sort": "ASC"}]}),
+])
+def test_invalid_requests(loaded_metadata, request_params, options):
+    with pytest.raises(ValueError):
+        compile_query(request_params, options)
@@ -0,0 +1,82 @@
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import TokenBucketLimiter, retry_after_header
+
+
+# Drives the limiter's clock by hand
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_then_limited(clock):
+    limiter = TokenBucketLimiter(rate=0.5, burst=3, max_keys=10)
+    assert [limiter.acquire("ip")[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.acquire("ip")
+    assert not allowed
+    assert retry_after == pytest.approx(2.0)
+    # Other keys have buckets of their own
+    assert limiter.acquire("other ip")[0]
+
+
+def test_refills_at_rate_up_to_burst(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=2, max_keys=10)
+    limiter.acquire("ip")
+    limiter.acquire("ip")
+    clock.now += 0.5
+    allowed, retry_after = limiter.acquire("ip")
+    assert not allowed and retry_after == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.acquire("ip")[0]
+    # A long pause refills to burst and no further
+    clock.now += 100
+    assert [limiter.acquire("ip")[0] for _ in range(3)] == [True, True, False]
+
+
+def test_release_gives_the_token_back(clock):
+    limiter = TokenBucketLimiter(rate=0.1, burst=2, max_keys=10)
+    for _ in range(5):
+        assert limiter.acquire("alice")[0]
+        limiter.release("alice")
+    limiter.acquire("alice")
+    limiter.acquire("alice")
+    assert not limiter.acquire("alice")[0]
+    # Releasing never overfills the bucket, or a key nobody has used
+    limiter.release("alice")
+    limiter.release("alice")
+    limiter.release("alice")
+    assert [limiter.acquire("alice")[0] for _ in range(3)] == [True, True, False]
+    limiter.release("nobody")
+    assert limiter.stats()["keys"] == 1
+
+
+def test_only_the_most_recent_keys_are_kept(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key)
+    assert limiter.stats()["keys"] == 2
+    # "a" was dropped with its bucket and starts full again
+    assert limiter.acquire("a")[0]
+    assert not limiter.acquire("c")[0]
+
+
+def test_disabled_limiter_allows_everything():
+    limiter = TokenBucketLimiter(rate=0, burst=5, max_keys=10)
+    assert all(limiter.acquire("ip")[0] for _ in range(100))
+    assert limiter.stats()["limited"] == 0
+
+
+def test_retry_after_header_rounds_up():
+    assert retry_after_header(0.01) == "1"
+    assert retry_after_header(2.1) == "3"
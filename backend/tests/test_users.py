@@ -0,0 +1,62 @@
+from utils import users
+from utils.users import UserCache, UserRecord
+
+
+def record(id, username):
+    return UserRecord(id, username, "hash", f"{username}@example.com")
+
+
+def test_lookup_by_username_and_id():
+    cache = UserCache(10, 60, 5)
+    cache.put("Alice", record(1, "Alice"), cache.generation())
+    assert cache.get("alice")[1].id == 1  # Usernames compare case-insensitively
+    assert cache.get_by_id(1).username == "Alice"
+    cache.invalidate("ALICE")
+    assert cache.get("alice") == (False, None)
+    assert cache.get_by_id(1) is None
+
+
+def test_unknown_usernames_expire_sooner(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(users.time, "monotonic", lambda: now[0])
+    cache = UserCache(10, 60, 5)
+    cache.put("ghost", None, cache.generation())
+    cache.put("alice", record(1, "alice"), cache.generation())
+    assert cache.get("ghost") == (True, None)
+    now[0] += 6
+    assert cache.get("ghost") == (False, None)
+    assert cache.get("alice")[0]
+
+    no_negative = UserCache(10, 60, 0)
+    no_negative.put("ghost", None, no_negative.generation())
+    assert no_negative.get("ghost") == (False, None)
+
+
+# A read that started before an invalidation must not cache what it read
+def test_put_after_concurrent_invalidation_is_dropped():
+    cache = UserCache(10, 60, 5)
+    generation = cache.generation()
+    cache.invalidate("bob")  # e.g. bob registers while the read is in flight
+    cache.put("bob", None, generation)
+    assert cache.get("bob") == (False, None)
+    assert cache.stats()["stale_puts"] == 1
+
+    # Invalidating someone else doesn't matter
+    generation = cache.generation()
+    cache.invalidate("carol")
+    cache.put("bob", record(2, "bob"), generation)
+    assert cache.get("bob")[0]
+
+
+def test_put_is_dropped_conservatively_once_invalidations_are_forgotten():
+    cache = UserCache(1, 60, 5)
+    generation = cache.generation()
+    cache.invalidate("a")
+    cache.invalidate("b")  # Forgets when "a" was invalidated
+    cache.put("a", record(1, "a"), generation)
+    assert cache.get("a") == (False, None)
+
+    generation = cache.generation()
+    cache.clear()
+    cache.put("b", record(2, "b"), generation)
+    assert cache.get("b") == (False, None)
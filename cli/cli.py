@@ -1,8 +1,9 @@
 import argparse
 import os
 import subprocess
+import sys
 
-from .setup.env_setup import generate_defaults, prompt_for_credentials, create_env_file, load_config, DOCKER_COMPOSE_FILE
+from .setup.env_setup import generate_defaults, prompt_for_credentials, create_env_file, load_config, DOCKER_COMPOSE_FILE, BACKEND_SRC_DIR
 from .setup.db_setup import initialize_database, connect_with_retry
 
 def init():
@@ -84,6 +85,35 @@ def run():
     
     subprocess.run(["docker", "compose", "-f", str(DOCKER_COMPOSE_FILE), "up", "--build"], check=True)
 
+def serve(workers=None, host=None, port=None):
+    # Check if 'sqlmate init' has been run (i.e., if the env file exists)
+    env_file_path = os.path.join(
+        os.path.expanduser('~'),
+        '.sqlmate',
+        'secrets.env'
+    )
+    if not os.path.exists(env_file_path):
+        print("❌ Configuration file not found. Please run `sqlmate init` first.")
+        return
+
+    serve_script = BACKEND_SRC_DIR / "serve.py"
+    if not serve_script.exists():
+        print(f"❌ Backend not found at {BACKEND_SRC_DIR}. `sqlmate serve` has to be run from a checkout of the repository.")
+        return
+
+    print("🚀 Starting the SQLMate API...")
+    args = [sys.executable, str(serve_script)]
+    if workers is not None:
+        args += ["--workers", str(workers)]
+    if host is not None:
+        args += ["--host", host]
+    if port is not None:
+        args += ["--port", str(port)]
+
+    # Replace this process with the launcher, so signals (SIGHUP for a rolling restart, SIGTERM) reach it directly
+    os.chdir(BACKEND_SRC_DIR)
+    os.execv(sys.executable, args)
+
 def main():
     parser = argparse.ArgumentParser(prog="sqlmate")
     subparsers = parser.add_subparsers(dest="command")
@@ -91,6 +121,10 @@ def main():
     subparsers.add_parser("init", help="Initialize the project")
     subparsers.add_parser("run", help="Run the Docker app")
     subparsers.add_parser("cleanup", help="Cleanup SQLMate project (removes procedures, triggers and database)")
+    serve_parser = subparsers.add_parser("serve", help="Run the API with multiple worker processes (without Docker)")
+    serve_parser.add_argument("--workers", type=int, help="Number of worker processes (default: number of CPUs)")
+    serve_parser.add_argument("--host", help="Address to listen on (default: 0.0.0.0)")
+    serve_parser.add_argument("--port", type=int, help="Port to listen on (default: 8080)")
 
     args = parser.parse_args()
     if args.command == "init":
@@ -99,5 +133,7 @@ def main():
         run()
     elif args.command == "cleanup":
         cleanup()
+    elif args.command == "serve":
+        serve(args.workers, args.host, args.port)
     else:
         parser.print_help()
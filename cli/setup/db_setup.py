@@ -10,7 +10,9 @@ from .sql.database import (
 from .sql.tables import (
     CREATE_USERS_TABLE,
     CREATE_USER_TABLES_TABLE,
-    CREATE_TABLES_TO_DROP_TABLE
+    CREATE_TABLES_TO_DROP_TABLE,
+    CREATE_SCHEMA_CHANGES_TABLE,
+    CREATE_REVOKED_TOKENS_TABLE
 )
 from .sql.triggers import (
     CREATE_BEFORE_DELETE_ON_USER_TABLES_TRIG
@@ -125,7 +127,9 @@ def create_tables(connection: MySQLConnectionAbstract | PooledMySQLConnection) -
         queries = [
             CREATE_USERS_TABLE,
             CREATE_USER_TABLES_TABLE,
-            CREATE_TABLES_TO_DROP_TABLE
+            CREATE_TABLES_TO_DROP_TABLE,
+            CREATE_SCHEMA_CHANGES_TABLE,
+            CREATE_REVOKED_TOKENS_TABLE
         ]
         
         for table_query in queries:
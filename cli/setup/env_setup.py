@@ -7,6 +7,7 @@ import os
 
 TEMPLATE_DIR = Path(__file__).parent / "templates"
 DOCKER_COMPOSE_FILE = files("cli.docker") / "docker-compose.yaml"
+BACKEND_SRC_DIR = Path(__file__).resolve().parent.parent.parent / "backend" / "src"
 SECRETS_FILE = os.path.join(os.path.expanduser("~"), ".sqlmate", "secrets.env")
 
 def generate_defaults() -> dict:
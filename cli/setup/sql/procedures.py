@@ -18,8 +18,8 @@ BEGIN
 
 	-- Prevent SQL injection
 	IF full_table_name REGEXP '^[a-zA-Z0-9_.]+$' THEN
-		-- Dynamically prepare the CREATE TABLE query
-		SET @create_sql = CONCAT('CREATE TABLE ', full_table_name, ' AS ', p_query);
+		-- Dynamically prepare the CREATE TABLE query, the invisible row id is what the backend pages the table by
+		SET @create_sql = CONCAT('CREATE TABLE ', full_table_name, ' (sqlmate_row_id BIGINT UNSIGNED NOT NULL INVISIBLE AUTO_INCREMENT PRIMARY KEY) AS ', p_query);
 		PREPARE stmt FROM @create_sql;
 		EXECUTE stmt;
 		DEALLOCATE PREPARE stmt;
@@ -25,4 +25,23 @@ CREATE TABLE IF NOT EXISTS sqlmate.tables_to_drop (
 	created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 	PRIMARY KEY (user_id, table_name)
 );
-"""
\ No newline at end of file
+"""
+
+CREATE_SCHEMA_CHANGES_TABLE = """
+CREATE TABLE IF NOT EXISTS sqlmate.schema_changes (
+	version BIGINT AUTO_INCREMENT PRIMARY KEY,
+	table_name VARCHAR(150) NOT NULL,
+	change_type VARCHAR(10) NOT NULL,
+	created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+CREATE_REVOKED_TOKENS_TABLE = """
+CREATE TABLE IF NOT EXISTS sqlmate.revoked_tokens (
+	version BIGINT AUTO_INCREMENT PRIMARY KEY,
+	token_digest CHAR(64),
+	user_id INT,
+	revoked_at DOUBLE NOT NULL,
+	expires_at DOUBLE NOT NULL,
+	INDEX (expires_at)
+);
+"""
@@ -83,6 +83,8 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   };
 
   const logout = () => {
+    // Revoke the token server side, the local session ends either way
+    authService.logout().catch(() => {});
     localStorage.removeItem("token");
     setToken(null);
     setUser(null);
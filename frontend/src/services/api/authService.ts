@@ -31,6 +31,10 @@ interface DeleteUserResponse {
   details: StatusResponse;
 }
 
+interface LogoutResponse {
+  details: StatusResponse;
+}
+
 export class AuthApiService extends BaseApiClient {
   constructor() {
     super();
@@ -71,6 +75,16 @@ export class AuthApiService extends BaseApiClient {
     return await this.get<UserInfoResponse>("/auth/me");
   }
 
+  /**
+   * Log out, revoking the current auth token
+   */
+  async logout(): Promise<LogoutResponse> {
+    return await this.post<Record<string, never>, LogoutResponse>(
+      "/auth/logout",
+      {}
+    );
+  }
+
   /**
    * Delete user account
    */